@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib import admin
 from django.db.models.aggregates import Count, Max
+from django.utils import timezone
 
 from oc_website.models import (
     AniDBEntry,
@@ -15,17 +16,29 @@ from oc_website.models import (
     ProjectRelease,
     ProjectReleaseFile,
     ProjectReleaseLink,
+    PublishAttempt,
 )
+from oc_website.page_cache import invalidate_model
+from oc_website.tasks.releases import (
+    get_build_progress,
+    unschedule_release_publications,
+)
+from oc_website.taxonomies import AniDBFetchStatus, PublishAttemptState
 
 
 @admin.action(description="Mark selected objects as visible")
 def make_visible(_modeladmin, _request, queryset):
     queryset.update(is_visible=True)
+    # update() sends no signals
+    invalidate_model(queryset.model)
+    if queryset.model is ProjectRelease:
+        unschedule_release_publications(queryset)
 
 
 @admin.action(description="Mark selected objects as invisible")
 def make_invisible(_modeladmin, _request, queryset):
     queryset.update(is_visible=False)
+    invalidate_model(queryset.model)  # update() sends no signals
 
 
 @admin.register(Language)
@@ -54,6 +67,7 @@ class ProjectAdmin(admin.ModelAdmin):
 class ProjectReleaseFileInline(admin.TabularInline):
     model = ProjectReleaseFile
     extra = 0
+    readonly_fields = ["size", "crc32", "ed2k", "duration", "pieces_root"]
 
 
 class ProjectReleaseLinkInline(admin.TabularInline):
@@ -61,11 +75,19 @@ class ProjectReleaseLinkInline(admin.TabularInline):
     extra = 0
 
 
+class PublishAttemptInline(admin.TabularInline):
+    model = PublishAttempt
+    extra = 0
+    fields = ["publisher", "state", "attempts", "next_retry_at", "last_error"]
+    readonly_fields = fields
+
+
 @admin.register(ProjectRelease)
 class ProjectReleaseAdmin(admin.ModelAdmin):
     inlines = [
         ProjectReleaseFileInline,
         ProjectReleaseLinkInline,
+        PublishAttemptInline,
     ]
     search_fields = ["project__title", "files__episode_number"]
     list_display = [
@@ -77,6 +99,7 @@ class ProjectReleaseAdmin(admin.ModelAdmin):
     ]
     list_filter = ["project"]
     actions = [make_visible, make_invisible]
+    readonly_fields = ["build_progress"]
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
@@ -96,6 +119,15 @@ class ProjectReleaseAdmin(admin.ModelAdmin):
     def episode_number(self, obj):
         return obj.highest_episode_number if obj.file_count == 1 else None
 
+    @admin.display(description="Torrent build progress")
+    def build_progress(self, obj):
+        if obj.pk is None or not (progress := get_build_progress(obj.pk)):
+            return "-"
+        return (
+            f"{progress['hashed_size'] / max(progress['total_size'], 1):.0%} "
+            f"of {progress['total_size'] / 1e9:.1f} GB"
+        )
+
 
 class NewsAttachmentInline(admin.StackedInline):
     model = NewsAttachment
@@ -123,6 +155,40 @@ class NewsAdmin(admin.ModelAdmin):
     form = NewsAdminForm
 
 
+@admin.action(description="Fetch selected entries from AniDB again")
+def retry_anidb_fetch(_modeladmin, _request, queryset):
+    queryset.update(
+        fetch_status=AniDBFetchStatus.PENDING.value,
+        fetch_attempts=0,
+        next_fetch_at=timezone.now(),
+    )
+
+
+@admin.action(description="Retry selected publish attempts now")
+def retry_publish_attempt(_modeladmin, _request, queryset):
+    queryset.exclude(state=PublishAttemptState.DONE.value).update(
+        state=PublishAttemptState.PENDING.value,
+        attempts=0,
+        next_retry_at=timezone.now(),
+    )
+
+
+@admin.register(PublishAttempt)
+class PublishAttemptAdmin(admin.ModelAdmin):
+    search_fields = ["release__project__title"]
+    list_display = [
+        "release",
+        "publisher",
+        "state",
+        "attempts",
+        "next_retry_at",
+    ]
+    list_filter = ["state", "publisher"]
+    list_select_related = ["release__project"]
+    readonly_fields = ["release", "publisher", "attempts", "last_error"]
+    actions = [retry_publish_attempt]
+
+
 @admin.register(AniDBEntry)
 class AniDBEntryAdmin(admin.ModelAdmin):
     search_fields = [
@@ -135,7 +201,13 @@ class AniDBEntryAdmin(admin.ModelAdmin):
         "image",
         "title",
         "type",
+        "fetch_status",
+        "fetch_attempts",
+        "next_fetch_at",
     ]
+    list_filter = ["fetch_status"]
+    readonly_fields = ["fetch_error"]
+    actions = [retry_anidb_fetch]
 
 
 @admin.register(AnimeRequest)
@@ -166,3 +238,4 @@ class CommentAdmin(admin.ModelAdmin):
         "remote_addr",
     ]
     list_filter = ["content_type"]
+    readonly_fields = ["rendered_text", "rendered_text_version"]
@@ -1,17 +1,29 @@
+import contextlib
+import gzip
+import hashlib
+import io
 import logging
 import re
 import time
-from datetime import datetime
-from pathlib import Path
-from typing import Optional
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Optional
 from xml.etree import ElementTree
 
 import dateutil.parser
-import requests
 from django.conf import settings
-from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
 
-from oc_website.models import AniDBEntry
+from oc_website.anidb_client import AniDBError, RateLimited, get_anidb_client
+from oc_website.anidb_store import ANIME, PICTURE, get_anidb_store
+from oc_website.models import AniDBEntry, AniDBTitle
+from oc_website.taxonomies import AniDBFetchStatus, AniDBTitleType
+
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+TITLE_IMPORT_BATCH_SIZE = 5000
 
 
 def get_anidb_link_id(link: str) -> Optional[int]:
@@ -32,18 +44,106 @@ def is_same_anidb_link(link1: str, link2: str) -> bool:
     return link1_id == link2_id
 
 
-def fill_anidb_entry(anidb_id: int) -> Optional[AniDBEntry]:
-    class XmlParser:
-        def __init__(self, path: Path) -> None:
-            self.doc = ElementTree.parse(str(path)).getroot()
+def normalize_title(title: str) -> str:
+    """Make titles comparable regardless of case, accents and spacing."""
+    decomposed = unicodedata.normalize("NFKD", title.casefold())
+    return " ".join(
+        "".join(
+            char for char in decomposed if not unicodedata.combining(char)
+        ).split()
+    )
+
+
+def import_anidb_titles(handle: BinaryIO) -> int:
+    """Replace the stored titles with the ones from an uncompressed title
+    dump; returns the number of imported titles."""
+    title_types = {item.value for item in AniDBTitleType}
+    batch: list[AniDBTitle] = []
+    count = 0
+    with transaction.atomic():
+        AniDBTitle.objects.all().delete()
+        for _event, node in ElementTree.iterparse(handle):
+            if node.tag != "anime":
+                continue
+            anidb_id = int(node.get("aid"))
+            for title_node in node.iterfind("title"):
+                if title_node.get("type") in title_types and (
+                    title := (title_node.text or "").strip()
+                ):
+                    batch.append(
+                        AniDBTitle(
+                            anidb_id=anidb_id,
+                            title=title,
+                            normalized_title=normalize_title(title),
+                            language=title_node.get(XML_LANG, ""),
+                            type=title_node.get("type"),
+                        )
+                    )
+            node.clear()
+            if len(batch) >= TITLE_IMPORT_BATCH_SIZE:
+                AniDBTitle.objects.bulk_create(batch)
+                count += len(batch)
+                batch.clear()
+        AniDBTitle.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def update_anidb_titles() -> int:
+    path = settings.ANIDB_CACHE_DIR / "anime-titles.xml.gz"
+    get_anidb_client().download_titles(path)
+    with gzip.open(path, "rb") as handle:
+        return import_anidb_titles(handle)
+
+
+# fields read from the anime document; description is optional, the others
+# must be present
+ANIME_FIELDS = {
+    "title",
+    "type",
+    "episodecount",
+    "startdate",
+    "enddate",
+    "description",
+    "picture",
+}
+OPTIONAL_ANIME_FIELDS = {"description"}
 
-        def get_text(self, xpath: str, required: bool = True) -> str:
-            node = self.doc.find(xpath)
-            if node is None:
-                if required:
-                    raise ValueError(f"{xpath} not found")
-                return ""
-            return node.text or ""
+
+def parse_anime(data: bytes) -> dict[str, str]:
+    """Extract the fields we use from an anime document in a single pass,
+    stopping as soon as all of them were seen so that the long character and
+    episode lists are usually never parsed."""
+    fields: dict[str, str] = {}
+    depth = 0
+    for event, node in ElementTree.iterparse(
+        io.BytesIO(data), events=("start", "end")
+    ):
+        if event == "start":
+            if depth == 0 and node.tag == "error":
+                raise AniDBError(data.decode(errors="replace").strip())
+            depth += 1
+            continue
+        depth -= 1
+        if (
+            node.tag in ANIME_FIELDS
+            and node.tag not in fields
+            # tags have descriptions too
+            and (node.tag != "description" or depth == 1)
+        ):
+            fields[node.tag] = node.text or ""
+            if len(fields) == len(ANIME_FIELDS):
+                break
+        if depth == 1:
+            node.clear()
+
+    if missing := ANIME_FIELDS - OPTIONAL_ANIME_FIELDS - fields.keys():
+        raise ValueError(f"{', '.join(sorted(missing))} not found")
+    return fields
+
+
+def get_entry_fields(data: bytes) -> dict[str, Any]:
+    """AniDBEntry field values for an anime document."""
 
     def process_synopsis(synopsis: str) -> str:
         return synopsis.replace("http", " http")
@@ -54,59 +154,130 @@ def fill_anidb_entry(anidb_id: int) -> Optional[AniDBEntry]:
         except ValueError:
             return None
 
-    entry_cache_path = settings.ANIDB_CACHE_DIR / f"{anidb_id}.xml"
-    image_cache_path = settings.ANIDB_CACHE_DIR / f"{anidb_id}.jpg"
+    fields = parse_anime(data)
+    return dict(
+        title=fields["title"],
+        type=fields["type"],
+        episodes=int(fields["episodecount"]),
+        synopsis=process_synopsis(fields.get("description", "")) or None,
+        start_date=process_date(fields["startdate"]),
+        end_date=process_date(fields["enddate"]),
+        picture=fields["picture"],
+    )
 
-    if entry_cache_path.exists():
-        logging.info("anidb: using cached info for %d", anidb_id)
-    else:
-        logging.info("anidb: fetching info for %d", anidb_id)
-        response = requests.get(
-            "http://api.anidb.net:9001/httpapi?request=anime"
-            f"&aid={anidb_id}"
-            f"&client={settings.ANIDB_CLIENT}"
-            f"&clientver={settings.ANIDB_CLIENTVER}"
-            "&protover=1"
-        )
-        response.raise_for_status()
-        time.sleep(2)
-        entry_cache_path.parent.mkdir(parents=True, exist_ok=True)
-        entry_cache_path.write_text(response.text)
 
-    # XXX: bad programming, but that's not our fault.
-    if entry_cache_path.read_text().startswith("<error"):
-        return None
+def is_stored_file_equal(name: str, data: bytes) -> bool:
+    if not name or not default_storage.exists(name):
+        return False
+    if default_storage.size(name) != len(data):
+        return False
+    with default_storage.open(name, "rb") as handle:
+        return handle.read() == data
+
 
-    doc = XmlParser(entry_cache_path)
+def reanalyze_anidb_entry(
+    anidb_id: int, image_name: str
+) -> tuple[Optional[dict[str, Any]], Optional[bytes], str]:
+    """Parse the stored responses for an entry without touching the database
+    or AniDB, so that it can run in a worker process.
+
+    Returns the entry field values, the stored picture if it differs from
+    the current image file, and an error message if the entry could not be
+    analyzed.
+    """
+    store = get_anidb_store()
+    if (response := store.get_latest(anidb_id, ANIME)) is None:
+        return None, None, "no stored response"
+    try:
+        fields = get_entry_fields(response.data)
+    except (AniDBError, ElementTree.ParseError, ValueError) as exc:
+        return None, None, str(exc)
+    picture = store.get_latest(anidb_id, PICTURE)
+    if picture is None or is_stored_file_equal(image_name, picture.data):
+        return fields, None, ""
+    return fields, picture.data, ""
+
+
+def get_refresh_interval(end_date: Optional[datetime]) -> timedelta:
+    """How long the data of an entry can be trusted: airing, upcoming and
+    recently finished anime still change, older ones hardly ever do."""
+    if end_date is not None and end_date < timezone.now() - timedelta(
+        seconds=settings.ANIDB_REFRESH_SETTLE
+    ):
+        return timedelta(seconds=settings.ANIDB_REFRESH_FINISHED)
+    return timedelta(seconds=settings.ANIDB_REFRESH_AIRING)
+
+
+def get_refresh_delay(anidb_id: int, interval: timedelta) -> timedelta:
+    """Vary the interval by a fixed fraction for each entry, so that entries
+    filled at the same time do not all come due at the same time again."""
+    digest = hashlib.sha1(str(anidb_id).encode()).digest()
+    spread = int.from_bytes(digest[:4], "big") / 2**32 - 0.5
+    return interval * (1 + settings.ANIDB_REFRESH_JITTER * spread)
+
+
+def fill_anidb_entry(
+    anidb_id: int,
+    max_age: Optional[timedelta] = None,
+    on_request: Optional[Callable[[], None]] = None,
+) -> AniDBEntry:
+    """Fill an entry from the stored responses, asking AniDB for those that
+    are missing or, if max_age is given, older than that. on_request is
+    called whenever the info is actually requested from AniDB."""
+    store = get_anidb_store()
+    client = get_anidb_client()
+
+    previous_picture_name: Optional[str] = None
+    response = store.get_latest(anidb_id, ANIME)
+    if response is not None and (
+        max_age is None
+        or time.time() - response.fetched_at <= max_age.total_seconds()
+    ):
+        logging.info("anidb: using stored info for %d", anidb_id)
+    else:
+        if response is not None:
+            with contextlib.suppress(
+                AniDBError, ElementTree.ParseError, ValueError
+            ):
+                previous_picture_name = parse_anime(response.data)["picture"]
+        is_sent = True
+        try:
+            response = store.put(anidb_id, ANIME, client.get_anime(anidb_id))
+        except RateLimited:
+            is_sent = False  # raised before sending anything
+            raise
+        finally:
+            if is_sent and on_request is not None:
+                on_request()
+    fields = get_entry_fields(response.data)
+    picture_name = fields.pop("picture")
+
+    # fetch the picture before touching the database, so that running out of
+    # image requests leaves the entry pending rather than half-filled
+    picture = store.get_latest(anidb_id, PICTURE)
+    if picture is not None and previous_picture_name in {None, picture_name}:
+        logging.info("anidb: using stored picture for %d", anidb_id)
+    else:
+        picture = store.put(anidb_id, PICTURE, client.get_image(picture_name))
 
     anidb_entry, _created = AniDBEntry.objects.update_or_create(
         anidb_id=anidb_id,
         defaults=dict(
-            title=doc.get_text(".//title"),
-            type=doc.get_text(".//type"),
-            episodes=int(doc.get_text(".//episodecount")),
-            synopsis=(
-                process_synopsis(doc.get_text("./description", required=False))
-                or None
+            **fields,
+            fetch_status=AniDBFetchStatus.DONE.value,
+            fetch_attempts=0,
+            fetch_error="",
+            next_fetch_at=timezone.now()
+            + get_refresh_delay(
+                anidb_id,
+                get_refresh_interval(fields["end_date"]),
             ),
-            start_date=process_date(doc.get_text(".//startdate")),
-            end_date=process_date(doc.get_text(".//enddate")),
         ),
     )
 
-    image_url = "http://cdn.anidb.net/images/main/" + doc.get_text(
-        ".//picture"
-    )
-    if image_cache_path.exists():
-        logging.info("anidb: using cached picture for %d", anidb_id)
-    else:
-        logging.info("anidb: fetching picture for %d", anidb_id)
-        response = requests.get(image_url)
-        response.raise_for_status()
-        time.sleep(2)
-        image_cache_path.write_bytes(response.content)
-
-    with image_cache_path.open("rb") as handle:
-        anidb_entry.image.save(image_cache_path.name, File(handle), save=True)
+    if not is_stored_file_equal(anidb_entry.image.name, picture.data):
+        anidb_entry.image.save(
+            f"{anidb_id}.jpg", ContentFile(picture.data), save=True
+        )
 
     return anidb_entry
@@ -0,0 +1,138 @@
+import functools
+import logging
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django_redis import get_redis_connection
+from requests.adapters import HTTPAdapter
+
+ANIDB_API_URL = "http://api.anidb.net:9001/httpapi"
+ANIDB_IMAGE_URL = "http://cdn.anidb.net/images/main/"
+# may be downloaded at most once a day
+ANIDB_TITLES_URL = "http://anidb.net/api/anime-titles.xml.gz"
+
+
+class RateLimited(Exception):
+    def __init__(self, bucket_name: str, retry_after: float) -> None:
+        super().__init__(f"{bucket_name}: retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class AniDBError(Exception):
+    """AniDB answered with an error document instead of the data."""
+
+
+class TokenBucket:
+    """A token bucket shared by all processes through Redis."""
+
+    # refills the bucket according to the time elapsed since the last call,
+    # then takes a token if there is one; returns the number of seconds until
+    # a token becomes available (as a string, since Redis truncates numbers)
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int) -> None:
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.script = get_redis_connection("default").register_script(
+            self.SCRIPT
+        )
+
+    def acquire(self) -> None:
+        """Take a token or raise RateLimited without waiting."""
+        wait = float(
+            self.script(
+                keys=[f"token-bucket:{self.name}"],
+                args=[self.rate, self.capacity],
+            )
+        )
+        if wait > 0:
+            raise RateLimited(self.name, wait)
+
+
+class AniDBClient:
+    """Talks to AniDB within its flood protection limits, which apply to all
+    Celery workers together rather than to each of them."""
+
+    def __init__(self) -> None:
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=4))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=4))
+        self.session.headers[
+            "User-Agent"
+        ] = f"{settings.ANIDB_CLIENT}/{settings.ANIDB_CLIENTVER}"
+        self.api_bucket = TokenBucket(
+            "anidb-api", settings.ANIDB_API_RATE, settings.ANIDB_API_BURST
+        )
+        self.image_bucket = TokenBucket(
+            "anidb-image",
+            settings.ANIDB_IMAGE_RATE,
+            settings.ANIDB_IMAGE_BURST,
+        )
+
+    def get(
+        self, bucket: TokenBucket, url: str, **kwargs
+    ) -> requests.Response:
+        bucket.acquire()
+        response = self.session.get(
+            url, timeout=settings.ANIDB_TIMEOUT, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    def get_anime(self, anidb_id: int) -> bytes:
+        logging.info("anidb: fetching info for %d", anidb_id)
+        data = self.get(
+            self.api_bucket,
+            ANIDB_API_URL,
+            params=dict(
+                request="anime",
+                aid=anidb_id,
+                client=settings.ANIDB_CLIENT,
+                clientver=settings.ANIDB_CLIENTVER,
+                protover=1,
+            ),
+        ).content
+        # AniDB reports errors such as unknown IDs or bans with a 200 response
+        if data.lstrip().startswith(b"<error"):
+            raise AniDBError(data.decode(errors="replace").strip())
+        return data
+
+    def get_image(self, picture: str) -> bytes:
+        logging.info("anidb: fetching picture %s", picture)
+        return self.get(self.image_bucket, ANIDB_IMAGE_URL + picture).content
+
+    def download_titles(self, path: Path) -> None:
+        logging.info("anidb: downloading title dump")
+        with self.session.get(
+            ANIDB_TITLES_URL, timeout=settings.ANIDB_TIMEOUT, stream=True
+        ) as response:
+            response.raise_for_status()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("wb") as handle:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    handle.write(chunk)
+
+
+@functools.lru_cache(maxsize=None)
+def get_anidb_client() -> AniDBClient:
+    return AniDBClient()
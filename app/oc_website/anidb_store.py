@@ -0,0 +1,106 @@
+import contextlib
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.conf import settings
+
+ANIME = "anime"
+PICTURE = "picture"
+
+# pictures are JPEGs already, compressing them again only costs time
+COMPRESSED_KINDS = {ANIME}
+
+
+@dataclass
+class StoredResponse:
+    anidb_id: int
+    kind: str
+    fetched_at: float
+    data: bytes
+
+
+class AniDBResponseStore:
+    """Raw AniDB responses, kept in a single SQLite file so that they can be
+    reanalyzed without asking AniDB again. Every fetch is kept under its own
+    timestamp; readers normally want the latest one."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    anidb_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (anidb_id, kind, fetched_at)
+                ) WITHOUT ROWID
+                """
+            )
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def put(
+        self,
+        anidb_id: int,
+        kind: str,
+        data: bytes,
+        fetched_at: Optional[float] = None,
+    ) -> StoredResponse:
+        """Store a response; storing the same fetch again is a no-op."""
+        response = StoredResponse(
+            anidb_id=anidb_id,
+            kind=kind,
+            fetched_at=time.time() if fetched_at is None else fetched_at,
+            data=data,
+        )
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO responses VALUES (?, ?, ?, ?)",
+                (
+                    anidb_id,
+                    kind,
+                    response.fetched_at,
+                    zlib.compress(data, 9)
+                    if kind in COMPRESSED_KINDS
+                    else data,
+                ),
+            )
+        return response
+
+    def get_latest(self, anidb_id: int, kind: str) -> Optional[StoredResponse]:
+        with self.connect() as connection:
+            row = connection.execute(
+                """
+                SELECT fetched_at, data FROM responses
+                WHERE anidb_id = ? AND kind = ?
+                ORDER BY fetched_at DESC
+                LIMIT 1
+                """,
+                (anidb_id, kind),
+            ).fetchone()
+        if row is None:
+            return None
+        fetched_at, data = row
+        if kind in COMPRESSED_KINDS:
+            data = zlib.decompress(data)
+        return StoredResponse(
+            anidb_id=anidb_id, kind=kind, fetched_at=fetched_at, data=data
+        )
+
+
+def get_anidb_store() -> AniDBResponseStore:
+    return AniDBResponseStore(settings.ANIDB_STORE_PATH)
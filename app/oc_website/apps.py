@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OcWebsiteConfig(AppConfig):
     name = "oc_website"
     verbose_name = "Website"
+
+    def ready(self) -> None:
+        # pylint: disable=import-outside-toplevel,unused-import
+        import oc_website.signals  # noqa: F401
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+AVATAR_GRID_SIZE = 5
+AVATAR_PIXEL_SIZE = 16
+
+
+def get_avatar_hash(email: Optional[str], author: Optional[str]) -> str:
+    return hashlib.md5((email or author or "").encode()).hexdigest()
+
+
+def get_avatar_path(avatar_hash: str) -> Path:
+    return Path(settings.MEDIA_ROOT) / "avatars" / f"{avatar_hash}.svg"
+
+
+def generate_avatar(avatar_hash: str) -> str:
+    """Draw a horizontally symmetric pixel art identicon as SVG."""
+    digest = bytes.fromhex(avatar_hash)
+    red, green, blue = (64 + byte % 160 for byte in digest[-3:])
+    half = (AVATAR_GRID_SIZE + 1) // 2
+    bits = int.from_bytes(digest, "big")
+    path = ""
+    for row in range(AVATAR_GRID_SIZE):
+        for col in range(half):
+            if not bits >> (row * half + col) & 1:
+                continue
+            for mirrored_col in sorted({col, AVATAR_GRID_SIZE - 1 - col}):
+                path += f"M{mirrored_col} {row}h1v1h-1z"
+    size = AVATAR_GRID_SIZE * AVATAR_PIXEL_SIZE
+    return (
+        "<svg xmlns='http://www.w3.org/2000/svg' "
+        f"width='{size}' height='{size}' "
+        f"viewBox='-0.5 -0.5 {AVATAR_GRID_SIZE + 1} {AVATAR_GRID_SIZE + 1}' "
+        "shape-rendering='crispEdges'>"
+        f"<rect x='-0.5' y='-0.5' width='{AVATAR_GRID_SIZE + 1}' "
+        f"height='{AVATAR_GRID_SIZE + 1}' fill='#f0f0f0'/>"
+        f"<path fill='#{red:02x}{green:02x}{blue:02x}' d='{path}'/>"
+        "</svg>"
+    )
+
+
+def get_stored_avatar(avatar_hash: str) -> Optional[bytes]:
+    try:
+        return get_avatar_path(avatar_hash).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def store_avatar(avatar_hash: str, content: bytes) -> None:
+    path = get_avatar_path(avatar_hash)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as handle:
+        handle.write(content)
+    os.chmod(handle.name, settings.FILE_UPLOAD_PERMISSIONS)
+    os.replace(handle.name, path)
@@ -0,0 +1,67 @@
+import zlib
+from dataclasses import dataclass, field
+from typing import Any
+
+from Crypto.Hash import MD4
+
+# ED2K hashes files in chunks of 9500 KiB
+ED2K_CHUNK_SIZE = 9728000
+
+
+def new_md4() -> Any:
+    # OpenSSL 3 no longer provides MD4, so hashlib cannot be relied on
+    return MD4.new()
+
+
+class ED2K:
+    """The eDonkey hash that AniDB identifies files by: MD4 of the MD4s of
+    9500 KiB chunks, or MD4 of the data for smaller files. For files that
+    are an exact multiple of the chunk size, no hash of an empty chunk is
+    appended, as AniDB does."""
+
+    def __init__(self) -> None:
+        self.chunk_hashes: list[bytes] = []
+        self.chunk = new_md4()
+        self.chunk_size = 0
+
+    def update(self, data: Any) -> None:
+        view = memoryview(data)
+        while view:
+            if self.chunk_size == ED2K_CHUNK_SIZE:
+                self.chunk_hashes.append(self.chunk.digest())
+                self.chunk = new_md4()
+                self.chunk_size = 0
+            part = view[: ED2K_CHUNK_SIZE - self.chunk_size]
+            self.chunk.update(part)
+            self.chunk_size += len(part)
+            view = view[len(part) :]
+
+    def hexdigest(self) -> str:
+        if not self.chunk_hashes:
+            return self.chunk.hexdigest()
+        result = new_md4()
+        for chunk_hash in [*self.chunk_hashes, self.chunk.digest()]:
+            result.update(chunk_hash)
+        return result.hexdigest()
+
+
+@dataclass
+class FileChecksums:
+    """Checksums of a file that are computed as its content streams by."""
+
+    size: int = 0
+    crc32_value: int = 0
+    ed2k_hash: ED2K = field(default_factory=ED2K)
+
+    def update(self, data: Any) -> None:
+        self.size += len(data)
+        self.crc32_value = zlib.crc32(data, self.crc32_value)
+        self.ed2k_hash.update(data)
+
+    @property
+    def crc32(self) -> str:
+        return f"{self.crc32_value:08x}"
+
+    @property
+    def ed2k(self) -> str:
+        return self.ed2k_hash.hexdigest()
@@ -0,0 +1,69 @@
+import time
+
+from django.core.cache import cache
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(
+            f"{name}: circuit open, retry after {retry_after:.0f}s"
+        )
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a remote service for a while after it failed several
+    times in a row, so that callers fail fast instead of each waiting for
+    their own timeout. The state lives in the cache and is shared by all
+    workers.
+
+    Once the cool down is over, calls go through again; the first one to
+    fail opens the circuit right away, as the failures are only reset by a
+    success.
+    """
+
+    def __init__(
+        self, name: str, threshold: int, cooldown: float, memory: float
+    ) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        # how long failures are remembered without new ones
+        self.memory = memory
+
+    @property
+    def failures_key(self) -> str:
+        return f"circuit-breaker:{self.name}:failures"
+
+    @property
+    def open_until_key(self) -> str:
+        return f"circuit-breaker:{self.name}:open-until"
+
+    def check(self) -> None:
+        """Raise CircuitOpen if calls should not be made right now."""
+        open_until = cache.get(self.open_until_key)
+        if open_until is not None and open_until > time.time():
+            raise CircuitOpen(self.name, open_until - time.time())
+
+    def record_success(self) -> None:
+        cache.delete_many([self.failures_key, self.open_until_key])
+
+    def record_failure(self) -> None:
+        cache.add(self.failures_key, 0, timeout=self.memory)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # expired in the meantime
+            failures = 1
+            cache.set(self.failures_key, failures, timeout=self.memory)
+        cache.touch(self.failures_key, timeout=self.memory)
+        if failures >= self.threshold:
+            cache.set(
+                self.open_until_key,
+                time.time() + self.cooldown,
+                timeout=self.cooldown,
+            )
+
+    @property
+    def failures(self) -> int:
+        return int(cache.get(self.failures_key, 0))
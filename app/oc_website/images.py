@@ -0,0 +1,145 @@
+import io
+from pathlib import PurePosixPath
+from typing import Iterable
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+from PIL import Image, ImageOps
+
+from oc_website.models import (
+    AniDBEntry,
+    FeaturedImage,
+    ImageDerivative,
+    Project,
+)
+from oc_website.page_cache import invalidate_model
+from oc_website.storage import get_file_fields
+from oc_website.taxonomies import ImageFormat
+
+IMAGE_FIELDS: dict[type[models.Model], list[str]] = {
+    AniDBEntry: ["image"],
+    FeaturedImage: ["image"],
+    Project: ["big_image", "small_image"],
+}
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280, 1920)
+SAVE_OPTIONS = {
+    ImageFormat.JPEG: dict(quality=85, optimize=True, progressive=True),
+    ImageFormat.PNG: dict(optimize=True),
+    ImageFormat.WEBP: dict(quality=80, method=4),
+}
+
+
+def get_fallback_format(image: Image.Image) -> ImageFormat:
+    """The format for browsers without WebP support."""
+    if "A" in image.getbands() or "transparency" in image.info:
+        return ImageFormat.PNG
+    return ImageFormat.JPEG
+
+
+def encode_image(image: Image.Image, image_format: ImageFormat) -> bytes:
+    if image_format == ImageFormat.JPEG:
+        image = image.convert("RGB")
+    elif image.mode not in {"RGB", "RGBA"}:
+        image = image.convert("RGBA")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.value, **SAVE_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def generate_derivatives(name: str) -> list[ImageDerivative]:
+    """Create downscaled copies of a stored image in WebP and a fallback
+    format, replacing any previous ones. A full size WebP copy is always
+    made, so every processed image has at least one derivative."""
+    with default_storage.open(name, "rb") as handle:
+        image = Image.open(handle)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    fallback_format = get_fallback_format(image)
+    path = PurePosixPath(name)
+
+    derivatives = []
+    # every size is scaled down from the previous one, which is much faster
+    # than scaling the original each time and looks the same
+    resized = image
+    for width in sorted(
+        {image.width, *(w for w in DERIVATIVE_WIDTHS if w < image.width)},
+        reverse=True,
+    ):
+        if width < resized.width:
+            resized = resized.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            )
+        # the original itself serves as the full size fallback
+        image_formats = (
+            [ImageFormat.WEBP]
+            if width == image.width
+            else [ImageFormat.WEBP, fallback_format]
+        )
+        for image_format in image_formats:
+            derivative = ImageDerivative(
+                source_name=name,
+                width=resized.width,
+                height=resized.height,
+                format=image_format.value,
+            )
+            derivative.file.save(
+                f"{path.with_suffix('')}-{width}w.{image_format.value}",
+                ContentFile(encode_image(resized, image_format)),
+                save=False,
+            )
+            derivatives.append(derivative)
+
+    with transaction.atomic():
+        delete_derivatives([name])
+        ImageDerivative.objects.bulk_create(derivatives)
+        invalidate_model(ImageDerivative)  # bulk_create sends no signals
+    return derivatives
+
+
+def delete_derivatives(names: Iterable[str]) -> None:
+    stale = ImageDerivative.objects.filter(source_name__in=names)
+    for derivative in stale:
+        derivative.file.delete(save=False)
+    stale.delete()
+
+
+def get_orphaned_derivatives() -> models.QuerySet:
+    """Derivatives of images that no file field refers to anymore, such as
+    replaced or deleted ones."""
+    queryset = ImageDerivative.objects.all()
+    for model, field_name in get_file_fields():
+        if model is not ImageDerivative:
+            queryset = queryset.exclude(
+                source_name__in=model.objects.exclude(
+                    # NOT IN matches nothing once the list holds a NULL
+                    **{f"{field_name}__isnull": True}
+                ).values(field_name)
+            )
+    return queryset
+
+
+def get_derivatives(image: FieldFile) -> list[ImageDerivative]:
+    if not hasattr(image, "derivatives"):
+        prefetch_derivatives([image])
+    return image.derivatives
+
+
+def prefetch_derivatives(images: Iterable[FieldFile]) -> None:
+    """Load the derivatives of many images in a single query."""
+    images = [image for image in images if image]
+    derivatives = ImageDerivative.objects.for_sources(
+        image.name for image in images
+    )
+    for image in images:
+        image.derivatives = derivatives.get(image.name, [])
+
+
+def prefetch_image_derivatives(
+    instances: Iterable[models.Model], field_name: str
+) -> None:
+    prefetch_derivatives(
+        getattr(instance, field_name) for instance in instances
+    )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from oc_website.images import IMAGE_FIELDS, generate_derivatives
+from oc_website.models import ImageDerivative
+from oc_website.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Creates image derivatives for uploaded images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="regenerate derivatives that already exist",
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="hand the work to Celery instead of doing it here",
+        )
+
+    def handle(self, *_args, **options):
+        names: set[str] = set()
+        for model, field_names in IMAGE_FIELDS.items():
+            for field_name in field_names:
+                names.update(
+                    model.objects.exclude(**{field_name: ""})
+                    .exclude(**{f"{field_name}__isnull": True})
+                    .values_list(field_name, flat=True)
+                )
+        if not options["force"]:
+            names -= set(
+                ImageDerivative.objects.values_list("source_name", flat=True)
+            )
+
+        for name in sorted(names):
+            if options["queue"]:
+                generate_image_derivatives.delay(name)
+                continue
+            try:
+                derivatives = generate_derivatives(name)
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"{name}: {exc}")
+            else:
+                self.stdout.write(f"{name}: {len(derivatives)} derivatives")
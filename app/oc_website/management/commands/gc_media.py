@@ -0,0 +1,53 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from oc_website.images import get_orphaned_derivatives
+from oc_website.storage import ContentAddressedStorage, get_referenced_names
+
+
+class Command(BaseCommand):
+    help = "Removes stored files that no row refers to anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only list the files that would be removed",
+        )
+
+    def handle(self, *_args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("the default storage is not content addressed")
+
+        # list the blobs first, so that a blob saved in the meantime cannot
+        # be mistaken for an unreferenced one
+        blobs = list(default_storage.iter_blobs())
+        with transaction.atomic():
+            # derivatives refer to their blobs, so drop those of images that
+            # are gone first; a dry run takes that back
+            get_orphaned_derivatives().delete()
+            referenced = get_referenced_names()
+            transaction.set_rollback(options["dry_run"])
+        cutoff = time.time() - settings.MEDIA_GC_GRACE_PERIOD
+
+        removed = freed = 0
+        for name in blobs:
+            if name in referenced:
+                continue
+            stat = Path(default_storage.path(name)).stat()
+            if stat.st_mtime > cutoff:
+                continue
+            self.stdout.write(f"Removing {name}")
+            if not options["dry_run"]:
+                default_storage.remove_blob(name)
+            removed += 1
+            freed += stat.st_size
+        self.stdout.write(
+            f"Removed {removed} of {len(blobs)} files, "
+            f"freeing {freed / 1024 / 1024:.1f} MiB"
+        )
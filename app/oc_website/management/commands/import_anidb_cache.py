@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from oc_website.anidb_store import ANIME, PICTURE, get_anidb_store
+
+KINDS = {".xml": ANIME, ".jpg": PICTURE}
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports loose AniDB responses from the cache directory "
+        "into the response store."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="delete the files once they are imported",
+        )
+
+    def handle(self, *_args, **options):
+        store = get_anidb_store()
+        imported = skipped = 0
+        for path in sorted(settings.ANIDB_CACHE_DIR.iterdir()):
+            kind = KINDS.get(path.suffix)
+            if kind is None or not path.stem.isdigit():
+                continue
+            data = path.read_bytes()
+            if kind == ANIME and data.lstrip().startswith(b"<error"):
+                skipped += 1
+            else:
+                store.put(
+                    int(path.stem),
+                    kind,
+                    data,
+                    fetched_at=path.stat().st_mtime,
+                )
+                imported += 1
+            if options["delete"]:
+                path.unlink()
+        self.stdout.write(
+            f"Imported {imported} responses, skipped {skipped} errors"
+        )
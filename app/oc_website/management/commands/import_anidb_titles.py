@@ -0,0 +1,32 @@
+import gzip
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from oc_website.anidb import import_anidb_titles, update_anidb_titles
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports AniDB's anime title dump, downloading it "
+        "unless a file is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            type=Path,
+            nargs="?",
+            help="path to anime-titles.xml or anime-titles.xml.gz",
+        )
+
+    def handle(self, *_args, **options):
+        if (path := options["path"]) is None:
+            count = update_anidb_titles()
+        elif path.suffix == ".gz":
+            with gzip.open(path, "rb") as handle:
+                count = import_anidb_titles(handle)
+        else:
+            with path.open("rb") as handle:
+                count = import_anidb_titles(handle)
+        self.stdout.write(f"Imported {count} titles")
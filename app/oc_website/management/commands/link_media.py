@@ -0,0 +1,84 @@
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from oc_website.models import ImageDerivative
+from oc_website.page_cache import invalidate_model
+from oc_website.storage import (
+    BLOB_DIR,
+    ContentAddressedStorage,
+    get_file_fields,
+)
+
+
+def move_derivatives(old_name: str, new_name: str) -> None:
+    """Make the derivatives of an image follow it to its new name."""
+    derivatives = ImageDerivative.objects.filter(source_name=old_name)
+    if ImageDerivative.objects.filter(source_name=new_name).exists():
+        # another copy of the same image got there first
+        derivatives.delete()
+    else:
+        derivatives.update(source_name=new_name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves files uploaded before content addressed storage "
+        "into blobs, hard-linking them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-originals",
+            action="store_true",
+            help=(
+                "delete the original files; links to them, "
+                "e.g. in news posts, stop working"
+            ),
+        )
+
+    def handle(self, *_args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("the default storage is not content addressed")
+
+        linked = missing = 0
+        originals: set[Path] = set()
+        rewritten: set[type[models.Model]] = set()
+        for model, field_name in get_file_fields():
+            rows = (
+                model.objects.exclude(
+                    **{f"{field_name}__startswith": BLOB_DIR}
+                )
+                .exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list("pk", field_name)
+            )
+            for row_pk, name in rows.iterator():
+                path = Path(default_storage.path(name))
+                if not path.exists():
+                    self.stderr.write(f"{name}: missing")
+                    missing += 1
+                    continue
+                blob_name = default_storage.link(path)
+                with transaction.atomic():
+                    model.objects.filter(pk=row_pk).update(
+                        **{field_name: blob_name}
+                    )
+                    move_derivatives(name, blob_name)
+                originals.add(path)
+                rewritten.update([model, ImageDerivative])
+                linked += 1
+
+        # update() sends no signals, and cached pages still link to the
+        # original files
+        for model in rewritten:
+            invalidate_model(model)
+        if options["delete_originals"]:
+            for path in originals:
+                path.unlink()
+        self.stdout.write(
+            f"Linked {linked} files ({len(originals)} distinct), "
+            f"{missing} missing"
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from oc_website.page_cache import get_page_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Shows hit and miss counters of the public page cache."
+
+    def handle(self, *_args, **_options):
+        stats = get_page_cache_stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / total if total else 0
+        self.stdout.write(
+            f"hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {ratio:.1%}, "
+            f"not modified: {stats['not_modified']}"
+        )
@@ -1,11 +1,58 @@
-from django.core.management.base import BaseCommand
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
 
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from oc_website.anidb import reanalyze_anidb_entry
 from oc_website.models import AniDBEntry
-from oc_website.tasks.anidb import fill_missing_anidb_info
+from oc_website.tasks import generate_image_derivatives
+from oc_website.taxonomies import AniDBFetchStatus
+
+ENTRY_FIELDS = [
+    "title",
+    "type",
+    "episodes",
+    "synopsis",
+    "start_date",
+    "end_date",
+    "fetch_status",
+    "fetch_attempts",
+    "fetch_error",
+]
+
+
+def update_entry(
+    entry: AniDBEntry, fields: dict[str, Any], picture: Optional[bytes]
+) -> bool:
+    """Apply the reanalyzed fields and picture to an entry without saving
+    it, and tell whether anything changed."""
+    fields.pop("picture")
+    fields.update(
+        fetch_status=AniDBFetchStatus.DONE.value,
+        fetch_attempts=0,
+        fetch_error="",
+    )
+    if picture is not None:
+        entry.image.save(
+            f"{entry.anidb_id}.jpg", ContentFile(picture), save=False
+        )
+        generate_image_derivatives.delay(entry.image.name)
+    elif all(getattr(entry, key) == value for key, value in fields.items()):
+        return False
+    for key, value in fields.items():
+        setattr(entry, key, value)
+    return True
 
 
 class Command(BaseCommand):
-    help = "Reanalyzes AniDB response for a given ID."
+    help = (
+        "Reanalyzes stored AniDB responses and updates the entries, "
+        "without asking AniDB."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -14,12 +61,69 @@ class Command(BaseCommand):
             nargs="*",
             help="AniDB ID to refresh metadata of",
         )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="number of parsing processes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="number of entries to parse and save at once",
+        )
+
+    def analyze_batch(
+        self, executor: ProcessPoolExecutor, batch: list[AniDBEntry], jobs: int
+    ) -> Counter:
+        results = executor.map(
+            reanalyze_anidb_entry,
+            [entry.anidb_id for entry in batch],
+            [entry.image.name or "" for entry in batch],
+            chunksize=max(1, len(batch) // jobs),
+        )
+        stats: Counter = Counter()
+        changed = []
+        for entry, (fields, picture, error) in zip(batch, results):
+            if fields is None:
+                self.stderr.write(f"{entry.anidb_id}: {error}")
+                stats["failed"] += 1
+                continue
+            if update_entry(entry, fields, picture):
+                changed.append(entry)
+            if picture is not None:
+                stats["images"] += 1
+        AniDBEntry.objects.bulk_update(changed, [*ENTRY_FIELDS, "image"])
+        stats["updated"] += len(changed)
+        return stats
 
     def handle(self, *_args, **options):
-        entries = AniDBEntry.objects.all().order_by("anidb_id")
+        jobs = options["jobs"]
+        if jobs < 1:
+            raise CommandError("--jobs must be at least 1")
+        entries = AniDBEntry.objects.order_by("pk")
         if anidb_ids := options["id"]:
-            entries = entries.filter(pk__in=anidb_ids)
+            entries = entries.filter(anidb_id__in=anidb_ids)
+
+        start = time.monotonic()
+        done = 0
+        stats: Counter = Counter()
+        last_pk = 0
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            while batch := list(
+                entries.filter(pk__gt=last_pk)[: options["batch_size"]]
+            ):
+                stats.update(self.analyze_batch(executor, batch, jobs))
+                done += len(batch)
+                last_pk = batch[-1].pk
+                self.stdout.write(f"Analyzed {done} entries")
 
-        for entry in entries:
-            self.stdout.write(f"Analyzing {entry.anidb_id}")
-            fill_missing_anidb_info(anidb_id=entry.anidb_id)
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"Analyzed {done} entries in {elapsed:.1f}s "
+            f"({done / max(elapsed, 0.001):.0f} entries/s): "
+            f"{stats['updated']} updated, {stats['images']} new images, "
+            f"{stats['failed']} failed"
+        )
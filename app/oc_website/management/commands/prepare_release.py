@@ -1,23 +1,27 @@
 import json
 import re
+from datetime import timedelta
 from pathlib import Path
 from subprocess import run
-from typing import Any, Optional
+from typing import Any, Optional, cast
 
 import ass_parser
 import ass_tag_parser
 import iso639
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
+from oc_website.checksums import FileChecksums
 from oc_website.models import (
     Language,
     Project,
     ProjectRelease,
     ProjectReleaseFile,
 )
+from oc_website.tasks.releases import chdir, get_torrent_filepaths, new_torrent
 from oc_website.tasks.utils import get_next_release_datetime
+from oc_website.torrents import PieceHasher, get_piece_cache
 from oc_website.urls import url_to_edit_object
 
 
@@ -34,15 +38,21 @@ def get_iso_639_2_lang_code(lang: str) -> str:
     raise ValueError(f"unknown language {lang}")
 
 
-def get_subtitle_languages(source_path: Path) -> list[str]:
-    out = json.loads(
-        run(
-            ["mkvmerge", "-i", source_path, "-F", "json"],
-            capture_output=True,
-            text=True,
-            check=True,
-        ).stdout
+def identify(source_path: Path) -> dict[str, Any]:
+    return cast(
+        dict[str, Any],
+        json.loads(
+            run(
+                ["mkvmerge", "-i", source_path, "-F", "json"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        ),
     )
+
+
+def get_subtitle_languages(out: dict[str, Any]) -> list[str]:
     return [
         country_code
         for track in out["tracks"]
@@ -55,16 +65,45 @@ def get_subtitle_languages(source_path: Path) -> list[str]:
     ]
 
 
-def extract_subtitles(source_path: Path, language: str) -> Optional[str]:
-    out = json.loads(
-        run(
-            ["mkvmerge", "-i", source_path, "-F", "json"],
-            capture_output=True,
-            text=True,
-            check=True,
-        ).stdout
-    )
+def get_duration(out: dict[str, Any]) -> Optional[timedelta]:
+    duration = out.get("container", {}).get("properties", {}).get("duration")
+    if duration is None:
+        return None
+    return timedelta(microseconds=duration // 1000)
+
+
+def get_release_checksums(
+    path: Path,
+) -> dict[Path, tuple[FileChecksums, Optional[str]]]:
+    """Read the files of a release once for their checksums and the pieces
+    of the release's torrent, which go to the piece cache for when the
+    torrent is built."""
+    with chdir(settings.DATA_DIR):
+        torrent, pad_files = new_torrent(
+            path,
+            pad_files=settings.TORRENT_PAD_FILES,
+            hybrid=settings.TORRENT_HYBRID,
+        )
+        hasher = PieceHasher(
+            torrent.piece_size,
+            cache=get_piece_cache(),
+            v2=settings.TORRENT_HYBRID,
+            checksums=True,
+        )
+        hasher.hash_files(get_torrent_filepaths(torrent), pad_files=pad_files)
+    result = {}
+    for filepath, checksums in hasher.checksums.items():
+        pieces_root = hasher.pieces_roots.get(filepath)
+        result[settings.DATA_DIR / filepath] = (
+            checksums,
+            pieces_root.hex() if pieces_root else None,
+        )
+    return result
 
+
+def extract_subtitles(
+    source_path: Path, out: dict[str, Any], language: str
+) -> Optional[str]:
     track = None
     for track in out["tracks"]:
         if (
@@ -173,10 +212,27 @@ def get_series_title_from_release_path(path: Path) -> str:
     return clean_title
 
 
+def verify_checksum(path: Path, checksums: FileChecksums) -> None:
+    expected = get_checksum_from_file_name(path.name).lower()
+    if checksums.crc32 != expected:
+        raise CommandError(
+            f"{path.name}: CRC32 is {checksums.crc32}, not {expected}"
+        )
+
+
 def create_release(path: Path) -> ProjectRelease:
     project_title = get_series_title_from_release_path(path)
     project = Project.objects.get(title=project_title)
 
+    if path.is_file():
+        subpaths = [path]
+    else:
+        subpaths = list(sorted(path.iterdir()))
+
+    checksums = get_release_checksums(path)
+    for subpath in subpaths:
+        verify_checksum(subpath, checksums[subpath][0])
+
     release = ProjectRelease.objects.create(
         project=project,
         release_date=timezone.now(),
@@ -185,21 +241,15 @@ def create_release(path: Path) -> ProjectRelease:
         scheduled_publication_date=get_next_release_datetime(),
     )
 
-    if path.is_file():
-        subpaths = [path]
-    else:
-        subpaths = list(sorted(path.iterdir()))
-
     for subpath in subpaths:
-        languages = []
-        for country_code in get_subtitle_languages(subpath):
-            language, _is_created = Language.objects.get_or_create(
-                name=country_code
-            )
-            languages.append(language)
+        out = identify(subpath)
+        languages = [
+            Language.objects.get_or_create(name=country_code)[0]
+            for country_code in get_subtitle_languages(out)
+        ]
 
         subs_text = extract_subtitles(
-            subpath, language=languages[0].name if languages else None
+            subpath, out, language=languages[0].name if languages else None
         )
         if subs_text:
             ass_file = ass_parser.read_ass(subs_text)
@@ -213,6 +263,11 @@ def create_release(path: Path) -> ProjectRelease:
             file_version=get_version_from_file_name(subpath.name),
             episode_number=get_episode_number_from_file_name(subpath.name),
             episode_title=episode_title,
+            size=checksums[subpath][0].size,
+            crc32=checksums[subpath][0].crc32,
+            ed2k=checksums[subpath][0].ed2k,
+            duration=get_duration(out),
+            pieces_root=checksums[subpath][1],
         )
         release_file.languages.set(languages)
 
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from oc_website.tasks.releases import (
+    BasePublisher,
+    get_publisher_breaker,
+    get_publisher_metrics,
+)
+
+
+class Command(BaseCommand):
+    help = "Shows outcome and latency counters of the release publishers."
+
+    def handle(self, *_args, **_options):
+        for publisher_cls in BasePublisher.__subclasses__():
+            metrics = get_publisher_metrics(publisher_cls.name)
+            completed = metrics["success"] + metrics["failure"]
+            latency = metrics["latency_ms"] / completed if completed else 0
+            breaker = get_publisher_breaker(publisher_cls.name)
+            self.stdout.write(
+                f"{publisher_cls.name}: {metrics['calls']} calls, "
+                f"{metrics['success']} succeeded, "
+                f"{metrics['failure']} failed, "
+                f"{metrics['skipped']} skipped, "
+                f"average latency: {latency:.0f}ms, "
+                f"failures in a row: {breaker.failures}"
+            )
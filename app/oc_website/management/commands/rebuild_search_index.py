@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from oc_website.search import rebuild_anidb_entry_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of AniDB entries."
+
+    def handle(self, *_args, **_options):
+        rebuild_anidb_entry_search_index()
+        self.stdout.write("Search index rebuilt")
@@ -0,0 +1,51 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from oc_website.models import (
+    GUEST_BOOK_COMMENT_COUNTER,
+    AnimeRequest,
+    Comment,
+    Counter,
+)
+
+
+def recount_comments() -> None:
+    with transaction.atomic():
+        AnimeRequest.objects.update(
+            comment_count=Coalesce(
+                Subquery(
+                    Comment.objects.filter(
+                        content_type=ContentType.objects.get_for_model(
+                            AnimeRequest
+                        ),
+                        object_id=OuterRef("id"),
+                    )
+                    .order_by()
+                    .values("object_id")
+                    .annotate(count=Count("object_id"))
+                    .values("count"),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            )
+        )
+        Counter.objects.update_or_create(
+            name=GUEST_BOOK_COMMENT_COUNTER,
+            defaults=dict(
+                value=Comment.objects.filter(content_type=None).count()
+            ),
+        )
+
+
+class Command(BaseCommand):
+    help = "Recounts stored comment counts from scratch."
+
+    def handle(self, *_args, **_options):
+        recount_comments()
+        self.stdout.write(
+            "Guest book comments: "
+            f"{Counter.objects.get_value(GUEST_BOOK_COMMENT_COUNTER)}"
+        )
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from oc_website.markdown import RENDERER_VERSION, render_markdown
+from oc_website.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Re-renders comments whose persisted HTML is stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="re-render all comments, not only the stale ones",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=os.cpu_count(),
+            help="number of rendering processes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="number of comments to render and save at once",
+        )
+
+    def handle(self, *_args, **options):
+        comments = Comment.objects.order_by("pk")
+        if not options["all"]:
+            comments = comments.exclude(rendered_text_version=RENDERER_VERSION)
+        batch_size = options["batch_size"]
+
+        start = time.monotonic()
+        done = 0
+        last_pk = 0
+        with ProcessPoolExecutor(max_workers=options["jobs"]) as executor:
+            while batch := list(
+                comments.filter(pk__gt=last_pk).only("pk", "text")[:batch_size]
+            ):
+                rendered_texts = executor.map(
+                    render_markdown,
+                    [comment.text for comment in batch],
+                    chunksize=max(1, batch_size // (options["jobs"] or 1)),
+                )
+                for comment, rendered_text in zip(batch, rendered_texts):
+                    comment.rendered_text = rendered_text
+                    comment.rendered_text_version = RENDERER_VERSION
+                Comment.objects.bulk_update(
+                    batch, ["rendered_text", "rendered_text_version"]
+                )
+                done += len(batch)
+                last_pk = batch[-1].pk
+                self.stdout.write(f"Rendered {done} comments")
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"Rendered {done} comments in {elapsed:.1f}s "
+            f"(renderer version {RENDERER_VERSION})"
+        )
@@ -1,4 +1,6 @@
 import functools
+import hashlib
+import json
 from collections.abc import MutableMapping
 from typing import Any, Text
 
@@ -34,6 +36,21 @@ SAFE_ELEMENTS = [
 ]
 SAFE_ATTRIBUTES = ["align", "href"]
 
+# stamped on persisted renders so that they can be told apart from renders
+# made with a different sanitizer configuration or library version
+RENDERER_VERSION = hashlib.sha1(
+    json.dumps(
+        [
+            SAFE_ELEMENTS,
+            SAFE_ATTRIBUTES,
+            markdown.__version__,
+            bleach.__version__,
+        ]
+    ).encode()
+).hexdigest()[:12]
+
+PREVIEW_CACHE_SIZE = 256
+
 
 def sanitize(text: str) -> str:
     clean_html = bleach.clean(
@@ -65,9 +82,16 @@ def sanitize(text: str) -> str:
     return linker.linkify(clean_html)
 
 
-@functools.cache
 def render_markdown(text: str) -> str:
     ret = markdown.markdown(text).rstrip("\n")
     if not ret.startswith("<p>") and not ret.endswith("</p>"):
         ret = "<p>" + ret + "</p>"
     return sanitize(ret)
+
+
+@functools.lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def render_markdown_preview(text: str) -> str:
+    """Render text that has no up to date persisted rendering, such as
+    comment previews. Use render_markdown_preview.cache_info() for hit and
+    miss statistics."""
+    return render_markdown(text)
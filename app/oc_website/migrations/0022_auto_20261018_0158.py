@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0021_auto_20211223_1706"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="rendered_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="rendered_text_version",
+            field=models.CharField(blank=True, default="", max_length=12),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# the SQL is spelled out rather than taken from oc_website.search, so that
+# later changes there do not change what this migration did
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_insert
+    AFTER INSERT ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_delete
+    AFTER DELETE ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts
+            (oc_website_anidbentry_fts, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_update
+    AFTER UPDATE ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts
+            (oc_website_anidbentry_fts, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+        INSERT INTO oc_website_anidbentry_fts (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0022_auto_20261018_0158"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE VIRTUAL TABLE oc_website_anidbentry_fts USING fts5(
+                    title,
+                    type,
+                    synopsis,
+                    content='oc_website_anidbentry',
+                    content_rowid='id'
+                )
+                """,
+                *TRIGGERS_SQL,
+                "INSERT INTO oc_website_anidbentry_fts "
+                "(oc_website_anidbentry_fts) VALUES ('rebuild')",
+            ],
+            reverse_sql=[
+                "DROP TRIGGER IF EXISTS oc_website_anidbentry_fts_insert",
+                "DROP TRIGGER IF EXISTS oc_website_anidbentry_fts_delete",
+                "DROP TRIGGER IF EXISTS oc_website_anidbentry_fts_update",
+                "DROP TABLE oc_website_anidbentry_fts",
+            ],
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:03
+# pylint: disable=invalid-name
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, _schema_editor):
+    AnimeRequest = apps.get_model("oc_website", "AnimeRequest")
+    Comment = apps.get_model("oc_website", "Comment")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Counter = apps.get_model("oc_website", "Counter")
+
+    if content_type := ContentType.objects.filter(
+        app_label="oc_website", model="animerequest"
+    ).first():
+        AnimeRequest.objects.update(
+            comment_count=Coalesce(
+                Subquery(
+                    Comment.objects.filter(
+                        content_type=content_type, object_id=OuterRef("id")
+                    )
+                    .order_by()
+                    .values("object_id")
+                    .annotate(count=Count("object_id"))
+                    .values("count"),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            )
+        )
+    Counter.objects.create(
+        name="guest_book_comments",
+        value=Comment.objects.filter(content_type=None).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("oc_website", "0024_contentversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Counter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="animerequest",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="animerequest",
+            index=models.Index(
+                fields=["comment_count", "id"],
+                name="oc_website__comment_bde468_idx",
+            ),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
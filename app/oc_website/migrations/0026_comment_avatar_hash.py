@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:04
+# pylint: disable=invalid-name
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_avatar_hashes(apps, _schema_editor):
+    Comment = apps.get_model("oc_website", "Comment")
+    comments = list(Comment.objects.only("pk", "email", "author"))
+    for comment in comments:
+        comment.avatar_hash = hashlib.md5(
+            (comment.email or comment.author or "").encode()
+        ).hexdigest()
+    Comment.objects.bulk_update(comments, ["avatar_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0025_comment_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="avatar_hash",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+        migrations.RunPython(fill_avatar_hashes, migrations.RunPython.noop),
+    ]
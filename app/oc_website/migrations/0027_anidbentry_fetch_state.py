@@ -0,0 +1,90 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:07
+# pylint: disable=invalid-name
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# as created by 0023_anidbentry_fts
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_insert
+    AFTER INSERT ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_delete
+    AFTER DELETE ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts
+            (oc_website_anidbentry_fts, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS oc_website_anidbentry_fts_update
+    AFTER UPDATE ON oc_website_anidbentry BEGIN
+        INSERT INTO oc_website_anidbentry_fts
+            (oc_website_anidbentry_fts, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+        INSERT INTO oc_website_anidbentry_fts (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+]
+
+
+def mark_filled_entries_done(apps, _schema_editor):
+    AniDBEntry = apps.get_model("oc_website", "AniDBEntry")
+    AniDBEntry.objects.filter(title__isnull=False).update(fetch_status="done")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0026_comment_avatar_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="anidbentry",
+            name="fetch_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="anidbentry",
+            name="fetch_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="anidbentry",
+            name="fetch_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "pending"),
+                    ("failed", "failed"),
+                    ("done", "done"),
+                    ("dead", "dead"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="anidbentry",
+            name="next_fetch_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="anidbentry",
+            index=models.Index(
+                fields=["fetch_status", "next_fetch_at"],
+                name="oc_website__fetch_s_ccb71a_idx",
+            ),
+        ),
+        migrations.RunPython(
+            mark_filled_entries_done, migrations.RunPython.noop
+        ),
+        # SQLite rebuilds the table to add the columns, dropping its triggers
+        migrations.RunSQL(TRIGGERS_SQL, migrations.RunSQL.noop),
+    ]
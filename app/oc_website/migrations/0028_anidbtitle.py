@@ -0,0 +1,59 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0027_anidbentry_fetch_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AniDBTitle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("anidb_id", models.IntegerField()),
+                ("title", models.CharField(max_length=500)),
+                ("normalized_title", models.CharField(max_length=500)),
+                ("language", models.CharField(max_length=20)),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("main", "main"),
+                            ("official", "official"),
+                            ("syn", "syn"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "AniDB title",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="anidbtitle",
+            index=models.Index(
+                fields=["normalized_title"],
+                name="oc_website__normali_e1c55a_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="anidbtitle",
+            index=models.Index(
+                fields=["anidb_id", "type"],
+                name="oc_website__anidb_i_0fbca4_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0028_anidbtitle"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageDerivative",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source_name", models.CharField(max_length=255)),
+                ("width", models.PositiveIntegerField()),
+                ("height", models.PositiveIntegerField()),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[
+                            ("jpeg", "jpeg"),
+                            ("png", "png"),
+                            ("webp", "webp"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("file", models.FileField(upload_to="derivatives/")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="imagederivative",
+            constraint=models.UniqueConstraint(
+                fields=("source_name", "width", "format"),
+                name="unique_image_derivative",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# pylint: disable=invalid-name
+import hashlib
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+# ANIDB_REFRESH_AIRING when this migration was written
+REFRESH_INTERVAL = 7 * 24 * 60 * 60
+
+
+def spread_refreshes(apps, _schema_editor):
+    """Filled entries would otherwise all be due for a refresh at once."""
+    AniDBEntry = apps.get_model("oc_website", "AniDBEntry")
+    now = timezone.now()
+    entries = list(
+        AniDBEntry.objects.filter(fetch_status="done").only("pk", "anidb_id")
+    )
+    for entry in entries:
+        digest = hashlib.sha1(str(entry.anidb_id).encode()).digest()
+        entry.next_fetch_at = now + timedelta(
+            seconds=REFRESH_INTERVAL
+            * int.from_bytes(digest[:4], "big")
+            / 2**32
+        )
+    AniDBEntry.objects.bulk_update(entries, ["next_fetch_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0029_imagederivative"),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_refreshes, migrations.RunPython.noop),
+    ]
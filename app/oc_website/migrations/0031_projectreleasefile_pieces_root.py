@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0030_anidbentry_refresh_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="projectreleasefile",
+            name="pieces_root",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
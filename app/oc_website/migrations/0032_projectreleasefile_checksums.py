@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0031_projectreleasefile_pieces_root"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="projectreleasefile",
+            name="crc32",
+            field=models.CharField(blank=True, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name="projectreleasefile",
+            name="duration",
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="projectreleasefile",
+            name="ed2k",
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="projectreleasefile",
+            name="size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0032_projectreleasefile_checksums"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PublishAttempt",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("publisher", models.CharField(max_length=30)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("pending", "pending"),
+                            ("running", "running"),
+                            ("failed", "failed"),
+                            ("done", "done"),
+                            ("dead", "dead"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_retry_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                (
+                    "release",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="publish_attempts",
+                        to="oc_website.projectrelease",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="publishattempt",
+            index=models.Index(
+                fields=["state", "next_retry_at"],
+                name="oc_website__state_d7164e_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="publishattempt",
+            constraint=models.UniqueConstraint(
+                fields=("release", "publisher"), name="unique_publish_attempt"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0033_publishattempt"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="projectrelease",
+            name="publication_task_eta",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="projectrelease",
+            name="publication_task_id",
+            field=models.CharField(
+                blank=True, editable=False, max_length=36, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="projectrelease",
+            index=models.Index(
+                condition=models.Q(
+                    ("scheduled_publication_date__isnull", False)
+                ),
+                fields=["scheduled_publication_date"],
+                name="release_scheduled_publication",
+            ),
+        ),
+    ]
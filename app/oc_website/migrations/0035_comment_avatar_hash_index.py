@@ -0,0 +1,20 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oc_website", "0034_release_publication_task"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="comment",
+            name="avatar_hash",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=32
+            ),
+        ),
+    ]
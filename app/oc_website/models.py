@@ -1,20 +1,58 @@
-import hashlib
+import random
 import re
 from collections import OrderedDict
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
 
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
-from django.db.models.functions import Coalesce
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Prefetch
+from django.urls import reverse
+from django.utils import timezone
 
+from oc_website.avatars import get_avatar_hash
 from oc_website.fields import MagnetURLField
-from oc_website.markdown import render_markdown
-from oc_website.taxonomies import ProjectStatus
+from oc_website.markdown import (
+    RENDERER_VERSION,
+    render_markdown,
+    render_markdown_preview,
+)
+from oc_website.taxonomies import (
+    AniDBFetchStatus,
+    AniDBTitleType,
+    ImageFormat,
+    ProjectStatus,
+    PublishAttemptState,
+)
+
+KNOWN_LINK_PROVIDERS = ["magnet", "nyaa.si", "nyaa.net", "anidex.info"]
+GUEST_BOOK_COMMENT_COUNTER = "guest_book_comments"
+
+
+class AniDBEntryManager(models.Manager):
+    def due(self, now: Optional[datetime] = None) -> models.QuerySet:
+        """Entries whose next fetch attempt is due."""
+        return self.filter(
+            fetch_status__in=[
+                AniDBFetchStatus.PENDING.value,
+                AniDBFetchStatus.FAILED.value,
+            ],
+            next_fetch_at__lte=now or timezone.now(),
+        ).order_by("next_fetch_at")
+
+    def refresh_due(self, now: Optional[datetime] = None) -> models.QuerySet:
+        """Filled entries whose data is due to be refreshed."""
+        return self.filter(
+            fetch_status=AniDBFetchStatus.DONE.value,
+            next_fetch_at__lte=now or timezone.now(),
+        ).order_by("next_fetch_at")
 
 
 class AniDBEntry(models.Model):
+    objects = AniDBEntryManager()
+
     anidb_id = models.IntegerField()
     image = models.FileField(upload_to="anidb/", null=True, blank=True)
     title = models.CharField(max_length=200, null=True, blank=True)
@@ -23,19 +61,154 @@ class AniDBEntry(models.Model):
     synopsis = models.TextField(null=True, blank=True)
     start_date = models.DateTimeField(null=True, blank=True)
     end_date = models.DateTimeField(null=True, blank=True)
+    fetch_status = models.CharField(
+        max_length=10,
+        choices=AniDBFetchStatus.get_choices(),
+        default=AniDBFetchStatus.PENDING.value,
+    )
+    fetch_attempts = models.PositiveSmallIntegerField(default=0)
+    fetch_error = models.TextField(blank=True)
+    next_fetch_at = models.DateTimeField(default=timezone.now)
 
     @property
     def url(self) -> str:
         return f"https://anidb.net/anime/{self.anidb_id}"
 
+    def record_fetch_failure(self, error: str) -> None:
+        """Schedule another attempt with exponential backoff, or give up on
+        the entry once it has failed too many times."""
+        self.fetch_attempts += 1
+        self.fetch_error = error
+        if self.fetch_attempts >= settings.ANIDB_FETCH_MAX_ATTEMPTS:
+            self.fetch_status = AniDBFetchStatus.DEAD.value
+        else:
+            self.fetch_status = AniDBFetchStatus.FAILED.value
+            self.next_fetch_at = timezone.now() + timedelta(
+                seconds=min(
+                    settings.ANIDB_FETCH_BACKOFF
+                    * 2 ** (self.fetch_attempts - 1),
+                    settings.ANIDB_FETCH_BACKOFF_MAX,
+                )
+            )
+        self.save(
+            update_fields=[
+                "fetch_attempts",
+                "fetch_error",
+                "fetch_status",
+                "next_fetch_at",
+            ]
+        )
+
+    def postpone_refresh(self, error: str) -> None:
+        """Retry a failed refresh later, keeping the data we have."""
+        self.fetch_error = error
+        self.next_fetch_at = timezone.now() + timedelta(days=1)
+        self.save(update_fields=["fetch_error", "next_fetch_at"])
+
     class Meta:
         verbose_name = "AniDB entry"
         verbose_name_plural = "AniDB entries"
+        indexes = [models.Index(fields=["fetch_status", "next_fetch_at"])]
 
     def __str__(self) -> str:
         return f"{self.title}"
 
 
+class AniDBTitleManager(models.Manager):
+    def get_main_title(self, anidb_id: int) -> Optional[str]:
+        return (
+            self.filter(anidb_id=anidb_id, type=AniDBTitleType.MAIN.value)
+            .values_list("title", flat=True)
+            .first()
+        )
+
+    def search(self, normalized_prefix: str, limit: int) -> list[dict]:
+        """Anime with a title starting with the given prefix, together with
+        their main titles."""
+        # a range rather than LIKE, which SQLite cannot serve from the index
+        matches = self.filter(
+            normalized_title__gte=normalized_prefix,
+            normalized_title__lt=normalized_prefix + "\U0010ffff",
+        ).order_by("normalized_title")
+        results: dict[int, dict] = {}
+        for anidb_id, title in matches.values_list("anidb_id", "title")[
+            : limit * 10
+        ]:
+            if anidb_id not in results:
+                results[anidb_id] = dict(
+                    anidb_id=anidb_id, title=title, match=title
+                )
+                if len(results) == limit:
+                    break
+        for anidb_id, title in self.filter(
+            anidb_id__in=results, type=AniDBTitleType.MAIN.value
+        ).values_list("anidb_id", "title"):
+            results[anidb_id]["title"] = title
+        return list(results.values())
+
+
+class AniDBTitle(models.Model):
+    """A title from AniDB's daily title dump, which covers every anime."""
+
+    objects = AniDBTitleManager()
+
+    anidb_id = models.IntegerField()
+    title = models.CharField(max_length=500)
+    normalized_title = models.CharField(max_length=500)
+    language = models.CharField(max_length=20)
+    type = models.CharField(
+        max_length=10, choices=AniDBTitleType.get_choices()
+    )
+
+    class Meta:
+        verbose_name = "AniDB title"
+        indexes = [
+            models.Index(fields=["normalized_title"]),
+            models.Index(fields=["anidb_id", "type"]),
+        ]
+
+    def __str__(self) -> str:
+        return self.title
+
+
+class ContentVersion(models.Model):
+    """Bumped on every write to the model it is named after; used to
+    identify cached renditions of public pages."""
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"{self.name} v{self.version}"
+
+
+class CounterManager(models.Manager):
+    def get_value(self, name: str) -> int:
+        return (
+            self.filter(name=name).values_list("value", flat=True).first() or 0
+        )
+
+    def add(self, name: str, delta: int) -> None:
+        if not self.filter(name=name).update(value=F("value") + delta):
+            try:
+                with transaction.atomic():
+                    self.create(name=name, value=delta)
+            except IntegrityError:
+                # created concurrently
+                self.filter(name=name).update(value=F("value") + delta)
+
+
+class Counter(models.Model):
+    objects = CounterManager()
+
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.value}"
+
+
 class FeaturedImage(models.Model):
     feature_date = models.DateTimeField()
     image = models.FileField(upload_to="featured_images/")
@@ -44,6 +217,43 @@ class FeaturedImage(models.Model):
         ordering = ["-feature_date"]
 
 
+class ImageDerivativeManager(models.Manager):
+    def for_sources(self, names: Iterable[str]) -> dict[str, list]:
+        """Derivatives of the given image files, narrowest first."""
+        derivatives: dict[str, list] = {}
+        for derivative in self.filter(source_name__in=set(names)).order_by(
+            "width"
+        ):
+            derivatives.setdefault(derivative.source_name, []).append(
+                derivative
+            )
+        return derivatives
+
+
+class ImageDerivative(models.Model):
+    """A resized or re-encoded copy of an uploaded image, identified by the
+    storage name of the original so that it works for any image field."""
+
+    objects = ImageDerivativeManager()
+
+    source_name = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=ImageFormat.get_choices())
+    file = models.FileField(upload_to="derivatives/")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source_name", "width", "format"],
+                name="unique_image_derivative",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.source_name} ({self.width}w {self.format})"
+
+
 class Language(models.Model):
     name = models.CharField(max_length=10)
 
@@ -51,7 +261,33 @@ class Language(models.Model):
         return self.name
 
 
+class ProjectManager(models.Manager):
+    def with_release_tree(self):
+        """Prefetch everything the project page needs in a fixed number of
+        queries, regardless of the release count.
+
+        Visible releases end up in `visible_releases`; their files, file
+        languages and links are reachable through the usual `.all()` calls
+        without touching the database again.
+        """
+        return self.prefetch_related(
+            "links",
+            Prefetch(
+                "releases",
+                queryset=ProjectRelease.objects.filter(
+                    is_visible=True
+                ).prefetch_related("links", "files__languages"),
+                to_attr="visible_releases",
+            ),
+        )
+
+
 class Project(models.Model):
+    objects = ProjectManager()
+
+    # filled in bulk by prefetch_project_languages()
+    _languages: list[str]
+
     title = models.CharField(max_length=200)
     slug = models.CharField(max_length=30)
     status = models.CharField(
@@ -72,6 +308,8 @@ class Project(models.Model):
 
     @property
     def languages(self) -> list[str]:
+        if hasattr(self, "_languages"):
+            return self._languages
         return list(
             Language.objects.filter(projectreleasefile__release__project=self)
             .distinct()
@@ -83,6 +321,23 @@ class Project(models.Model):
         return self.title
 
 
+def prefetch_project_languages(projects: Iterable[Project]) -> None:
+    """Resolve Project.languages of many projects in a single query."""
+    projects_by_id = {project.pk: project for project in projects}
+    for project in projects_by_id.values():
+        project._languages = []  # pylint: disable=protected-access
+    for project_id, name in (
+        Language.objects.filter(
+            projectreleasefile__release__project__in=projects_by_id.keys()
+        )
+        .values_list("projectreleasefile__release__project_id", "name")
+        .distinct()
+        .order_by("pk")
+    ):
+        # pylint: disable=protected-access
+        projects_by_id[project_id]._languages.append(name)
+
+
 class ProjectExternalLink(models.Model):
     project = models.ForeignKey(
         Project, on_delete=models.CASCADE, related_name="links"
@@ -93,7 +348,17 @@ class ProjectExternalLink(models.Model):
         return f"{self.url} ({self.project})"
 
 
+class ProjectReleaseManager(models.Manager):
+    def scheduled(self, until: datetime) -> models.QuerySet:
+        """Hidden releases to be published by the given time."""
+        return self.filter(
+            scheduled_publication_date__lte=until, is_visible=False
+        ).order_by("scheduled_publication_date")
+
+
 class ProjectRelease(models.Model):
+    objects = ProjectReleaseManager()
+
     project = models.ForeignKey(
         Project, on_delete=models.CASCADE, related_name="releases"
     )
@@ -101,26 +366,61 @@ class ProjectRelease(models.Model):
     scheduled_publication_date = models.DateTimeField(null=True, blank=True)
     is_visible = models.BooleanField(default=True)
     filename = models.CharField(max_length=256, null=True, blank=True)
+    # the publish_release task queued for the scheduled publication date,
+    # and the date it was queued for
+    publication_task_id = models.CharField(
+        max_length=36, null=True, blank=True, editable=False
+    )
+    publication_task_eta = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
 
     class Meta:
         ordering = ["-release_date"]
         unique_together = ("project_id", "release_date")
+        indexes = [
+            # only the few releases waiting for publication are indexed
+            models.Index(
+                fields=["scheduled_publication_date"],
+                condition=models.Q(scheduled_publication_date__isnull=False),
+                name="release_scheduled_publication",
+            )
+        ]
+
+    # the properties below go through .all() so that they are served from
+    # the prefetch cache when loaded with Project.objects.with_release_tree()
 
     @property
     def languages(self) -> list[str]:
         return list(
-            OrderedDict.fromkeys(sum((f.languages for f in self.files), []))
+            OrderedDict.fromkeys(
+                language.name
+                for release_file in self.files.all()
+                for language in release_file.languages.all()
+            )
         )
 
     @property
     def btih(self) -> Optional[str]:
-        link = self.links.filter(url__contains="magnet").first()
-        if link:
+        for link in self.links.all():
+            if "magnet" not in link.url:
+                continue
             match = re.search("magnet.*btih:([0-9a-f]+)", link.url, flags=re.I)
             if match:
                 return match.group(1)
+            return None
         return None
 
+    @property
+    def provider_links(self) -> list[tuple[str, "ProjectReleaseLink"]]:
+        links = self.links.all()
+        return [
+            (provider, link)
+            for provider in KNOWN_LINK_PROVIDERS
+            for link in links
+            if provider in link.url
+        ]
+
     def __str__(self) -> str:
         return f"{self.project} ({self.release_date})"
 
@@ -144,11 +444,141 @@ class ProjectReleaseFile(models.Model):
     episode_number = models.IntegerField(null=True, blank=True)
     episode_title = models.CharField(null=True, blank=True, max_length=200)
     languages = models.ManyToManyField(Language)
+    size = models.BigIntegerField(null=True, blank=True)
+    crc32 = models.CharField(max_length=8, null=True, blank=True)
+    ed2k = models.CharField(max_length=32, null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
+    # BitTorrent v2 merkle root of the file, in hex
+    pieces_root = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         ordering = ["file_name"]
 
 
+class PublishAttemptManager(models.Manager):
+    def due(self, now: Optional[datetime] = None) -> models.QuerySet:
+        """Attempts that should be made now, including those whose worker
+        did not finish them within the lease."""
+        return self.filter(
+            state__in=[
+                PublishAttemptState.PENDING.value,
+                PublishAttemptState.RUNNING.value,
+                PublishAttemptState.FAILED.value,
+            ],
+            next_retry_at__lte=now or timezone.now(),
+        ).order_by("next_retry_at")
+
+
+class PublishAttempt(models.Model):
+    """Publication of a release to a third-party site, kept until it
+    succeeds so that it is made exactly once however often it is
+    retried."""
+
+    objects = PublishAttemptManager()
+
+    release = models.ForeignKey(
+        ProjectRelease,
+        on_delete=models.CASCADE,
+        related_name="publish_attempts",
+    )
+    publisher = models.CharField(max_length=30)
+    state = models.CharField(
+        max_length=10,
+        choices=PublishAttemptState.get_choices(),
+        default=PublishAttemptState.PENDING.value,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # while running, the end of the lease
+    next_retry_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    def lease(self) -> bool:
+        """Take the attempt for the calling worker, unless it is not due or
+        another worker took it first."""
+        now = timezone.now()
+        next_retry_at = now + timedelta(seconds=settings.PUBLISH_LEASE)
+        leased = (
+            PublishAttempt.objects.due(now)
+            .filter(pk=self.pk)
+            .update(
+                state=PublishAttemptState.RUNNING.value,
+                next_retry_at=next_retry_at,
+            )
+        )
+        if leased:
+            self.state = PublishAttemptState.RUNNING.value
+            self.next_retry_at = next_retry_at
+        return bool(leased)
+
+    def update_leased(self, **fields: Any) -> bool:
+        """Save fields, unless the lease ran out and another worker took the
+        attempt over, whose outcome must not be overwritten."""
+        updated = PublishAttempt.objects.filter(
+            pk=self.pk,
+            state=PublishAttemptState.RUNNING.value,
+            next_retry_at=self.next_retry_at,
+        ).update(**fields)
+        if not updated:
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    def record_success(self) -> bool:
+        return self.update_leased(
+            state=PublishAttemptState.DONE.value,
+            attempts=self.attempts + 1,
+            last_error="",
+        )
+
+    def record_failure(self, error: str) -> bool:
+        """Schedule another attempt with exponential backoff and jitter, or
+        give up once it has failed too many times."""
+        attempts = self.attempts + 1
+        if attempts >= settings.PUBLISH_MAX_ATTEMPTS:
+            return self.update_leased(
+                state=PublishAttemptState.DEAD.value,
+                attempts=attempts,
+                last_error=error,
+            )
+        delay = min(
+            settings.PUBLISH_RETRY_BACKOFF * 2 ** (attempts - 1),
+            settings.PUBLISH_RETRY_BACKOFF_MAX,
+        )
+        # keeps the retries of releases that failed together apart
+        delay *= 1 + settings.PUBLISH_RETRY_JITTER * (random.random() - 0.5)
+        return self.update_leased(
+            state=PublishAttemptState.FAILED.value,
+            attempts=attempts,
+            last_error=error,
+            next_retry_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def postpone(self, delay: float, error: str) -> bool:
+        """Give the attempt back without counting it as one."""
+        return self.update_leased(
+            state=(
+                PublishAttemptState.FAILED.value
+                if self.attempts
+                else PublishAttemptState.PENDING.value
+            ),
+            last_error=error,
+            next_retry_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["release", "publisher"],
+                name="unique_publish_attempt",
+            )
+        ]
+        indexes = [models.Index(fields=["state", "next_retry_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.release} to {self.publisher}"
+
+
 class News(models.Model):
     publication_date = models.DateTimeField()
     title = models.CharField(max_length=100)
@@ -168,50 +598,72 @@ class NewsAttachment(models.Model):
     file = models.FileField(upload_to="news/")
 
 
-class AnimeRequestManager(models.Manager):
-    def with_counts(self):
-        # pylint: disable=protected-access
-        content_type = ContentType.objects.get(
-            model=AnimeRequest._meta.model_name
-        )
-        return self.annotate(
-            comment_count=Coalesce(
-                Subquery(
-                    Comment.objects.filter(
-                        content_type=content_type,
-                        object_id=OuterRef("id"),
-                    )
-                    .values("object_id")
-                    .annotate(count=Count("object_id"))
-                    .values("count"),
-                    output_field=IntegerField(),
-                ),
-                Value(0),
-            )
-        )
-
-
 class AnimeRequest(models.Model):
-    objects = AnimeRequestManager()
-
     request_date = models.DateTimeField(null=True, blank=True)
     comment = models.TextField(null=True, blank=True)
     remote_addr = models.CharField(max_length=64, null=True, blank=True)
 
     anidb_entry = models.ForeignKey(AniDBEntry, on_delete=models.CASCADE)
 
+    # maintained by Comment.save() and oc_website.signals
+    comment_count = models.PositiveIntegerField(default=0)
+
     @property
     def anidb_url(self) -> Optional[str]:
         return f"https://anidb.net/anime/{self.anidb_entry.anidb_id}"
 
     class Meta:
         ordering = ["-request_date"]
+        indexes = [models.Index(fields=["comment_count", "id"])]
 
     def __str__(self) -> str:
         return f"Request for {self.anidb_entry or self.anidb_entry.anidb_id}"
 
 
+class CommentManager(models.Manager):
+    def get_thread(
+        self, content_type: Optional[ContentType], object_id: Optional[int]
+    ) -> list["Comment"]:
+        """Load all comments attached to the given object in one query and
+        return the root comments, with replies reachable via
+        Comment.replies."""
+        return build_comment_tree(
+            list(self.filter(content_type=content_type, object_id=object_id))
+        )
+
+    def load_replies(
+        self, root_comments: Iterable["Comment"]
+    ) -> list["Comment"]:
+        """Load the reply trees of the given root comments in one query."""
+        roots = list(root_comments)
+        if not roots:
+            return roots
+        # pylint: disable=protected-access
+        table = self.model._meta.db_table
+        parent_column = self.model._meta.get_field("parent_comment").column
+        placeholders = ", ".join(["%s"] * len(roots))
+        descendants = self.raw(
+            f"""
+            WITH RECURSIVE thread(id) AS (
+                SELECT id FROM {table}
+                WHERE {parent_column} IN ({placeholders})
+                UNION ALL
+                SELECT child.id FROM {table} child
+                INNER JOIN thread ON child.{parent_column} = thread.id
+            )
+            SELECT * FROM {table}
+            WHERE id IN (SELECT id FROM thread)
+            ORDER BY comment_date DESC
+            """,
+            [root.pk for root in roots],
+        )
+        build_comment_tree(roots + list(descendants))
+        return roots
+
+
 class Comment(models.Model):
+    objects = CommentManager()
+
     content_type = models.ForeignKey(
         ContentType, on_delete=models.CASCADE, null=True, blank=True
     )
@@ -235,6 +687,15 @@ class Comment(models.Model):
 
     is_visible = models.BooleanField(default=True)
 
+    avatar_hash = models.CharField(
+        max_length=32, blank=True, default="", db_index=True
+    )
+
+    rendered_text = models.TextField(blank=True, default="")
+    rendered_text_version = models.CharField(
+        max_length=12, blank=True, default=""
+    )
+
     class Meta:
         ordering = ["-comment_date"]
 
@@ -243,11 +704,100 @@ class Comment(models.Model):
             f"comment on {self.content_object or 'guestbook'} by {self.author}"
         )
 
+    # filled by build_comment_tree()
+    _replies: list["Comment"]
+
+    @property
+    def replies(self) -> list["Comment"]:
+        if hasattr(self, "_replies"):
+            return self._replies
+        if self.pk is None:
+            return []
+        return list(self.child_comments.all())
+
+    # (content_type_id, object_id) this comment is counted towards in the
+    # database, see update_comment_count()
+    _counted_target: Optional[tuple[Optional[int], Optional[int]]] = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"content_type_id", "object_id"}.issubset(field_names):
+            # pylint: disable=protected-access
+            instance._counted_target = instance.target
+        return instance
+
+    @property
+    def target(self) -> tuple[Optional[int], Optional[int]]:
+        return (self.content_type_id, self.object_id)
+
+    def save(self, *args, **kwargs) -> None:
+        self.render_text()
+        self.avatar_hash = get_avatar_hash(self.email, self.author)
+        is_adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_adding:
+                update_comment_count(self.target, 1)
+            elif (
+                self._counted_target is not None
+                and self._counted_target != self.target
+            ):
+                update_comment_count(self._counted_target, -1)
+                update_comment_count(self.target, 1)
+        self._counted_target = self.target
+
+    def render_text(self) -> None:
+        self.rendered_text = render_markdown(self.text)
+        self.rendered_text_version = RENDERER_VERSION
+
+    @property
+    def is_rendered_text_stale(self) -> bool:
+        return self.rendered_text_version != RENDERER_VERSION
+
     @property
     def html(self) -> str:
-        return render_markdown(self.text)
+        if self.is_rendered_text_stale:
+            return render_markdown_preview(self.text)
+        return self.rendered_text
 
     @property
     def author_avatar_url(self) -> str:
-        chksum = hashlib.md5((self.email or self.author).encode()).hexdigest()
-        return f"https://www.gravatar.com/avatar/{chksum}?d=retro"
+        return reverse(
+            "avatar",
+            args=[
+                self.avatar_hash or get_avatar_hash(self.email, self.author)
+            ],
+        )
+
+
+def build_comment_tree(comments: list[Comment]) -> list[Comment]:
+    """Link the given comments into reply trees without touching the database.
+
+    The relative order of the input is preserved among siblings. Returns the
+    comments whose parents are not part of the input.
+    """
+    comments_by_id = {comment.pk: comment for comment in comments}
+    roots: list[Comment] = []
+    for comment in comments:
+        comment._replies = []  # pylint: disable=protected-access
+    for comment in comments:
+        parent = comments_by_id.get(comment.parent_comment_id)
+        if parent:
+            parent._replies.append(comment)  # pylint: disable=protected-access
+        else:
+            roots.append(comment)
+    return roots
+
+
+def update_comment_count(
+    target: tuple[Optional[int], Optional[int]], delta: int
+) -> None:
+    """Adjust the stored comment count of a guest book or anime request."""
+    content_type_id, object_id = target
+    if content_type_id is None:
+        Counter.objects.add(GUEST_BOOK_COMMENT_COUNTER, delta)
+    elif content_type_id == ContentType.objects.get_for_model(AnimeRequest).pk:
+        AnimeRequest.objects.filter(
+            pk=object_id, comment_count__gte=-delta
+        ).update(comment_count=F("comment_count") + delta)
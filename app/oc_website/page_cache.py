@@ -0,0 +1,211 @@
+import functools
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from oc_website.models import ContentVersion
+
+HITS_KEY = "page-cache:hits"
+MISSES_KEY = "page-cache:misses"
+NOT_MODIFIED_KEY = "page-cache:not-modified"
+
+
+def get_content_version_name(model: type[models.Model]) -> str:
+    return model._meta.label_lower  # pylint: disable=protected-access
+
+
+def invalidate_model(model: type[models.Model]) -> None:
+    """Drop every cached page and ETag that depends on the given model."""
+    name = get_content_version_name(model)
+    now = timezone.now()
+    if ContentVersion.objects.filter(name=name).update(
+        version=F("version") + 1, modified=now
+    ):
+        return
+    try:
+        with transaction.atomic():
+            ContentVersion.objects.create(name=name, version=1, modified=now)
+    except IntegrityError:
+        # created concurrently
+        ContentVersion.objects.filter(name=name).update(
+            version=F("version") + 1, modified=now
+        )
+
+
+def get_content_versions(
+    model_classes: Iterable[type[models.Model]],
+) -> tuple[str, Optional[datetime]]:
+    """Return a token identifying the current state of the given models and
+    the date of their most recent change, at the cost of a single query."""
+    names = [get_content_version_name(model) for model in model_classes]
+    if not names:
+        return "", None
+    versions = {
+        content_version.name: content_version
+        for content_version in ContentVersion.objects.filter(name__in=names)
+    }
+    token = ".".join(
+        # the modification date guards against version numbers restarting
+        f"{versions[name].version}@{versions[name].modified.timestamp()}"
+        if name in versions
+        else "0"
+        for name in names
+    )
+    last_modified = max(
+        (content_version.modified for content_version in versions.values()),
+        default=None,
+    )
+    return token, last_modified
+
+
+def get_last_published(
+    queryset: models.QuerySet, field: str
+) -> Optional[datetime]:
+    """Return the newest date stored in the given field that is not in the
+    future, for pages that change when scheduled content goes live."""
+    return (
+        queryset.filter(**{f"{field}__lte": timezone.now()})
+        .order_by(f"-{field}")
+        .values_list(field, flat=True)
+        .first()
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version() -> tuple[str, datetime]:
+    """Tell apart pages rendered from different template revisions, and
+    pages linking to different revisions of the static files; also returns
+    when the newest of these files changed."""
+    digest = hashlib.md5()
+    mtime = 0.0
+    app_dir = Path(__file__).parent
+    for path in sorted(
+        [
+            *(app_dir / "templates").rglob("*"),
+            *(app_dir / "static").rglob("*"),
+        ]
+    ):
+        stat = path.stat()
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        mtime = max(mtime, stat.st_mtime)
+    return digest.hexdigest(), datetime.fromtimestamp(mtime, timezone.utc)
+
+
+def count(key: str) -> None:
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def get_page_cache_stats() -> dict[str, int]:
+    stats = cache.get_many([HITS_KEY, MISSES_KEY, NOT_MODIFIED_KEY])
+    return {
+        "hits": stats.get(HITS_KEY, 0),
+        "misses": stats.get(MISSES_KEY, 0),
+        "not_modified": stats.get(NOT_MODIFIED_KEY, 0),
+    }
+
+
+def cache_public_page(
+    *model_classes: type[models.Model],
+    query_params: Iterable[str] = (),
+    get_published: Optional[Callable[[], Optional[datetime]]] = None,
+) -> Callable:
+    """Serve a public view from the shared cache and answer conditional GETs.
+
+    Pages are identified by the URL path, the listed query parameters, the
+    templates and static files they were rendered with and the content
+    versions of the models they depend on, which are bumped on every write
+    to these models (see oc_website.signals). The same
+    identifier is used as the cache key and as the ETag, so a matching
+    If-None-Match or If-Modified-Since costs no rendering, and a single
+    query. `get_published` lets pages showing scheduled content change
+    their identity once the next scheduled item goes live, at the cost of
+    a second query.
+    """
+    query_params = sorted(query_params)
+
+    def decorator(view: Callable[..., HttpResponse]) -> Callable:
+        @functools.wraps(view)
+        def wrapper(  # pylint: disable=too-many-locals
+            request: HttpRequest, *args: Any, **kwargs: Any
+        ) -> HttpResponse:
+            if request.method not in {"GET", "HEAD"}:
+                return view(request, *args, **kwargs)
+
+            versions, last_modified = get_content_versions(model_classes)
+            code_version, code_modified = get_code_version()
+            # a deploy changes the page without touching the content
+            last_modified = max(filter(None, [last_modified, code_modified]))
+            if get_published and (published := get_published()):
+                versions += f":{published.timestamp()}"
+                last_modified = max(filter(None, [last_modified, published]))
+            page_id = hashlib.md5(
+                "\n".join(
+                    [
+                        request.path,
+                        *(
+                            f"{param}={value}"
+                            for param in query_params
+                            for value in request.GET.getlist(param)
+                        ),
+                        versions,
+                        code_version,
+                    ]
+                ).encode()
+            ).hexdigest()
+            etag = f'W/"{page_id}"'
+            last_modified_timestamp = (
+                int(last_modified.timestamp()) if last_modified else None
+            )
+
+            def finalize(response: HttpResponse) -> HttpResponse:
+                response["ETag"] = etag
+                if last_modified_timestamp is not None:
+                    response["Last-Modified"] = http_date(
+                        last_modified_timestamp
+                    )
+                patch_cache_control(response, public=True, no_cache=True)
+                return response
+
+            if not_modified := get_conditional_response(
+                request, etag=etag, last_modified=last_modified_timestamp
+            ):
+                count(NOT_MODIFIED_KEY)
+                return finalize(not_modified)
+
+            key = f"page-cache:page:{page_id}"
+            if cached := cache.get(key):
+                count(HITS_KEY)
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return finalize(response)
+
+            count(MISSES_KEY)
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            cache.set(
+                key,
+                (response.content, response["Content-Type"]),
+                settings.PAGE_CACHE_TIMEOUT,
+            )
+            response["X-Cache"] = "MISS"
+            return finalize(response)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,202 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Any, Optional
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import F, Q, QuerySet
+from django.utils.dateparse import parse_date, parse_datetime
+
+COUNT_CACHE_TIMEOUT = 5 * 60
+
+
+def get_cached_count(queryset: QuerySet, key: Optional[str] = None) -> int:
+    """Return the row count of a queryset, recomputed at most every few
+    minutes. Meant for informational totals that can afford to lag.
+
+    The count is cached under the given key, or else under the SQL of the
+    queryset, which changes on every call for querysets that filter on the
+    current time; those need a key of their own.
+    """
+    if key is None:
+        key = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    return cache.get_or_set(
+        f"count:{key}", queryset.count, COUNT_CACHE_TIMEOUT
+    )
+
+
+class KeysetPage:
+    def __init__(
+        self,
+        object_list: list[Any],
+        next_cursor: Optional[str],
+        previous_cursor: Optional[str],
+        paginator: "KeysetPaginator",
+    ) -> None:
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate a queryset by seeking past the last seen (sort key, pk) pair
+    instead of using OFFSET, so that every page costs the same.
+
+    Pages are addressed with opaque cursors: `after` continues forward from
+    the given cursor, `before` goes back from it. An empty `before` cursor
+    yields the last page. NULL sort keys are treated as the smallest values.
+    """
+
+    def __init__(
+        self,
+        queryset: QuerySet,
+        per_page: int,
+        ordering: str,
+        count_key: Optional[str] = None,
+    ) -> None:
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_key = count_key
+        self.descending = ordering.startswith("-")
+        self.field = ordering.lstrip("-")
+
+    @property
+    def total_count(self) -> int:
+        return get_cached_count(self.queryset.order_by(), self.count_key)
+
+    def page(
+        self, after: Optional[str] = None, before: Optional[str] = None
+    ) -> KeysetPage:
+        backwards = before is not None
+        cursor = self.decode_cursor(before if backwards else after)
+        descending = self.descending != backwards
+
+        queryset = self.queryset.order_by(*self.get_order_by(descending))
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.get_seek_filter(cursor, descending)
+            )
+
+        object_list = list(queryset[: self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+        if backwards:
+            object_list.reverse()
+            has_next, has_previous = cursor is not None, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        return KeysetPage(
+            object_list=object_list,
+            next_cursor=(
+                self.encode_cursor(object_list[-1])
+                if has_next and object_list
+                else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(object_list[0])
+                if has_previous and object_list
+                else None
+            ),
+            paginator=self,
+        )
+
+    def get_order_by(self, descending: bool) -> list[Any]:
+        if descending:
+            return [F(self.field).desc(nulls_last=True), "-pk"]
+        return [F(self.field).asc(nulls_first=True), "pk"]
+
+    def get_seek_filter(self, cursor: tuple[Any, int], descending: bool) -> Q:
+        value, cursor_pk = cursor
+        is_null = Q(**{f"{self.field}__isnull": True})
+        if descending:
+            if value is None:
+                return is_null & Q(pk__lt=cursor_pk)
+            return (
+                Q(**{f"{self.field}__lt": value})
+                | Q(**{self.field: value}, pk__lt=cursor_pk)
+                | is_null
+            )
+        if value is None:
+            return (is_null & Q(pk__gt=cursor_pk)) | ~is_null
+        return Q(**{f"{self.field}__gt": value}) | Q(
+            **{self.field: value}, pk__gt=cursor_pk
+        )
+
+    def get_sort_value(self, obj: models.Model) -> Any:
+        for part in self.field.split("__"):
+            if obj is None:
+                break
+            obj = getattr(obj, part)
+        return obj
+
+    def get_sort_field(self) -> Optional[models.Field]:
+        model = self.queryset.model
+        field = None
+        for part in self.field.split("__"):
+            if model is None:
+                return None
+            try:
+                # pylint: disable=protected-access
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None  # an annotation
+            model = field.related_model
+        return field
+
+    def encode_cursor(self, obj: models.Model) -> str:
+        return base64.urlsafe_b64encode(
+            json.dumps(
+                [self.get_sort_value(obj), obj.pk], cls=DjangoJSONEncoder
+            ).encode()
+        ).decode()
+
+    def decode_cursor(
+        self, cursor: Optional[str]
+    ) -> Optional[tuple[Any, int]]:
+        if not cursor:
+            return None
+        try:
+            value, cursor_pk = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+        except (binascii.Error, ValueError, TypeError):
+            return None
+        if not isinstance(cursor_pk, int) or not isinstance(
+            value, (str, int, float, type(None))
+        ):
+            return None
+        field = self.get_sort_field()
+        if isinstance(value, str) and isinstance(
+            field, (models.DateTimeField, models.DateField)
+        ):
+            try:
+                value = (
+                    parse_datetime(value)
+                    if isinstance(field, models.DateTimeField)
+                    else parse_date(value)
+                )
+            except ValueError:
+                return None
+            if value is None:
+                return None
+        return value, cursor_pk
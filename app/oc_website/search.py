@@ -0,0 +1,102 @@
+import re
+from typing import Optional
+
+from django.db import connection
+from django.db.models import F, Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from oc_website.models import AniDBEntry, AnimeRequest
+
+# pylint: disable=protected-access
+ANIDB_ENTRY_TABLE = AniDBEntry._meta.db_table
+ANIME_REQUEST_TABLE = AnimeRequest._meta.db_table
+ANIDB_ENTRY_FTS_TABLE = f"{ANIDB_ENTRY_TABLE}_fts"
+
+# SQLite drops triggers together with their table, which happens whenever a
+# migration remakes the AniDB entry table, so these are idempotent and need to
+# be reapplied by such migrations.
+ANIDB_ENTRY_FTS_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ANIDB_ENTRY_FTS_TABLE}_insert
+    AFTER INSERT ON {ANIDB_ENTRY_TABLE} BEGIN
+        INSERT INTO {ANIDB_ENTRY_FTS_TABLE} (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ANIDB_ENTRY_FTS_TABLE}_delete
+    AFTER DELETE ON {ANIDB_ENTRY_TABLE} BEGIN
+        INSERT INTO {ANIDB_ENTRY_FTS_TABLE}
+            ({ANIDB_ENTRY_FTS_TABLE}, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {ANIDB_ENTRY_FTS_TABLE}_update
+    AFTER UPDATE ON {ANIDB_ENTRY_TABLE} BEGIN
+        INSERT INTO {ANIDB_ENTRY_FTS_TABLE}
+            ({ANIDB_ENTRY_FTS_TABLE}, rowid, title, type, synopsis)
+        VALUES ('delete', old.id, old.title, old.type, old.synopsis);
+        INSERT INTO {ANIDB_ENTRY_FTS_TABLE} (rowid, title, type, synopsis)
+        VALUES (new.id, new.title, new.type, new.synopsis);
+    END
+    """,
+]
+
+# weighs title, type and synopsis matches respectively
+ANIDB_ENTRY_FTS_RANK = f"bm25({ANIDB_ENTRY_FTS_TABLE}, 10.0, 2.0, 1.0)"
+
+ANIDB_ENTRY_FTS_REBUILD_SQL = (
+    f"INSERT INTO {ANIDB_ENTRY_FTS_TABLE} ({ANIDB_ENTRY_FTS_TABLE}) "
+    "VALUES ('rebuild')"
+)
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """Turn user input into an FTS5 query that matches all of its words as
+    prefixes."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_anime_requests(
+    queryset: QuerySet[AnimeRequest], text: str
+) -> QuerySet[AnimeRequest]:
+    """Filter anime requests by their AniDB entry title, type and synopsis,
+    ordered by relevance. Numeric input also matches the AniDB ID exactly."""
+    filter_arg = Q(pk__in=[])
+    if fts_query := build_fts_query(text):
+        filter_arg |= Q(
+            anidb_entry_id__in=RawSQL(
+                f"SELECT rowid FROM {ANIDB_ENTRY_FTS_TABLE} "
+                f"WHERE {ANIDB_ENTRY_FTS_TABLE} MATCH %s",
+                (fts_query,),
+            )
+        )
+        queryset = queryset.annotate(
+            search_rank=RawSQL(
+                f"SELECT {ANIDB_ENTRY_FTS_RANK} "
+                f"FROM {ANIDB_ENTRY_FTS_TABLE} "
+                f"WHERE {ANIDB_ENTRY_FTS_TABLE} MATCH %s "
+                f"AND rowid = {ANIME_REQUEST_TABLE}.anidb_entry_id",
+                (fts_query,),
+            )
+        )
+    else:
+        queryset = queryset.annotate(search_rank=RawSQL("NULL", ()))
+    try:
+        filter_arg |= Q(anidb_entry__anidb_id=int(text))
+    except ValueError:
+        pass
+    return queryset.filter(filter_arg).order_by(
+        F("search_rank").asc(nulls_first=True), "-request_date"
+    )
+
+
+def rebuild_anidb_entry_search_index() -> None:
+    with connection.cursor() as cursor:
+        for sql in ANIDB_ENTRY_FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(ANIDB_ENTRY_FTS_REBUILD_SQL)
@@ -126,6 +126,21 @@ STATIC_ROOT = BASE_DIR / "static"
 
 MEDIA_URL = "/uploads/"
 MEDIA_ROOT = BASE_DIR / "uploads"
+DEFAULT_FILE_STORAGE = "oc_website.storage.ContentAddressedStorage"
+# unreferenced blobs younger than this may belong to a row that is not
+# committed yet
+MEDIA_GC_GRACE_PERIOD = 24 * 60 * 60
+
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://redis:6379/1",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    }
+}
+PAGE_CACHE_TIMEOUT = 24 * 60 * 60
 
 CELERY_BROKER_URL = "redis://redis:6379"
 CELERY_RESULT_BACKEND = "redis://redis:6379"
@@ -147,9 +162,54 @@ NYAA_SI_PASS = get_setting("NYAA_SI_PASS")
 NYAA_SI_INFO = "https://oldcastle.moe"
 NYAA_SI_CATEGORY_ID = "1_2"
 
+# (connect, read) timeouts of the uploads to third-party sites; a site that
+# fails this many times in a row is not tried again until the cool down is
+# over
+PUBLISH_TIMEOUT = (10, 60)
+PUBLISH_BREAKER_THRESHOLD = 5
+PUBLISH_BREAKER_COOLDOWN = 10 * 60
+# how long publisher failures and metrics are kept
+PUBLISH_METRICS_TIMEOUT = 7 * 24 * 60 * 60
+# failed uploads are retried after about a minute, then two minutes and so
+# on, until they are given up on; a worker that does not finish an upload
+# within the lease is assumed to be gone
+PUBLISH_RETRY_BACKOFF = 60
+PUBLISH_RETRY_BACKOFF_MAX = 6 * 60 * 60
+PUBLISH_RETRY_JITTER = 0.5
+PUBLISH_MAX_ATTEMPTS = 10
+PUBLISH_LEASE = 10 * 60
+# the longest an upload may take, which has to be well within the lease
+PUBLISH_TIME_LIMIT = 5 * 60
+# scheduled releases are queued with an ETA once their publication date is
+# this close; further ahead, the broker would deliver them again after its
+# visibility timeout. The sweep that queues them runs more often than that.
+PUBLISH_SCHEDULE_HORIZON = 30 * 60
+
 ANIDB_CLIENT = get_setting("ANIDB_CLIENT")
 ANIDB_CLIENTVER = get_setting("ANIDB_CLIENTVER")
 ANIDB_CACHE_DIR = BASE_DIR / "cache" / "anidb"
+ANIDB_STORE_PATH = ANIDB_CACHE_DIR / "responses.sqlite3"
+# AniDB bans clients that make more than one API request every two seconds;
+# limits are shared by all workers
+ANIDB_API_RATE = 0.5
+ANIDB_API_BURST = 1
+ANIDB_IMAGE_RATE = 1.0
+ANIDB_IMAGE_BURST = 5
+ANIDB_TIMEOUT = (5, 30)
+ANIDB_BATCH_SIZE = 100
+# failed fetches are retried after 10 minutes, then 20 minutes and so on,
+# until the entry is given up on
+ANIDB_FETCH_BACKOFF = 10 * 60
+ANIDB_FETCH_BACKOFF_MAX = 7 * 24 * 60 * 60
+ANIDB_FETCH_MAX_ATTEMPTS = 10
+# entries are refreshed weekly while airing (and for a while afterwards, as
+# AniDB is corrected) and rarely after that; refreshes are spread over the
+# day and limited to a number of API requests a day
+ANIDB_REFRESH_AIRING = 7 * 24 * 60 * 60
+ANIDB_REFRESH_FINISHED = 180 * 24 * 60 * 60
+ANIDB_REFRESH_SETTLE = 30 * 24 * 60 * 60
+ANIDB_REFRESH_JITTER = 0.2
+ANIDB_REFRESH_DAILY_BUDGET = 200
 
 TORRENT_TRACKERS = [
     "http://anidex.moe:6969/announce",
@@ -157,6 +217,19 @@ TORRENT_TRACKERS = [
     "udp://tracker.uw0.xyz:6969",
 ]
 TORRENT_MAX_PIECE_SIZE = 4 * 1024 * 1024
+# piece hashing threads and the size of each read; the hashing holds up to
+# (workers + 2) reads in memory
+TORRENT_HASH_WORKERS = os.cpu_count()
+TORRENT_READ_SIZE = 16 * 1024 * 1024
+# hashes of pieces that lie entirely within one file, reused as long as the
+# file is unchanged
+TORRENT_PIECE_CACHE_PATH = BASE_DIR / "cache" / "torrent_pieces.sqlite3"
+# align every file of a batch to a piece boundary with BEP 47 pad files, so
+# that its pieces are the same as in the torrent of the episode alone
+TORRENT_PAD_FILES = False
+# build hybrid v1/v2 torrents (BEP 52), whose files are identified by their
+# merkle roots in every torrent they are part of; implies pad files
+TORRENT_HYBRID = False
 
 HOST_SITE = get_setting("HOST_SITE")
 FILE_UPLOAD_PERMISSIONS = 0o644
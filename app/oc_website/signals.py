@@ -0,0 +1,89 @@
+import functools
+from typing import Any, Optional
+
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from oc_website.images import IMAGE_FIELDS
+from oc_website.models import (
+    Comment,
+    FeaturedImage,
+    ImageDerivative,
+    Language,
+    News,
+    Project,
+    ProjectExternalLink,
+    ProjectRelease,
+    ProjectReleaseFile,
+    ProjectReleaseLink,
+    update_comment_count,
+)
+from oc_website.page_cache import invalidate_model
+from oc_website.tasks import generate_image_derivatives
+from oc_website.tasks.releases import schedule_release_publication
+
+PUBLIC_PAGE_MODELS = [
+    FeaturedImage,
+    ImageDerivative,
+    Language,
+    News,
+    Project,
+    ProjectExternalLink,
+    ProjectRelease,
+    ProjectReleaseFile,
+    ProjectReleaseLink,
+]
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_public_pages(
+    sender: type[models.Model], **_kwargs: Any
+) -> None:
+    if sender in PUBLIC_PAGE_MODELS:
+        invalidate_model(sender)
+
+
+@receiver(m2m_changed, sender=ProjectReleaseFile.languages.through)
+def invalidate_public_pages_on_release_file_languages_change(
+    **_kwargs: Any,
+) -> None:
+    invalidate_model(ProjectReleaseFile)
+
+
+@receiver(post_save, sender=ProjectRelease)
+def schedule_release_publication_on_save(
+    instance: ProjectRelease, **_kwargs: Any
+) -> None:
+    transaction.on_commit(
+        functools.partial(schedule_release_publication, instance)
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def update_comment_count_on_delete(instance: Comment, **_kwargs: Any) -> None:
+    # runs inside the deletion transaction, also for bulk and cascade deletes
+    update_comment_count(instance.target, -1)
+
+
+@receiver(post_save)
+def generate_image_derivatives_on_save(
+    sender: type[models.Model],
+    instance: models.Model,
+    update_fields: Optional[frozenset[str]],
+    **_kwargs: Any,
+) -> None:
+    for field_name in IMAGE_FIELDS.get(sender, []):
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        image = getattr(instance, field_name)
+        if (
+            image
+            and not ImageDerivative.objects.filter(
+                source_name=image.name
+            ).exists()
+        ):
+            transaction.on_commit(
+                functools.partial(generate_image_derivatives.delay, image.name)
+            )
@@ -0,0 +1,41 @@
+// Suggests anime by title on the request form and fills in the AniDB link
+(function() {
+  var search = document.getElementById("anime_title");
+  var suggestions = document.getElementById("anime_title_suggestions");
+  var anidbUrl = document.getElementById("anidb_url");
+  var urls = {};
+  var timer;
+
+  function update() {
+    var query = search.value;
+    if (urls[query]) {
+      anidbUrl.value = urls[query];
+      return;
+    }
+    fetch(search.dataset.url + "?q=" + encodeURIComponent(query))
+      .then(function(response) {
+        return response.json();
+      })
+      .then(function(results) {
+        if (search.value !== query) {
+          return;
+        }
+        suggestions.innerHTML = "";
+        urls = {};
+        results.forEach(function(result) {
+          var option = document.createElement("option");
+          option.value =
+            result.match === result.title
+              ? result.title
+              : result.match + " (" + result.title + ")";
+          urls[option.value] = result.url;
+          suggestions.appendChild(option);
+        });
+      });
+  }
+
+  search.addEventListener("input", function() {
+    clearTimeout(timer);
+    timer = setTimeout(update, 200);
+  });
+})();
@@ -0,0 +1,115 @@
+import contextlib
+import hashlib
+import os
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import Iterator, Optional
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+BLOB_DIR = "blobs"
+
+
+def get_blob_name(digest: str, suffix: str) -> str:
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{suffix.lower()}"
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_fields() -> Iterator[tuple[type[models.Model], str]]:
+    for model in apps.get_models():
+        # pylint: disable=protected-access
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field.name
+
+
+def get_referenced_names() -> set[str]:
+    names: set[str] = set()
+    for model, field_name in get_file_fields():
+        names.update(
+            model.objects.exclude(**{field_name: ""})
+            .exclude(**{f"{field_name}__isnull": True})
+            .values_list(field_name, flat=True)
+        )
+    return names
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores every file under the hash of its content, so that saving the
+    same bytes again, from any model, reuses the existing file.
+
+    The requested name only contributes its extension, which browsers and
+    the web server need. Since a blob can be shared by any number of rows,
+    deleting through the storage does nothing; unreferenced blobs are
+    removed by the gc_media command instead.
+    """
+
+    def _save(self, name: str, content: File) -> str:
+        suffix = PurePosixPath(name).suffix
+        tmp_dir = Path(self.path(BLOB_DIR))
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        # hash and copy in a single pass over the content
+        digest = hashlib.sha256()
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".tmp")
+        try:
+            with os.fdopen(tmp_fd, "wb") as handle:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    handle.write(chunk)
+            blob_name = get_blob_name(digest.hexdigest(), suffix)
+            blob_path = Path(self.path(blob_name))
+            if blob_path.exists():
+                # keeps the blob out of reach of gc_media until the row that
+                # now refers to it is committed
+                blob_path.touch()
+            else:
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                # temporary files are only readable by their owner
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                # atomic, and harmless if another process got there first
+                os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return blob_name
+
+    def get_available_name(
+        self, name: str, max_length: Optional[int] = None
+    ) -> str:
+        # the final name is only known once the content is hashed
+        return name
+
+    def delete(self, name: str) -> None:
+        pass
+
+    def link(self, path: Path) -> str:
+        """Add a file that already lives on the same file system as a blob,
+        hard-linking it rather than copying."""
+        blob_name = get_blob_name(hash_file(path), path.suffix)
+        blob_path = Path(self.path(blob_name))
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            with contextlib.suppress(FileExistsError):
+                os.link(path, blob_path)
+        return blob_name
+
+    def iter_blobs(self) -> Iterator[str]:
+        root = Path(self.path(BLOB_DIR))
+        if not root.exists():
+            return
+        for path in root.glob("*/*"):
+            yield path.relative_to(self.location).as_posix()
+
+    def remove_blob(self, name: str) -> None:
+        super().delete(name)
@@ -4,18 +4,39 @@ from celery import Celery
 from celery.schedules import crontab
 
 from oc_website.celery import app
-from oc_website.tasks.anidb import fill_missing_anidb_info
-from oc_website.tasks.releases import publish_due_releases, publish_release
+from oc_website.tasks.anidb import (
+    fill_missing_anidb_info,
+    refresh_anidb_entries,
+    refresh_anidb_titles,
+)
+from oc_website.tasks.images import generate_image_derivatives
+from oc_website.tasks.releases import (
+    process_publish_attempts,
+    publish_due_releases,
+    publish_release,
+)
 
 
 @app.on_after_finalize.connect
 def setup_periodic_tasks(sender: Celery, **_kwargs: Any) -> None:
-    sender.add_periodic_task(crontab(), publish_due_releases.s())
+    # releases are queued for their publication date when it is saved; this
+    # is only a safety net
+    sender.add_periodic_task(crontab(minute="*/15"), publish_due_releases.s())
+    sender.add_periodic_task(crontab(), process_publish_attempts.s())
     sender.add_periodic_task(crontab(), fill_missing_anidb_info.s())
+    sender.add_periodic_task(crontab(minute="*/5"), refresh_anidb_entries.s())
+    # AniDB regenerates the title dump daily and bans more frequent downloads
+    sender.add_periodic_task(
+        crontab(hour=4, minute=30), refresh_anidb_titles.s()
+    )
 
 
 __all__ = [
     "fill_missing_anidb_info",
+    "generate_image_derivatives",
+    "process_publish_attempts",
     "publish_due_releases",
     "publish_release",
+    "refresh_anidb_entries",
+    "refresh_anidb_titles",
 ]
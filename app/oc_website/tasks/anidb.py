@@ -1,14 +1,119 @@
+import logging
+import math
 from typing import Optional
+from xml.etree import ElementTree
 
-from oc_website.anidb import fill_anidb_entry
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from oc_website.anidb import (
+    fill_anidb_entry,
+    get_refresh_delay,
+    get_refresh_interval,
+    update_anidb_titles,
+)
+from oc_website.anidb_client import AniDBError, RateLimited
 from oc_website.celery import app
 from oc_website.models import AniDBEntry
+from oc_website.taxonomies import AniDBFetchStatus
+
+DRAIN_SCHEDULED_KEY = "anidb:drain-scheduled"
+REFRESH_BUDGET_KEY = "anidb:refresh-budget:{date}"
+# how often refresh_anidb_entries runs; see setup_periodic_tasks
+REFRESH_TICKS_PER_DAY = 24 * 12
+
+
+def schedule_drain(countdown: float) -> None:
+    """Continue filling entries once AniDB lets us make requests again,
+    unless another worker already arranged for it."""
+    if cache.add(DRAIN_SCHEDULED_KEY, 1, timeout=math.ceil(countdown)):
+        fill_missing_anidb_info.apply_async(countdown=countdown)
 
 
 @app.task
 def fill_missing_anidb_info(anidb_id: Optional[int] = None) -> None:
-    queryset = AniDBEntry.objects.filter(title__isnull=True)
-    if anidb_id is not None:
-        queryset = queryset.filter(anidb_id=anidb_id)
-    for anidb_entry in queryset.all():
-        fill_anidb_entry(anidb_entry.anidb_id)
+    if anidb_id is None:
+        queryset = AniDBEntry.objects.due()
+    else:
+        # explicitly requested entries are fetched regardless of the backoff
+        queryset = AniDBEntry.objects.filter(anidb_id=anidb_id).exclude(
+            fetch_status=AniDBFetchStatus.DONE.value
+        )
+    for anidb_entry in queryset[: settings.ANIDB_BATCH_SIZE]:
+        try:
+            fill_anidb_entry(anidb_entry.anidb_id)
+        except RateLimited as exc:
+            schedule_drain(exc.retry_after)
+            return
+        except (
+            AniDBError,
+            ElementTree.ParseError,
+            requests.RequestException,
+            ValueError,
+        ) as exc:
+            logging.warning(
+                "anidb: failed to fetch %d: %s", anidb_entry.anidb_id, exc
+            )
+            anidb_entry.record_fetch_failure(str(exc))
+
+
+def get_refresh_budget_key() -> str:
+    return REFRESH_BUDGET_KEY.format(date=timezone.now().date())
+
+
+def has_refresh_budget() -> bool:
+    """Whether today's budget allows another refresh."""
+    return (
+        cache.get(get_refresh_budget_key(), 0)
+        < settings.ANIDB_REFRESH_DAILY_BUDGET
+    )
+
+
+def take_refresh_budget() -> None:
+    """Count a refresh against today's budget."""
+    key = get_refresh_budget_key()
+    cache.add(key, 0, timeout=2 * 24 * 60 * 60)
+    cache.incr(key)
+
+
+@app.task
+def refresh_anidb_entries() -> None:
+    """Refresh a few stale entries on every run, so that the daily budget is
+    spread over the day instead of spent at once. Only requests that are
+    actually sent to AniDB count against the budget."""
+    limit = math.ceil(
+        settings.ANIDB_REFRESH_DAILY_BUDGET / REFRESH_TICKS_PER_DAY
+    )
+    for anidb_entry in AniDBEntry.objects.refresh_due()[:limit]:
+        if not has_refresh_budget():
+            return
+        try:
+            # the entry came due after its jittered delay, so the stored
+            # response is at least that old and gets fetched again
+            fill_anidb_entry(
+                anidb_entry.anidb_id,
+                max_age=get_refresh_delay(
+                    anidb_entry.anidb_id,
+                    get_refresh_interval(anidb_entry.end_date),
+                ),
+                on_request=take_refresh_budget,
+            )
+        except RateLimited:
+            return
+        except (
+            AniDBError,
+            ElementTree.ParseError,
+            requests.RequestException,
+            ValueError,
+        ) as exc:
+            logging.warning(
+                "anidb: failed to refresh %d: %s", anidb_entry.anidb_id, exc
+            )
+            anidb_entry.postpone_refresh(str(exc))
+
+
+@app.task
+def refresh_anidb_titles() -> None:
+    logging.info("anidb: imported %d titles", update_anidb_titles())
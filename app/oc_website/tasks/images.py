@@ -0,0 +1,12 @@
+import logging
+
+from oc_website.celery import app
+from oc_website.images import generate_derivatives
+
+
+@app.task
+def generate_image_derivatives(name: str) -> None:
+    derivatives = generate_derivatives(name)
+    logging.info(
+        "images: created %d derivatives of %s", len(derivatives), name
+    )
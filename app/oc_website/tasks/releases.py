@@ -1,17 +1,102 @@
+import functools
 import json
+import logging
 import os
+import time
 from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Iterator, Optional, cast
 
 import requests
 import torf
-import tqdm
+from celery import Task
+from celery.result import AsyncResult
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet
 from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
 from oc_website.celery import app
-from oc_website.models import ProjectRelease, ProjectReleaseLink
+from oc_website.circuit_breaker import CircuitBreaker, CircuitOpen
+from oc_website.models import (
+    ProjectRelease,
+    ProjectReleaseLink,
+    PublishAttempt,
+)
+from oc_website.torrents import (
+    PieceHasher,
+    ProgressCallback,
+    bencode,
+    get_file_tree,
+    get_magnet,
+    get_padded_files,
+    get_piece_cache,
+    get_piece_size,
+    get_pieces_roots,
+)
+
+# how often publish_due_releases runs
+PUBLICATION_SWEEP_INTERVAL = timedelta(minutes=15)
+PUBLISHER_METRICS = ["calls", "success", "failure", "skipped", "latency_ms"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """A session shared by all publishers of a worker, which keeps the
+    connections to the sites open between releases."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=4))
+    session.mount("http://", HTTPAdapter(pool_maxsize=4))
+    return session
+
+
+def is_site_failure(exc: Exception) -> bool:
+    """Whether an error means that a site is down, as opposed to refusing a
+    particular upload."""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def get_publisher_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        f"publisher:{name}",
+        threshold=settings.PUBLISH_BREAKER_THRESHOLD,
+        cooldown=settings.PUBLISH_BREAKER_COOLDOWN,
+        memory=settings.PUBLISH_METRICS_TIMEOUT,
+    )
+
+
+def get_publisher_metrics_key(name: str, metric: str) -> str:
+    return f"publisher-metrics:{name}:{metric}"
+
+
+def record_publisher_metrics(name: str, outcome: str, elapsed: float) -> None:
+    """Count the outcomes of a publisher's calls and add up their latency
+    (in milliseconds, as the cache only increments integers)."""
+    for metric, value in [
+        (outcome, 1),
+        ("calls", 1),
+        ("latency_ms", round(elapsed * 1000)),
+    ]:
+        key = get_publisher_metrics_key(name, metric)
+        if not cache.add(key, value, timeout=settings.PUBLISH_METRICS_TIMEOUT):
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                pass
+    logging.info("publishing: %s %s in %.1fs", name, outcome, elapsed)
+
+
+def get_publisher_metrics(name: str) -> dict[str, int]:
+    keys = {
+        metric: get_publisher_metrics_key(name, metric)
+        for metric in PUBLISHER_METRICS
+    }
+    values = cache.get_many(keys.values())
+    return {metric: int(values.get(key, 0)) for metric, key in keys.items()}
 
 
 class BasePublisher:
@@ -47,8 +132,11 @@ class AnidexPublisher(BasePublisher):
                 )
                 return None
 
-            response = requests.post(
-                settings.ANIDEX_API_URL, data=data, files=files
+            response = get_http_session().post(
+                settings.ANIDEX_API_URL,
+                data=data,
+                files=files,
+                timeout=settings.PUBLISH_TIMEOUT,
             )
 
         response.raise_for_status()
@@ -88,11 +176,12 @@ class NyaaSiPublisher(BasePublisher):
                 )
                 return None
 
-            response = requests.post(
+            response = get_http_session().post(
                 settings.NYAA_SI_API_URL,
                 auth=(settings.NYAA_SI_USER, settings.NYAA_SI_PASS),
                 data=data,
                 files=files,
+                timeout=settings.PUBLISH_TIMEOUT,
             )
 
         response.raise_for_status()
@@ -136,31 +225,104 @@ def chdir(path: Path) -> Iterator[None]:
     os.chdir(old_dir)
 
 
-def build_torrent_file(data_path: Path, torrent_path: Path) -> torf.Torrent:
+def new_torrent(
+    data_path: Path, pad_files: bool, hybrid: bool
+) -> tuple[torf.Torrent, bool]:
+    """A torrent of the release at data_path, with its piece size set, and
+    whether its files get padded to piece boundaries. Has to run in
+    DATA_DIR."""
     torrent = torf.Torrent(
         path=data_path.relative_to(settings.DATA_DIR),
         trackers=settings.TORRENT_TRACKERS,
     )
-    torrent.piece_size = min(
-        torrent.piece_size, settings.TORRENT_MAX_PIECE_SIZE
+    # v2 needs every file to start on a piece boundary
+    pad_files = (pad_files or hybrid) and torrent.mode == "multifile"
+    # with every file starting on a piece boundary, the pieces of an episode
+    # only match those of its own torrent at the same piece size
+    torrent.piece_size = get_piece_size(
+        max(file.size for file in torrent.files) if pad_files else torrent.size
     )
+    if hybrid and torrent.mode == "multifile":
+        # the v1 files have to be in the order of the v2 file tree
+        torrent.metainfo["info"]["files"].sort(
+            key=lambda file: [part.encode() for part in file["path"]]
+        )
+    return torrent, pad_files
+
+
+def get_torrent_filepaths(torrent: torf.Torrent) -> list[Path]:
+    """The files of a torrent, in the order of its pieces."""
+    if torrent.mode == "singlefile":
+        return [Path(torrent.path)]
+    return [
+        Path(torrent.path, *file["path"])
+        for file in torrent.metainfo["info"]["files"]
+    ]
+
+
+def build_torrent_file(
+    data_path: Path,
+    torrent_path: Path,
+    progress: Optional[ProgressCallback] = None,
+    pad_files: Optional[bool] = None,
+    hybrid: Optional[bool] = None,
+) -> torf.Torrent:
+    if pad_files is None:
+        pad_files = settings.TORRENT_PAD_FILES
+    if hybrid is None:
+        hybrid = settings.TORRENT_HYBRID
+    torrent, pad_files = new_torrent(data_path, pad_files, hybrid)
+
+    files = []
+    if torrent.mode == "multifile":
+        files = torrent.metainfo["info"]["files"]
+    filepaths = get_torrent_filepaths(torrent)
+    hasher = PieceHasher(
+        torrent.piece_size,
+        progress=progress,
+        cache=get_piece_cache(),
+        v2=hybrid,
+    )
+    pieces = hasher.hash_files(filepaths, pad_files=pad_files)
+
+    info = torrent.metainfo["info"]
+    if pad_files:
+        # torf would look for the pad files on disk
+        torrent.path = None
+        info["files"] = get_padded_files(files, hasher.spans)
+    info["pieces"] = pieces
+
+    if not hybrid:
+        torrent.write(torrent_path, overwrite=True)
+        return torrent
+
+    info["meta version"] = 2
+    if torrent.mode == "singlefile":
+        files = [{"length": info["length"], "path": [info["name"]]}]
+    info["file tree"] = get_file_tree(
+        files, [hasher.pieces_roots.get(filepath) for filepath in filepaths]
+    )
+    torrent.validate()
+    metainfo = torrent.convert()
+    # torf only takes text keys, while the piece layers are keyed by hash
+    metainfo[b"piece layers"] = hasher.piece_layers
+    torrent_path.write_bytes(bencode(metainfo))
+    return torrent
 
-    with tqdm.tqdm(total=9e9) as progress_bar:
 
-        def callback(
-            _torrent: Any,
-            filepath: Path,
-            pieces_done: int,
-            pieces_total: int,
-        ) -> None:
-            progress_bar.set_description(str(filepath))
-            progress_bar.update(pieces_done - progress_bar.n)
-            progress_bar.total = pieces_total
+def get_build_progress_key(release_id: int) -> str:
+    return f"release-build-task:{release_id}"
 
-        torrent.generate(callback=callback)
 
-    torrent.write(torrent_path, overwrite=True)
-    return torrent
+def get_build_progress(release_id: int) -> Optional[dict[str, Any]]:
+    """Progress of the torrent currently being built for a release, as
+    published by publish_release."""
+    if not (task_id := cache.get(get_build_progress_key(release_id))):
+        return None
+    result = AsyncResult(task_id, app=app)
+    if result.state != "PROGRESS":
+        return None
+    return cast(dict[str, Any], result.info)
 
 
 def add_or_update_release_link(
@@ -174,47 +336,204 @@ def add_or_update_release_link(
     return link
 
 
+def save_pieces_roots(release: ProjectRelease, torrent: torf.Torrent) -> None:
+    """Keep the v2 merkle roots of the release files, which identify them
+    across every torrent they are part of."""
+    prefix = Path(release.filename or "").parent
+    roots = {
+        (prefix / path).as_posix(): root
+        for path, root in get_pieces_roots(torrent).items()
+    }
+    for release_file in release.files.all():
+        root = roots.get(Path(release_file.file_name).as_posix())
+        if root and release_file.pieces_root != root.hex():
+            release_file.pieces_root = root.hex()
+            release_file.save()
+
+
+def schedule_release_publication(
+    release: ProjectRelease, requeue: bool = False
+) -> None:
+    """Queue publish_release for the scheduled publication date of a
+    release once that date is near enough, revoking the task queued for an
+    earlier date."""
+    eta = None if release.is_visible else release.scheduled_publication_date
+    horizon = timezone.now() + timedelta(
+        seconds=settings.PUBLISH_SCHEDULE_HORIZON
+    )
+    if eta is not None and eta > horizon:
+        eta = None
+    if not requeue and eta == release.publication_task_eta:
+        return
+
+    if release.publication_task_id:
+        app.control.revoke(release.publication_task_id)
+    task_id = None
+    if eta is not None:
+        task_id = publish_release.apply_async(
+            (release.pk,),
+            dict(dry_run=False, scheduled_for=eta.isoformat()),
+            eta=eta,
+        ).id
+    # no signals, as this runs from one
+    ProjectRelease.objects.filter(pk=release.pk).update(
+        publication_task_id=task_id, publication_task_eta=eta
+    )
+    release.publication_task_id = task_id
+    release.publication_task_eta = eta
+
+
+def unschedule_release_publications(queryset: QuerySet) -> None:
+    """Revoke the publication tasks of releases, for changes that do not
+    go through save()."""
+    for task_id in queryset.exclude(publication_task_id=None).values_list(
+        "publication_task_id", flat=True
+    ):
+        app.control.revoke(task_id)
+    queryset.update(publication_task_id=None, publication_task_eta=None)
+
+
 @app.task
 def publish_due_releases() -> None:
-    for release in ProjectRelease.objects.filter(
-        scheduled_publication_date__lte=timezone.now(), is_visible=False
-    ).all():
-        publish_release.delay(release.pk, dry_run=False)
+    """Queue the publications that will soon be due. Releases are queued
+    when their publication date is saved already, so this only picks up
+    those that were scheduled further ahead, and those whose task got lost
+    on the way."""
+    now = timezone.now()
+    horizon = now + timedelta(seconds=settings.PUBLISH_SCHEDULE_HORIZON)
+    for release in ProjectRelease.objects.scheduled(horizon):
+        schedule_release_publication(
+            release,
+            requeue=(
+                release.scheduled_publication_date
+                < now - PUBLICATION_SWEEP_INTERVAL
+            ),
+        )
 
 
-@app.task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 10})
-def publish_release_to_third_party(
-    publisher_cls_name: str, release_id: int, dry_run: bool
-) -> None:
+def get_publisher(publisher_cls_name: str) -> BasePublisher:
     for publisher_cls in BasePublisher.__subclasses__():
         if publisher_cls.name == publisher_cls_name:
-            publisher = publisher_cls()
-            break
-    else:
-        raise RuntimeError(
-            f"invalid publisher class name: {publisher_cls_name}"
-        )
+            return publisher_cls()
+    raise RuntimeError(f"invalid publisher class name: {publisher_cls_name}")
 
-    release = ProjectRelease.objects.get(pk=release_id)
-    if release.links.filter(url__contains=publisher.name).exists():
-        return
 
+def run_publisher(
+    publisher: BasePublisher, release: ProjectRelease, dry_run: bool
+) -> None:
+    """Upload a release through a publisher, unless its circuit breaker is
+    open, and link to the result."""
     data_path = settings.DATA_DIR / release.filename
     torrent_path = settings.TORRENTS_DIR / get_torrent_name(data_path)
 
-    url = publisher.publish(torrent_path, data_path, dry_run=dry_run)
+    breaker = get_publisher_breaker(publisher.name)
+    breaker.check()
+
+    start = time.monotonic()
+    try:
+        url = publisher.publish(torrent_path, data_path, dry_run=dry_run)
+    except Exception as exc:
+        record_publisher_metrics(
+            publisher.name, "failure", time.monotonic() - start
+        )
+        if is_site_failure(exc):
+            breaker.record_failure()
+        raise
+    record_publisher_metrics(
+        publisher.name, "success", time.monotonic() - start
+    )
+    breaker.record_success()
     if not url:
         return
     add_or_update_release_link(release=release, url=url, search=publisher.name)
 
 
+# killed before its lease runs out, so that no other worker can take the
+# attempt over while it is still uploading
+@app.task(
+    soft_time_limit=settings.PUBLISH_TIME_LIMIT,
+    time_limit=settings.PUBLISH_TIME_LIMIT + 30,
+)
+def publish_release_to_third_party(
+    publisher_cls_name: str, release_id: int, dry_run: bool
+) -> None:
+    publisher = get_publisher(publisher_cls_name)
+    release = ProjectRelease.objects.get(pk=release_id)
+    if dry_run:
+        run_publisher(publisher, release, dry_run=True)
+        return
+
+    attempt, _is_created = PublishAttempt.objects.get_or_create(
+        release=release, publisher=publisher.name
+    )
+    # makes sure that no other worker is uploading the same release, which
+    # the sites would accept twice
+    if not attempt.lease():
+        return
+    # published before the attempts were kept track of
+    if release.links.filter(url__contains=publisher.name).exists():
+        attempt.record_success()
+        return
+
+    try:
+        run_publisher(publisher, release, dry_run=False)
+    except CircuitOpen as exc:
+        record_publisher_metrics(publisher.name, "skipped", 0)
+        is_recorded = attempt.postpone(exc.retry_after, str(exc))
+    except Exception as exc:  # pylint: disable=broad-except
+        logging.warning(
+            "publishing: %s to %s failed: %s", release, publisher.name, exc
+        )
+        is_recorded = attempt.record_failure(str(exc))
+    else:
+        is_recorded = attempt.record_success()
+    if not is_recorded:
+        logging.warning("publishing: lease on %s ran out", attempt)
+
+
 @app.task
-def publish_release(release_id: int, dry_run: bool) -> None:
+def process_publish_attempts() -> None:
+    """Make the publish attempts that are due: retries, and those that
+    were never made or whose worker went away."""
+    for attempt in PublishAttempt.objects.due():
+        publish_release_to_third_party.delay(
+            publisher_cls_name=attempt.publisher,
+            release_id=attempt.release_id,
+            dry_run=False,
+        )
+
+
+@app.task(bind=True)
+def publish_release(
+    self: Task,
+    release_id: int,
+    dry_run: bool,
+    scheduled_for: Optional[str] = None,
+) -> None:
+    if scheduled_for is not None and not ProjectRelease.objects.filter(
+        pk=release_id,
+        scheduled_publication_date=datetime.fromisoformat(scheduled_for),
+        is_visible=False,
+    ).update(
+        scheduled_publication_date=None,
+        publication_task_id=None,
+        publication_task_eta=None,
+    ):
+        # published or rescheduled since it was queued
+        logging.info(
+            "publishing: release %d is no longer due at %s",
+            release_id,
+            scheduled_for,
+        )
+        return
+
     release = ProjectRelease.objects.get(pk=release_id)
 
     if not dry_run:
-        # don't let scheduler pick it up again in its next run
+        # don't let the scheduler pick it up again
         release.scheduled_publication_date = None
+        release.publication_task_id = None
+        release.publication_task_eta = None
         release.save()
 
     if not release.filename:
@@ -224,18 +543,49 @@ def publish_release(release_id: int, dry_run: bool) -> None:
     torrent_path = settings.TORRENTS_DIR / get_torrent_name(data_path)
 
     if not torrent_path.exists():
+        last_update = 0.0
+
+        def progress(hashed_size: int, total_size: int) -> None:
+            nonlocal last_update
+            if self.request.is_eager or not self.request.id:
+                return
+            if time.monotonic() - last_update < 1:
+                return
+            last_update = time.monotonic()
+            self.update_state(
+                state="PROGRESS",
+                meta=dict(
+                    file=release.filename,
+                    hashed_size=hashed_size,
+                    total_size=total_size,
+                ),
+            )
+
+        if self.request.id:
+            cache.set(
+                get_build_progress_key(release_id),
+                self.request.id,
+                timeout=settings.CELERY_TASK_TIME_LIMIT,
+            )
         with chdir(settings.DATA_DIR):
-            torrent = build_torrent_file(data_path, torrent_path)
+            torrent = build_torrent_file(data_path, torrent_path, progress)
 
             add_or_update_release_link(
-                release=release, url=str(torrent.magnet()), search="magnet"
+                release=release, url=get_magnet(torrent), search="magnet"
             )
+            save_pieces_roots(release, torrent)
 
             (
                 settings.TRANSMISSION_WATCHDIR / get_torrent_name(data_path)
             ).write_bytes(torrent_path.read_bytes())
 
     for publisher_cls in BasePublisher.__subclasses__():
+        if not dry_run:
+            # recorded before anything is queued, so that an attempt cannot
+            # get lost on the way
+            PublishAttempt.objects.get_or_create(
+                release=release, publisher=publisher_cls.name
+            )
         publish_release_to_third_party.delay(
             publisher_cls_name=publisher_cls.name,
             release_id=release_id,
@@ -10,3 +10,30 @@ class StringChoiceEnum(Enum):
 class ProjectStatus(StringChoiceEnum):
     ACTIVE = "active"
     FINISHED = "finished"
+
+
+class AniDBFetchStatus(StringChoiceEnum):
+    PENDING = "pending"
+    FAILED = "failed"
+    DONE = "done"
+    DEAD = "dead"
+
+
+class PublishAttemptState(StringChoiceEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    DONE = "done"
+    DEAD = "dead"
+
+
+class AniDBTitleType(StringChoiceEnum):
+    MAIN = "main"
+    OFFICIAL = "official"
+    SYNONYM = "syn"
+
+
+class ImageFormat(StringChoiceEnum):
+    JPEG = "jpeg"
+    PNG = "png"
+    WEBP = "webp"
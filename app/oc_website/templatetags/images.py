@@ -0,0 +1,90 @@
+import mimetypes
+from typing import Any
+
+from django import template
+from django.db.models.fields.files import FieldFile
+from django.utils.html import format_html, format_html_join
+
+from oc_website.images import get_derivatives
+from oc_website.models import ImageDerivative
+from oc_website.taxonomies import ImageFormat
+
+register = template.Library()
+
+
+def get_srcset(candidates: list[tuple[str, int]]) -> str:
+    return ", ".join(f"{url} {width}w" for url, width in candidates)
+
+
+@register.inclusion_tag("snippets/picture.html")
+def picture(
+    image: FieldFile,
+    alt: str,
+    sizes: str = "100vw",
+    lazy: bool = False,
+    element_id: str = "",
+) -> dict[str, Any]:
+    """Render an image with WebP and downscaled variants for browsers to
+    choose from, or just the original if it was not processed yet."""
+    context: dict[str, Any] = dict(
+        url=image.url if image else "",
+        alt=alt,
+        sizes=sizes,
+        lazy=lazy,
+        element_id=element_id,
+    )
+    derivatives: list[ImageDerivative] = (
+        get_derivatives(image) if image else []
+    )
+    webp = [
+        (derivative.file.url, derivative.width)
+        for derivative in derivatives
+        if derivative.format == ImageFormat.WEBP.value
+    ]
+    fallback = [
+        (derivative.file.url, derivative.width)
+        for derivative in derivatives
+        if derivative.format != ImageFormat.WEBP.value
+    ]
+    if webp:
+        context["webp_srcset"] = get_srcset(webp)
+    if fallback:
+        # the widest WebP copy has the size of the original
+        context["fallback_srcset"] = get_srcset(
+            [*fallback, (image.url, webp[-1][1])]
+        )
+    return context
+
+
+@register.simple_tag
+def image_url(
+    image: FieldFile, min_width: int, image_format: str = "webp"
+) -> str:
+    """The URL of the smallest variant at least as wide as requested."""
+    if not image:
+        return ""
+    for derivative in get_derivatives(image):
+        if derivative.format == image_format and derivative.width >= min_width:
+            return derivative.file.url
+    return image.url
+
+
+@register.simple_tag
+def image_set(image: FieldFile, min_width: int) -> str:
+    """A CSS image-set() offering the smallest WebP variant at least as wide
+    as requested, and the original for browsers without WebP support."""
+    if not image:
+        return ""
+    candidates = [image_url(image, min_width), image.url]
+    return format_html(
+        "image-set({})",
+        format_html_join(
+            ", ",
+            'url("{}") type("{}")',
+            [
+                (url, mimetypes.guess_type(url)[0] or "image/jpeg")
+                # without derivatives, the original is the only candidate
+                for url in dict.fromkeys(candidates)
+            ],
+        ),
+    )
@@ -1,12 +1,51 @@
+from collections.abc import Iterable
+from pathlib import Path
+
 import pytest
+from django.core.cache import cache
+from django.test import override_settings
 from pytest_factoryboy import register
 
-from oc_website.tests.factories import ProjectFactory, ProjectReleaseFactory
+from oc_website.tests.factories import (
+    AniDBEntryFactory,
+    AnimeRequestFactory,
+    CommentFactory,
+    LanguageFactory,
+    ProjectFactory,
+    ProjectReleaseFactory,
+    ProjectReleaseFileFactory,
+    ProjectReleaseLinkFactory,
+)
 
+register(AniDBEntryFactory)
+register(AnimeRequestFactory)
+register(CommentFactory)
+register(LanguageFactory)
 register(ProjectReleaseFactory)
+register(ProjectReleaseFileFactory)
+register(ProjectReleaseLinkFactory)
 register(ProjectFactory)
 
 
 @pytest.fixture(scope="session")
 def celery_config() -> dict[str, str]:
     return {"broker_url": "amqp://", "result_backend": "redis://"}
+
+
+@pytest.fixture(name="local_cache", autouse=True)
+def fixture_local_cache() -> Iterable[None]:
+    with override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            }
+        }
+    ):
+        yield
+        cache.clear()
+
+
+@pytest.fixture(name="media_root", autouse=True)
+def fixture_media_root(tmp_path: Path) -> Iterable[Path]:
+    with override_settings(MEDIA_ROOT=tmp_path):
+        yield tmp_path
@@ -1,12 +1,50 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import factory
 from factory.fuzzy import FuzzyDateTime
 
-from oc_website.models import Project, ProjectRelease
+from oc_website.models import (
+    AniDBEntry,
+    AnimeRequest,
+    Comment,
+    Language,
+    Project,
+    ProjectRelease,
+    ProjectReleaseFile,
+    ProjectReleaseLink,
+)
+from oc_website.taxonomies import ProjectStatus
+
+
+class AniDBEntryFactory(factory.django.DjangoModelFactory):
+    anidb_id = factory.Sequence(lambda n: n + 1)
+
+    class Meta:
+        model = AniDBEntry
+
+
+class AnimeRequestFactory(factory.django.DjangoModelFactory):
+    anidb_entry = factory.SubFactory(AniDBEntryFactory)
+    request_date = FuzzyDateTime(datetime(2019, 6, 1, tzinfo=timezone.utc))
+
+    class Meta:
+        model = AnimeRequest
+
+
+class LanguageFactory(factory.django.DjangoModelFactory):
+    name = factory.Iterator(["en", "pl", "ro", "nl"])
+
+    class Meta:
+        model = Language
 
 
 class ProjectFactory(factory.django.DjangoModelFactory):
+    title = factory.Sequence(lambda n: f"Project {n}")
+    slug = factory.Sequence(lambda n: f"project-{n}")
+    status = ProjectStatus.ACTIVE.value
+    big_image = "projects/big/cover.jpg"
+    small_image = "projects/small/cover.jpg"
+
     class Meta:
         model = Project
 
@@ -17,3 +55,34 @@ class ProjectReleaseFactory(factory.django.DjangoModelFactory):
 
     class Meta:
         model = ProjectRelease
+
+
+class ProjectReleaseFileFactory(factory.django.DjangoModelFactory):
+    release = factory.SubFactory(ProjectReleaseFactory)
+    file_name = factory.Sequence(
+        lambda n: f"[OC] Project - {n:02d} [ABCD1{n:03d}].mkv"
+    )
+    file_version = 1
+
+    class Meta:
+        model = ProjectReleaseFile
+
+
+class ProjectReleaseLinkFactory(factory.django.DjangoModelFactory):
+    release = factory.SubFactory(ProjectReleaseFactory)
+    url = "https://nyaa.si/view/1"
+
+    class Meta:
+        model = ProjectReleaseLink
+
+
+class CommentFactory(factory.django.DjangoModelFactory):
+    comment_date = factory.Sequence(
+        lambda n: datetime(2020, 1, 1, tzinfo=timezone.utc)
+        + timedelta(hours=n)
+    )
+    text = factory.Sequence(lambda n: f"Comment number {n}")
+    author = "Author"
+
+    class Meta:
+        model = Comment
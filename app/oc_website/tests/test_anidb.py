@@ -0,0 +1,356 @@
+import io
+import time
+from collections.abc import Iterable
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from oc_website.anidb import (
+    get_refresh_delay,
+    get_refresh_interval,
+    import_anidb_titles,
+    parse_anime,
+)
+from oc_website.anidb_client import AniDBError, RateLimited
+from oc_website.anidb_store import ANIME, PICTURE, get_anidb_store
+from oc_website.models import AniDBEntry, AniDBTitle
+from oc_website.tasks.anidb import (
+    fill_missing_anidb_info,
+    refresh_anidb_entries,
+)
+from oc_website.taxonomies import AniDBFetchStatus
+from oc_website.tests.factories import AniDBEntryFactory
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+@pytest.fixture(name="override_dirs")
+def fixture_override_dirs(tmp_path: Path) -> Iterable[None]:
+    with override_settings(
+        ANIDB_CACHE_DIR=tmp_path / "cache",
+        ANIDB_STORE_PATH=tmp_path / "cache" / "responses.sqlite3",
+        MEDIA_ROOT=tmp_path / "media",
+    ):
+        yield
+
+
+@pytest.fixture(name="anidb_client")
+def fixture_anidb_client() -> Iterable[Mock]:
+    client = Mock()
+    client.get_anime.return_value = (DATA_DIR / "anidb_1.xml").read_bytes()
+    client.get_image.return_value = b"image"
+    with patch("oc_website.anidb.get_anidb_client", return_value=client):
+        yield client
+
+
+@pytest.mark.django_db
+def test_fill_missing_anidb_info(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    ani_db_entry_factory(anidb_id=1)
+
+    fill_missing_anidb_info()
+
+    anidb_entry = AniDBEntry.objects.get(anidb_id=1)
+    assert anidb_entry.title == "Attack No. 1"
+    assert anidb_entry.type == "TV Series"
+    assert anidb_entry.episodes == 104
+    assert anidb_entry.synopsis == (
+        "A volleyball story, see  http://example.com [source]"
+    )
+    assert anidb_entry.start_date.year == 1969
+    assert anidb_entry.end_date.year == 1971
+    assert anidb_entry.image.read() == b"image"
+    assert anidb_entry.fetch_status == AniDBFetchStatus.DONE.value
+    anidb_client.get_anime.assert_called_once_with(1)
+    anidb_client.get_image.assert_called_once_with("1.jpg")
+
+
+@pytest.mark.django_db
+def test_fill_missing_anidb_info_rate_limited(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    ani_db_entry_factory(anidb_id=1)
+    anidb_client.get_image.side_effect = RateLimited("anidb-image", 1.5)
+
+    with patch.object(fill_missing_anidb_info, "apply_async") as apply_async:
+        fill_missing_anidb_info()
+        fill_missing_anidb_info()
+
+    apply_async.assert_called_once_with(countdown=1.5)
+    assert AniDBEntry.objects.get(anidb_id=1).title is None
+    anidb_client.get_anime.assert_called_once_with(1)
+
+
+@pytest.mark.django_db
+def test_fill_missing_anidb_info_backoff(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    ani_db_entry_factory(anidb_id=1)
+    anidb_client.get_anime.side_effect = AniDBError("<error>banned</error>")
+
+    with override_settings(ANIDB_FETCH_MAX_ATTEMPTS=2):
+        fill_missing_anidb_info()
+        anidb_entry = AniDBEntry.objects.get(anidb_id=1)
+        assert anidb_entry.fetch_status == AniDBFetchStatus.FAILED.value
+        assert anidb_entry.fetch_attempts == 1
+        assert anidb_entry.fetch_error == "<error>banned</error>"
+        assert anidb_entry.next_fetch_at > timezone.now()
+
+        # not due yet
+        fill_missing_anidb_info()
+        assert anidb_client.get_anime.call_count == 1
+
+        AniDBEntry.objects.update(next_fetch_at=timezone.now())
+        fill_missing_anidb_info()
+        anidb_entry = AniDBEntry.objects.get(anidb_id=1)
+        assert anidb_entry.fetch_status == AniDBFetchStatus.DEAD.value
+        assert anidb_entry.fetch_attempts == 2
+
+        AniDBEntry.objects.update(next_fetch_at=timezone.now())
+        fill_missing_anidb_info()
+        assert anidb_client.get_anime.call_count == 2
+
+
+def test_parse_anime() -> None:
+    fields = parse_anime((DATA_DIR / "anidb_1.xml").read_bytes())
+
+    assert fields == {
+        "title": "Attack No. 1",
+        "type": "TV Series",
+        "episodecount": "104",
+        "startdate": "1969-12-07",
+        "enddate": "1971-11-28",
+        "description": "A volleyball story, see http://example.com [source]",
+        "picture": "1.jpg",
+    }
+
+
+def test_parse_anime_error() -> None:
+    with pytest.raises(AniDBError):
+        parse_anime(b'<error code="302">client version missing</error>')
+
+
+def test_parse_anime_missing_fields() -> None:
+    with pytest.raises(ValueError, match="picture, title not found"):
+        parse_anime(
+            b"<anime><type>Movie</type><episodecount>1</episodecount>"
+            b"<startdate>2000</startdate><enddate>2000</enddate></anime>"
+        )
+
+
+def test_import_anidb_cache(
+    override_dirs: None,  # pylint: disable=unused-argument
+) -> None:
+    cache_dir = settings.ANIDB_CACHE_DIR
+    cache_dir.mkdir(parents=True)
+    (cache_dir / "1.xml").write_bytes((DATA_DIR / "anidb_1.xml").read_bytes())
+    (cache_dir / "1.jpg").write_bytes(b"image")
+    (cache_dir / "2.xml").write_text("<error>Banned</error>")
+
+    call_command("import_anidb_cache", "--delete", stdout=io.StringIO())
+
+    store = get_anidb_store()
+    anime = store.get_latest(1, ANIME)
+    assert anime is not None
+    assert anime.data == (DATA_DIR / "anidb_1.xml").read_bytes()
+    picture = store.get_latest(1, PICTURE)
+    assert picture is not None
+    assert picture.data == b"image"
+    assert store.get_latest(2, ANIME) is None
+    assert not list(cache_dir.glob("*.xml"))
+    assert not list(cache_dir.glob("*.jpg"))
+
+
+@pytest.mark.django_db
+def test_import_anidb_titles() -> None:
+    with (DATA_DIR / "anime-titles.xml").open("rb") as handle:
+        assert import_anidb_titles(handle) == 6
+    # importing again replaces the titles
+    with (DATA_DIR / "anime-titles.xml").open("rb") as handle:
+        assert import_anidb_titles(handle) == 6
+
+    assert AniDBTitle.objects.get_main_title(1) == "Seikai no Monshou"
+    assert AniDBTitle.objects.get_main_title(4) is None
+    assert AniDBTitle.objects.get(title="Hvězdný erb").normalized_title == (
+        "hvezdny erb"
+    )
+    assert AniDBTitle.objects.search("seikai no", limit=10) == [
+        dict(anidb_id=1, title="Seikai no Monshou", match="Seikai no Monshou"),
+        dict(anidb_id=2, title="Seikai no Senki", match="Seikai no Senki"),
+    ]
+    assert AniDBTitle.objects.search("crest", limit=10) == [
+        dict(anidb_id=1, title="Seikai no Monshou", match="Crest of the Stars")
+    ]
+    assert len(AniDBTitle.objects.search("seikai", limit=1)) == 1
+
+
+@pytest.mark.django_db
+def test_parse_anidb(
+    override_dirs: None,  # pylint: disable=unused-argument
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    store = get_anidb_store()
+    store.put(1, ANIME, (DATA_DIR / "anidb_1.xml").read_bytes())
+    store.put(1, PICTURE, b"image")
+    store.put(2, ANIME, b"<anime><title>Broken</title></anime>")
+    ani_db_entry_factory(anidb_id=1, title="Outdated")
+    ani_db_entry_factory(anidb_id=2, title="Kept")
+    ani_db_entry_factory(anidb_id=3)
+
+    with patch(
+        "oc_website.management.commands.parse_anidb."
+        "generate_image_derivatives"
+    ) as task:
+        call_command(
+            "parse_anidb",
+            "--jobs=1",
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+        anidb_entry = AniDBEntry.objects.get(anidb_id=1)
+        assert anidb_entry.title == "Attack No. 1"
+        assert anidb_entry.fetch_status == AniDBFetchStatus.DONE.value
+        assert anidb_entry.image.read() == b"image"
+        assert AniDBEntry.objects.get(anidb_id=2).title == "Kept"
+        task.delay.assert_called_once_with(anidb_entry.image.name)
+
+        # unchanged pictures are not saved again
+        stdout = io.StringIO()
+        call_command(
+            "parse_anidb", "1", "--jobs=1", stdout=stdout, stderr=io.StringIO()
+        )
+        assert AniDBEntry.objects.get(anidb_id=1).image == anidb_entry.image
+        assert task.delay.call_count == 1
+        assert "0 updated, 0 new images, 0 failed" in stdout.getvalue()
+
+    with pytest.raises(CommandError, match="--jobs"):
+        call_command("parse_anidb", "--jobs=0", stdout=io.StringIO())
+
+
+def test_get_refresh_interval() -> None:
+    now = timezone.now()
+    airing = get_refresh_interval(None)
+    finished = get_refresh_interval(now - timedelta(days=300))
+    assert airing < finished
+    assert get_refresh_interval(now - timedelta(days=1)) == airing
+    assert get_refresh_delay(1, airing) == get_refresh_delay(1, airing)
+    assert get_refresh_delay(1, airing) != get_refresh_delay(2, airing)
+
+
+@pytest.mark.django_db
+def test_refresh_anidb_entries(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    store = get_anidb_store()
+    store.put(
+        1,
+        ANIME,
+        (DATA_DIR / "anidb_1.xml").read_bytes().replace(b"104", b"12"),
+        fetched_at=time.time() - 365 * 24 * 60 * 60,
+    )
+    store.put(1, PICTURE, b"image")
+    ani_db_entry_factory(
+        anidb_id=1,
+        title="Attack No. 1",
+        episodes=12,
+        fetch_status=AniDBFetchStatus.DONE.value,
+    )
+
+    with override_settings(ANIDB_REFRESH_DAILY_BUDGET=1):
+        refresh_anidb_entries()
+        anidb_entry = AniDBEntry.objects.get(anidb_id=1)
+        assert anidb_entry.episodes == 104
+        # finished long ago, so the next refresh is months away
+        assert anidb_entry.next_fetch_at > timezone.now() + timedelta(days=100)
+        anidb_client.get_anime.assert_called_once_with(1)
+        # the picture did not change
+        anidb_client.get_image.assert_not_called()
+
+        # the budget for today is used up
+        AniDBEntry.objects.update(next_fetch_at=timezone.now())
+        refresh_anidb_entries()
+        assert anidb_client.get_anime.call_count == 1
+
+
+@pytest.mark.django_db
+def test_refresh_anidb_entries_budget(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    store = get_anidb_store()
+    for anidb_id, age in [(1, 0), (2, 365 * 24 * 60 * 60)]:
+        store.put(
+            anidb_id,
+            ANIME,
+            (DATA_DIR / "anidb_1.xml").read_bytes(),
+            fetched_at=time.time() - age,
+        )
+        store.put(anidb_id, PICTURE, b"image")
+        ani_db_entry_factory(
+            anidb_id=anidb_id,
+            fetch_status=AniDBFetchStatus.DONE.value,
+            next_fetch_at=timezone.now() - timedelta(days=3 - anidb_id),
+        )
+    anidb_client.get_anime.side_effect = [
+        RateLimited("anidb-api", 1),
+        (DATA_DIR / "anidb_1.xml").read_bytes(),
+    ]
+
+    with override_settings(ANIDB_REFRESH_DAILY_BUDGET=1):
+        # neither a fresh stored response nor being rate limited uses up
+        # the budget
+        for _ in range(3):
+            refresh_anidb_entries()
+
+    assert anidb_client.get_anime.call_count == 2
+    assert AniDBEntry.objects.refresh_due().count() == 0
+
+
+@pytest.mark.django_db
+def test_refresh_anidb_entries_jittered(
+    override_dirs: None,  # pylint: disable=unused-argument
+    anidb_client: Mock,
+    ani_db_entry_factory: AniDBEntryFactory,
+) -> None:
+    airing = get_refresh_interval(None)
+    anidb_id = next(
+        anidb_id
+        for anidb_id in range(1, 100)
+        if get_refresh_delay(anidb_id, airing) < airing * 0.95
+    )
+    # due after its shortened delay, while younger than the full interval
+    age = (get_refresh_delay(anidb_id, airing) + airing) / 2
+    store = get_anidb_store()
+    store.put(
+        anidb_id,
+        ANIME,
+        (DATA_DIR / "anidb_1.xml").read_bytes(),
+        fetched_at=time.time() - age.total_seconds(),
+    )
+    store.put(anidb_id, PICTURE, b"image")
+    ani_db_entry_factory(
+        anidb_id=anidb_id,
+        end_date=None,
+        fetch_status=AniDBFetchStatus.DONE.value,
+    )
+
+    refresh_anidb_entries()
+
+    anidb_client.get_anime.assert_called_once_with(anidb_id)
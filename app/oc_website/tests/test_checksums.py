@@ -0,0 +1,63 @@
+import zlib
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from oc_website.checksums import ED2K, FileChecksums, new_md4
+
+
+@pytest.mark.parametrize(
+    "data,expected",
+    [
+        (b"", "31d6cfe0d16ae931b73c59d7e0c089c0"),
+        (b"abc", "a448017aaf21d8525fc10ae87aa6729d"),
+        (
+            b"12345678901234567890123456789012345678901234567890123456789012"
+            b"345678901234567890",
+            "e33b4ddc9c38f2199c3e7b164fcc0536",
+        ),
+    ],
+)
+def test_md4(data: bytes, expected: str) -> None:
+    md4 = new_md4()
+    for i in range(0, len(data), 7):
+        md4.update(memoryview(data)[i : i + 7])
+    assert md4.hexdigest() == expected
+
+
+def hash_md4(data: bytes) -> Any:
+    result = new_md4()
+    result.update(data)
+    return result
+
+
+@patch("oc_website.checksums.ED2K_CHUNK_SIZE", 100)
+@pytest.mark.parametrize(
+    "size,expected_chunks", [(50, None), (100, None), (250, 3), (300, 3)]
+)
+def test_ed2k(size: int, expected_chunks: int) -> None:
+    data = bytes(range(256)) * 2
+    data = data[:size]
+    ed2k = ED2K()
+    ed2k.update(data[:30])
+    ed2k.update(data[30:])
+
+    if expected_chunks is None:
+        expected = hash_md4(data).hexdigest()
+    else:
+        expected = hash_md4(
+            b"".join(
+                hash_md4(data[offset : offset + 100]).digest()
+                for offset in range(0, size, 100)
+            )
+        ).hexdigest()
+    assert ed2k.hexdigest() == expected
+
+
+def test_file_checksums() -> None:
+    checksums = FileChecksums()
+    checksums.update(b"123")
+    checksums.update(b"456789")
+    assert checksums.size == 9
+    assert checksums.crc32 == f"{zlib.crc32(b'123456789'):08x}" == "cbf43926"
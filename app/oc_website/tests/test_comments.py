@@ -0,0 +1,112 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import Client, override_settings
+
+from oc_website.markdown import RENDERER_VERSION
+from oc_website.models import (
+    GUEST_BOOK_COMMENT_COUNTER,
+    AnimeRequest,
+    Comment,
+    Counter,
+)
+from oc_website.tests.factories import AnimeRequestFactory, CommentFactory
+
+
+@pytest.mark.django_db
+def test_comment_html_is_rendered_on_save(
+    comment_factory: CommentFactory,
+) -> None:
+    comment = comment_factory(text="**hello** <script>")
+
+    comment.refresh_from_db()
+    assert comment.rendered_text_version == RENDERER_VERSION
+    assert comment.rendered_text == "<p><strong>hello</strong> </p>"
+    assert comment.html == comment.rendered_text
+
+
+@pytest.mark.django_db
+def test_render_comments_command(comment_factory: CommentFactory) -> None:
+    comments = [comment_factory(text=f"*comment {i}*") for i in range(3)]
+    Comment.objects.update(rendered_text="", rendered_text_version="old")
+
+    call_command("render_comments", jobs=2, batch_size=2)
+
+    for comment in comments:
+        comment.refresh_from_db()
+        assert comment.rendered_text_version == RENDERER_VERSION
+        assert comment.rendered_text == f"<p><em>{comment.text[1:-1]}</em></p>"
+
+
+@pytest.mark.django_db
+def test_comment_counts(
+    comment_factory: CommentFactory,
+    anime_request_factory: AnimeRequestFactory,
+) -> None:
+    content_type = ContentType.objects.get_for_model(AnimeRequest)
+    anime_request = anime_request_factory()
+
+    def get_counts() -> tuple[int, int]:
+        anime_request.refresh_from_db()
+        return (
+            anime_request.comment_count,
+            Counter.objects.get_value(GUEST_BOOK_COMMENT_COUNTER),
+        )
+
+    root = comment_factory(
+        content_type=content_type, object_id=anime_request.pk
+    )
+    comment_factory(
+        content_type=content_type,
+        object_id=anime_request.pk,
+        parent_comment=root,
+    )
+    guest_book_comment = comment_factory()
+    assert get_counts() == (2, 1)
+
+    guest_book_comment = Comment.objects.get(pk=guest_book_comment.pk)
+    guest_book_comment.content_type = content_type
+    guest_book_comment.object_id = anime_request.pk
+    guest_book_comment.save()
+    assert get_counts() == (3, 0)
+
+    root.delete()  # cascades to the reply
+    assert get_counts() == (1, 0)
+
+    AnimeRequest.objects.update(comment_count=100)
+    call_command("recount_comments")
+    assert get_counts() == (1, 0)
+
+
+@pytest.mark.django_db
+def test_comment_avatar(
+    client: Client, tmp_path: Path, comment_factory: CommentFactory
+) -> None:
+    comment = comment_factory(author="Author", email="author@example.com")
+    assert (
+        comment.avatar_hash == hashlib.md5(b"author@example.com").hexdigest()
+    )
+    assert comment.author_avatar_url == f"/avatar/{comment.avatar_hash}.svg"
+
+    with override_settings(MEDIA_ROOT=tmp_path):
+        response = client.get(comment.author_avatar_url)
+        cached_path = tmp_path / "avatars" / f"{comment.avatar_hash}.svg"
+        assert cached_path.read_bytes() == response.content
+        assert (
+            client.get(comment.author_avatar_url).content == response.content
+        )
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "image/svg+xml"
+    assert "immutable" in response["Cache-Control"]
+    assert client.get("/avatar/not-a-hash.svg").status_code == 404
+
+    # made up hashes are drawn, but not stored
+    unknown_hash = hashlib.md5(b"unknown").hexdigest()
+    with override_settings(MEDIA_ROOT=tmp_path):
+        response = client.get(f"/avatar/{unknown_hash}.svg")
+    assert response.status_code == 200
+    assert not (tmp_path / "avatars" / f"{unknown_hash}.svg").exists()
@@ -0,0 +1,101 @@
+import io
+from collections.abc import Callable
+from unittest.mock import patch
+
+import pytest
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.utils import timezone
+from PIL import Image
+
+from oc_website.images import generate_derivatives
+from oc_website.models import FeaturedImage, ImageDerivative
+
+
+def make_jpeg(width: int, height: int) -> ContentFile:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, format="jpeg")
+    return ContentFile(buffer.getvalue(), name="image.jpg")
+
+
+@pytest.mark.django_db
+def test_generate_derivatives() -> None:
+    featured_image = FeaturedImage(feature_date=timezone.now())
+    featured_image.image.save("image.jpg", make_jpeg(800, 400), save=False)
+
+    generate_derivatives(featured_image.image.name)
+
+    assert sorted(
+        ImageDerivative.objects.values_list("format", "width", "height")
+    ) == [
+        ("jpeg", 160, 80),
+        ("jpeg", 320, 160),
+        ("jpeg", 640, 320),
+        ("webp", 160, 80),
+        ("webp", 320, 160),
+        ("webp", 640, 320),
+        ("webp", 800, 400),
+    ]
+    derivative = ImageDerivative.objects.get(format="webp", width=320)
+    with Image.open(derivative.file) as image:
+        assert image.format == "WEBP"
+        assert image.size == (320, 160)
+
+    # regenerating replaces the previous derivatives
+    generate_derivatives(featured_image.image.name)
+    assert ImageDerivative.objects.count() == 7
+
+
+@pytest.mark.django_db
+def test_picture_tag() -> None:
+    featured_image = FeaturedImage(feature_date=timezone.now())
+    featured_image.image.save("image.jpg", make_jpeg(200, 100), save=False)
+    template = Template("{% load images %}{% picture image 'alt' %}")
+
+    url = featured_image.image.url
+    html = template.render(Context({"image": featured_image.image}))
+    assert html.strip() == f"<img src='{url}' alt='alt'/>"
+
+    generate_derivatives(featured_image.image.name)
+    del featured_image.image.derivatives
+    html = template.render(Context({"image": featured_image.image}))
+    webp = ImageDerivative.objects.get(format="webp", width=160)
+    jpeg = ImageDerivative.objects.get(format="jpeg", width=160)
+    assert (
+        f"<picture><source type='image/webp' srcset='{webp.file.url} 160w, "
+    ) in html
+    assert f"srcset='{jpeg.file.url} 160w, {url} 200w'" in html
+
+
+@pytest.mark.django_db
+def test_image_set_tag() -> None:
+    featured_image = FeaturedImage(feature_date=timezone.now())
+    featured_image.image.save("image.jpg", make_jpeg(200, 100), save=False)
+    template = Template("{% load images %}{% image_set image 100 %}")
+
+    url = featured_image.image.url
+    css = template.render(Context({"image": featured_image.image}))
+    assert css == f'image-set(url("{url}") type("image/jpeg"))'
+
+    generate_derivatives(featured_image.image.name)
+    del featured_image.image.derivatives
+    css = template.render(Context({"image": featured_image.image}))
+    webp = ImageDerivative.objects.get(format="webp", width=160)
+    assert css == (
+        f'image-set(url("{webp.file.url}") type("image/webp"), '
+        f'url("{url}") type("image/jpeg"))'
+    )
+
+
+@pytest.mark.django_db
+def test_derivatives_queued_on_save(
+    django_capture_on_commit_callbacks: Callable,
+) -> None:
+    with patch(
+        "oc_website.signals.generate_image_derivatives"
+    ) as task, django_capture_on_commit_callbacks(execute=True):
+        FeaturedImage.objects.create(
+            feature_date=timezone.now(), image=make_jpeg(200, 100)
+        )
+
+    task.delay.assert_called_once_with(FeaturedImage.objects.get().image.name)
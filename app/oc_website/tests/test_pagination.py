@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from typing import Any
+
+import pytest
+
+from oc_website.models import AnimeRequest
+from oc_website.pagination import KeysetPaginator
+from oc_website.tests.factories import AnimeRequestFactory
+
+
+def collect_forward(paginator: KeysetPaginator) -> list[Any]:
+    page = paginator.page()
+    assert not page.has_previous
+    result = list(page)
+    while page.has_next:
+        page = paginator.page(after=page.next_cursor)
+        assert page.has_previous
+        result += page
+    return result
+
+
+def collect_backward(paginator: KeysetPaginator) -> list[Any]:
+    page = paginator.page(before="")
+    assert not page.has_next
+    result = list(page)
+    while page.has_previous:
+        page = paginator.page(before=page.previous_cursor)
+        assert page.has_next
+        result = list(page) + result
+    return result
+
+
+@pytest.mark.parametrize(
+    "ordering,expected_order_by",
+    [
+        ("-request_date", ["-request_date", "-pk"]),
+        ("request_date", ["request_date", "pk"]),
+        ("anidb_entry__title", ["anidb_entry__title", "pk"]),
+        ("-anidb_entry__title", ["-anidb_entry__title", "-pk"]),
+    ],
+)
+@pytest.mark.django_db
+def test_keyset_paginator(
+    anime_request_factory: AnimeRequestFactory,
+    ordering: str,
+    expected_order_by: list[str],
+) -> None:
+    for i in range(11):
+        anime_request_factory(
+            anidb_entry__title=None if i % 4 == 0 else f"Title {i % 3}",
+            request_date=(
+                None
+                if i % 5 == 0
+                else datetime(2020, 1, i % 3 + 1, tzinfo=timezone.utc)
+            ),
+        )
+    expected = list(AnimeRequest.objects.order_by(*expected_order_by))
+    # sqlite sorts NULLs first in ascending order, same as the paginator
+    paginator = KeysetPaginator(
+        AnimeRequest.objects.all(), per_page=3, ordering=ordering
+    )
+
+    assert collect_forward(paginator) == expected
+    assert collect_backward(paginator) == expected
+    assert paginator.total_count == 11
+
+
+@pytest.mark.django_db
+def test_keyset_paginator_invalid_cursor(
+    anime_request_factory: AnimeRequestFactory,
+) -> None:
+    anime_request_factory()
+    paginator = KeysetPaginator(
+        AnimeRequest.objects.all(), per_page=3, ordering="-request_date"
+    )
+
+    for cursor in ["garbage", "W10=", "WzEsIFtdXQ==", "WyJ4IiwgMV0="]:
+        assert len(paginator.page(after=cursor)) == 1
@@ -0,0 +1,109 @@
+import os
+import zlib
+from collections.abc import Iterable
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.test import override_settings
+
+from oc_website.checksums import ED2K
+from oc_website.management.commands.prepare_release import create_release
+from oc_website.models import ProjectRelease, ProjectReleaseFile
+from oc_website.tasks.releases import build_torrent_file, chdir
+from oc_website.tests.factories import ProjectFactory
+from oc_website.torrents import PieceHasher
+
+
+@pytest.fixture(name="data_dir")
+def fixture_data_dir(tmp_path: Path) -> Iterable[Path]:
+    with override_settings(
+        DATA_DIR=tmp_path / "data",
+        TORRENT_PIECE_CACHE_PATH=tmp_path / "torrent_pieces.sqlite3",
+        TORRENT_PAD_FILES=False,
+        TORRENT_HYBRID=False,
+    ), patch(
+        "oc_website.management.commands.prepare_release.identify",
+        return_value={
+            "container": {"properties": {"duration": 24 * 60 * 10**9}},
+            "tracks": [],
+        },
+    ), patch(
+        # the version is a digit of the CRC, which is random here
+        "oc_website.management.commands.prepare_release"
+        ".get_version_from_file_name",
+        return_value=1,
+    ):
+        settings.DATA_DIR.mkdir()
+        yield settings.DATA_DIR
+
+
+def write_episode(directory: Path, number: int, content: bytes) -> Path:
+    path = (
+        directory
+        / f"[OC] Test Project - {number:02d} [{zlib.crc32(content):08X}].mkv"
+    )
+    path.write_bytes(content)
+    return path
+
+
+@pytest.mark.django_db
+def test_create_release(data_dir: Path) -> None:
+    ProjectFactory(title="Test Project")
+    content = os.urandom(50000)
+    path = write_episode(data_dir, 1, content)
+
+    release = create_release(path)
+
+    release_file = release.files.get()
+    assert release_file.episode_number == 1
+    assert release_file.size == len(content)
+    assert release_file.crc32 == f"{zlib.crc32(content):08x}"
+    ed2k = ED2K()
+    ed2k.update(content)
+    assert release_file.ed2k == ed2k.hexdigest()
+    assert release_file.duration == timedelta(minutes=24)
+
+
+@pytest.mark.django_db
+def test_create_release_crc_mismatch(data_dir: Path) -> None:
+    ProjectFactory(title="Test Project")
+    path = write_episode(data_dir, 1, b"content")
+    path = path.rename(path.with_name("[OC] Test Project - 01 [01234567].mkv"))
+
+    with pytest.raises(CommandError, match="01234567"):
+        create_release(path)
+
+    assert not ProjectRelease.objects.exists()
+    assert not ProjectReleaseFile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_create_release_caches_batch_torrent_pieces(
+    data_dir: Path, tmp_path: Path
+) -> None:
+    ProjectFactory(title="Test Project")
+    batch_path = data_dir / "[OC] Test Project [BD]"
+    batch_path.mkdir()
+    for number, size in enumerate([150000, 100000], 1):
+        write_episode(batch_path, number, os.urandom(size))
+
+    create_release(batch_path)
+
+    hashers = []
+
+    def new_piece_hasher(*args: Any, **kwargs: Any) -> PieceHasher:
+        hashers.append(PieceHasher(*args, **kwargs))
+        return hashers[-1]
+
+    with patch(
+        "oc_website.tasks.releases.PieceHasher", side_effect=new_piece_hasher
+    ), chdir(data_dir):
+        build_torrent_file(batch_path, tmp_path / "batch.torrent")
+
+    # only the pieces that span both episodes are read again
+    assert hashers[0].read_size < hashers[0].piece_size * 2
@@ -0,0 +1,47 @@
+import pytest
+
+from oc_website.models import AnimeRequest
+from oc_website.search import build_fts_query, search_anime_requests
+from oc_website.tests.factories import AnimeRequestFactory
+
+
+def search(text: str) -> list[AnimeRequest]:
+    return list(search_anime_requests(AnimeRequest.objects.all(), text))
+
+
+def test_build_fts_query() -> None:
+    assert build_fts_query('attack "no. 1') == '"attack"* "no"* "1"*'
+    assert build_fts_query("  -*  ") is None
+
+
+@pytest.mark.django_db
+def test_search_anime_requests(
+    anime_request_factory: AnimeRequestFactory,
+) -> None:
+    attack = anime_request_factory(
+        anidb_entry__anidb_id=1234,
+        anidb_entry__title="Attack No. 1",
+        anidb_entry__type="TV Series",
+        anidb_entry__synopsis="Volleyball.",
+    )
+    lassie = anime_request_factory(
+        anidb_entry__title="Lassie",
+        anidb_entry__type="TV Series",
+        anidb_entry__synopsis="A dog attacks.",
+    )
+
+    # title matches rank above synopsis matches
+    assert search("atta") == [attack, lassie]
+    assert search("volley") == [attack]
+    # both only match on their type, so their order is of no interest
+    assert set(search("tv series")) == {attack, lassie}
+    assert search("1234") == [attack]
+    assert not search("nothing")
+
+    lassie.anidb_entry.title = "Paris no Isabelle"
+    lassie.anidb_entry.save()
+    assert search("isabelle") == [lassie]
+    assert not search("lassie")
+
+    lassie.anidb_entry.delete()
+    assert not search("isabelle")
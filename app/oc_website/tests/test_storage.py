@@ -0,0 +1,140 @@
+import io
+import os
+import time
+from pathlib import Path
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+
+from oc_website.models import (
+    ContentVersion,
+    FeaturedImage,
+    ImageDerivative,
+    News,
+    NewsAttachment,
+)
+from oc_website.page_cache import get_content_version_name
+from oc_website.taxonomies import ImageFormat
+
+
+def test_identical_files_share_a_blob(media_root: Path) -> None:
+    name1 = default_storage.save("anidb/1.jpg", ContentFile(b"image"))
+    name2 = default_storage.save(
+        "featured_images/x.JPG", ContentFile(b"image")
+    )
+    name3 = default_storage.save("anidb/1.jpg", ContentFile(b"other"))
+
+    assert name1.startswith("blobs/")
+    assert name1 == name2
+    assert name3 != name1
+    assert default_storage.open(name1).read() == b"image"
+    assert len(list(media_root.glob("blobs/*/*"))) == 2
+    assert not list(media_root.glob("blobs/*.tmp"))
+
+
+@pytest.mark.django_db
+def test_gc_media() -> None:
+    featured_image = FeaturedImage.objects.create(
+        feature_date=timezone.now(), image=ContentFile(b"kept", name="a.jpg")
+    )
+    unreferenced = default_storage.save("b.jpg", ContentFile(b"unreferenced"))
+    recent = default_storage.save("c.jpg", ContentFile(b"recent"))
+    old = time.time() - 2 * 24 * 60 * 60
+    for name in [featured_image.image.name, unreferenced]:
+        os.utime(default_storage.path(name), (old, old))
+
+    call_command("gc_media", stdout=io.StringIO())
+
+    assert default_storage.exists(featured_image.image.name)
+    assert not default_storage.exists(unreferenced)
+    assert default_storage.exists(recent)
+
+
+@pytest.mark.django_db
+def test_gc_media_removes_derivatives_of_replaced_images() -> None:
+    featured_image = FeaturedImage.objects.create(
+        feature_date=timezone.now(), image=ContentFile(b"old", name="a.jpg")
+    )
+    derivative = ImageDerivative.objects.create(
+        source_name=featured_image.image.name,
+        width=100,
+        height=100,
+        format=ImageFormat.WEBP.value,
+        file=ContentFile(b"old derivative", name="a.webp"),
+    )
+    featured_image.image = ContentFile(b"new", name="a.jpg")
+    featured_image.save()
+    old = time.time() - 2 * 24 * 60 * 60
+    for name in default_storage.iter_blobs():
+        os.utime(default_storage.path(name), (old, old))
+
+    call_command("gc_media", "--dry-run", stdout=io.StringIO())
+    assert ImageDerivative.objects.exists()
+    assert default_storage.exists(derivative.file.name)
+
+    call_command("gc_media", stdout=io.StringIO())
+    assert not ImageDerivative.objects.exists()
+    assert not default_storage.exists(derivative.file.name)
+    assert default_storage.exists(featured_image.image.name)
+
+
+@pytest.mark.django_db
+def test_link_media(media_root: Path) -> None:
+    (media_root / "news").mkdir()
+    (media_root / "news" / "a.png").write_bytes(b"attachment")
+    (media_root / "news" / "b.png").write_bytes(b"attachment")
+    news = News.objects.create(
+        publication_date=timezone.now(), title="", author="", content=""
+    )
+    NewsAttachment.objects.bulk_create(
+        [
+            NewsAttachment(news=news, file="news/a.png"),
+            NewsAttachment(news=news, file="news/b.png"),
+        ]
+    )
+
+    call_command("link_media", stdout=io.StringIO())
+
+    assert ContentVersion.objects.filter(
+        name=get_content_version_name(NewsAttachment)
+    ).exists()
+    names = {
+        attachment.file.name for attachment in NewsAttachment.objects.all()
+    }
+    assert len(names) == 1
+    (name,) = names
+    assert name.startswith("blobs/") and name.endswith(".png")
+    assert (
+        os.stat(default_storage.path(name)).st_ino
+        == (media_root / "news" / "a.png").stat().st_ino
+    )
+
+
+@pytest.mark.django_db
+def test_link_media_moves_derivatives(media_root: Path) -> None:
+    (media_root / "featured").mkdir()
+    for name in ["a.jpg", "b.jpg"]:
+        (media_root / "featured" / name).write_bytes(b"image")
+    FeaturedImage.objects.bulk_create(
+        [
+            FeaturedImage(feature_date=timezone.now(), image="featured/a.jpg"),
+            FeaturedImage(feature_date=timezone.now(), image="featured/b.jpg"),
+        ]
+    )
+    for name in ["featured/a.jpg", "featured/b.jpg"]:
+        ImageDerivative.objects.create(
+            source_name=name,
+            width=100,
+            height=100,
+            format=ImageFormat.WEBP.value,
+            file=ContentFile(b"derivative", name="a.webp"),
+        )
+
+    call_command("link_media", stdout=io.StringIO())
+
+    (name,) = set(FeaturedImage.objects.values_list("image", flat=True))
+    derivative = ImageDerivative.objects.get()
+    assert derivative.source_name == name
@@ -1,13 +1,33 @@
+import hashlib
 from collections.abc import Iterable
+from datetime import timedelta
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import pytest
+import requests
 from django.conf import settings
 from django.test import override_settings
+from django.utils import timezone
 
-from oc_website.tasks.releases import BasePublisher, publish_release
-from oc_website.tests.factories import ProjectReleaseFactory
+from oc_website.admin import make_visible
+from oc_website.models import ProjectRelease, PublishAttempt
+from oc_website.tasks.releases import (
+    BasePublisher,
+    get_publisher_breaker,
+    get_publisher_metrics,
+    is_site_failure,
+    process_publish_attempts,
+    publish_due_releases,
+    publish_release,
+    publish_release_to_third_party,
+    schedule_release_publication,
+)
+from oc_website.taxonomies import PublishAttemptState
+from oc_website.tests.factories import (
+    ProjectReleaseFactory,
+    ProjectReleaseFileFactory,
+)
 
 
 @pytest.fixture(name="override_dirs")
@@ -15,6 +35,7 @@ def fixture_override_dirs(tmp_path: Path) -> Iterable[None]:
     with override_settings(
         DATA_DIR=tmp_path / "data",
         TORRENTS_DIR=tmp_path / "torrents",
+        TORRENT_PIECE_CACHE_PATH=tmp_path / "torrent_pieces.sqlite3",
         TRANSMISSION_WATCHDIR=tmp_path / "transmission-watchdir",
         IRCBOT_WATCHDIR=tmp_path / "ircbot-watchdir",
     ):
@@ -83,3 +104,309 @@ def test_publish_release(
     fake_nyaa_si_publish.assert_called_once_with(
         torrent_path, data_path, dry_run=False
     )
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, TORRENT_HYBRID=True)
+@pytest.mark.django_db
+def test_publish_release_hybrid(
+    override_dirs: None,  # pylint: disable=unused-argument
+    project_release_factory: ProjectReleaseFactory,
+    project_release_file_factory: ProjectReleaseFileFactory,
+) -> None:
+    (settings.DATA_DIR / "batch").mkdir()
+    (settings.DATA_DIR / "batch" / "01.mkv").write_bytes(b"a" * 20000)
+    (settings.DATA_DIR / "batch" / "02.mkv").write_bytes(b"b" * 100)
+    project_release = project_release_factory(filename="batch")
+    release_file = project_release_file_factory(
+        release=project_release, file_name="batch/01.mkv"
+    )
+
+    with patch(
+        "oc_website.tasks.releases.AnidexPublisher.publish", return_value=None
+    ), patch(
+        "oc_website.tasks.releases.NyaaSiPublisher.publish", return_value=None
+    ):
+        publish_release.s(project_release.pk, dry_run=False).apply()
+
+    release_file.refresh_from_db()
+    assert release_file.pieces_root == (
+        hashlib.sha256(
+            hashlib.sha256(b"a" * 16384).digest()
+            + hashlib.sha256(b"a" * 3616).digest()
+        ).hexdigest()
+    )
+    magnet = project_release.links.get(url__startswith="magnet:").url
+    assert "&xt=urn:btmh:1220" in magnet
+    assert project_release.btih in magnet
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db
+def test_publish_release_to_third_party_metrics(
+    override_dirs: None,  # pylint: disable=unused-argument
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    project_release = project_release_factory(filename="test file.txt")
+
+    with patch(
+        "oc_website.tasks.releases.AnidexPublisher.publish",
+        side_effect=[requests.ConnectionError, "anidex_url"],
+    ) as fake_publish:
+        publish_release_to_third_party.s(
+            "anidex.info", project_release.pk, dry_run=False
+        ).apply()
+        attempt = project_release.publish_attempts.get()
+        assert attempt.state == PublishAttemptState.FAILED.value
+        assert attempt.attempts == 1
+        assert attempt.next_retry_at > timezone.now()
+
+        # not due yet
+        process_publish_attempts.s().apply()
+        assert fake_publish.call_count == 1
+
+        attempt.next_retry_at = timezone.now()
+        attempt.save()
+        process_publish_attempts.s().apply()
+
+    assert fake_publish.call_count == 2
+    attempt.refresh_from_db()
+    assert attempt.state == PublishAttemptState.DONE.value
+    assert attempt.attempts == 2
+    assert project_release.links.get().url == "anidex_url"
+    metrics = get_publisher_metrics("anidex.info")
+    assert metrics["calls"] == 2
+    assert metrics["failure"] == 1
+    assert metrics["success"] == 1
+    assert get_publisher_breaker("anidex.info").failures == 0
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db
+def test_publish_release_to_third_party_circuit_open(
+    override_dirs: None,  # pylint: disable=unused-argument
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    project_release = project_release_factory(filename="test file.txt")
+    breaker = get_publisher_breaker("anidex.info")
+    for _ in range(settings.PUBLISH_BREAKER_THRESHOLD):
+        breaker.record_failure()
+
+    with patch(
+        "oc_website.tasks.releases.AnidexPublisher.publish"
+    ) as fake_publish:
+        publish_release_to_third_party.s(
+            "anidex.info", project_release.pk, dry_run=False
+        ).apply()
+
+    fake_publish.assert_not_called()
+    attempt = project_release.publish_attempts.get()
+    assert attempt.state == PublishAttemptState.PENDING.value
+    assert attempt.attempts == 0
+    assert (attempt.next_retry_at - timezone.now()).total_seconds() == (
+        pytest.approx(settings.PUBLISH_BREAKER_COOLDOWN, abs=5)
+    )
+    assert get_publisher_metrics("anidex.info")["skipped"] == 1
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db
+def test_publish_release_to_third_party_leased(
+    override_dirs: None,  # pylint: disable=unused-argument
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    project_release = project_release_factory(filename="test file.txt")
+    attempt = PublishAttempt.objects.create(
+        release=project_release, publisher="anidex.info"
+    )
+    assert attempt.lease()
+    assert not PublishAttempt.objects.get(pk=attempt.pk).lease()
+
+    with patch(
+        "oc_website.tasks.releases.AnidexPublisher.publish"
+    ) as fake_publish:
+        publish_release_to_third_party.s(
+            "anidex.info", project_release.pk, dry_run=False
+        ).apply()
+
+    fake_publish.assert_not_called()
+
+
+@pytest.mark.django_db
+@override_settings(PUBLISH_MAX_ATTEMPTS=3, PUBLISH_RETRY_JITTER=0)
+def test_publish_attempt_record_failure(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    attempt = PublishAttempt.objects.create(
+        release=project_release_factory(), publisher="anidex.info"
+    )
+
+    def fail() -> None:
+        attempt.next_retry_at = timezone.now()
+        attempt.save()
+        assert attempt.lease()
+        assert attempt.record_failure("error")
+
+    delays = []
+    for _ in range(2):
+        fail()
+        delays.append((attempt.next_retry_at - timezone.now()).total_seconds())
+        assert attempt.state == PublishAttemptState.FAILED.value
+    assert delays == [
+        pytest.approx(settings.PUBLISH_RETRY_BACKOFF, abs=5),
+        pytest.approx(settings.PUBLISH_RETRY_BACKOFF * 2, abs=5),
+    ]
+
+    fail()
+    attempt.refresh_from_db()
+    assert attempt.state == PublishAttemptState.DEAD.value
+    assert not PublishAttempt.objects.due(attempt.next_retry_at).exists()
+
+
+@pytest.mark.django_db
+def test_publish_attempt_lease_taken_over(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    attempt = PublishAttempt.objects.create(
+        release=project_release_factory(), publisher="anidex.info"
+    )
+    assert attempt.lease()
+    # the lease runs out while the upload is still going
+    PublishAttempt.objects.update(next_retry_at=timezone.now())
+    other_attempt = PublishAttempt.objects.get()
+    assert other_attempt.lease()
+    assert other_attempt.record_success()
+
+    assert not attempt.record_failure("timed out")
+    assert not attempt.postpone(60, "circuit open")
+    attempt.refresh_from_db()
+    assert attempt.state == PublishAttemptState.DONE.value
+    assert attempt.attempts == 1
+
+
+@pytest.mark.django_db
+def test_schedule_release_publication(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    eta = timezone.now() + timedelta(minutes=10)
+    project_release = project_release_factory(
+        is_visible=False, scheduled_publication_date=eta
+    )
+
+    with patch.object(
+        publish_release, "apply_async", return_value=Mock(id="task-1")
+    ) as fake_apply_async, patch(
+        "oc_website.tasks.releases.app.control.revoke"
+    ) as fake_revoke:
+        schedule_release_publication(project_release)
+        fake_apply_async.assert_called_once_with(
+            (project_release.pk,),
+            dict(dry_run=False, scheduled_for=eta.isoformat()),
+            eta=eta,
+        )
+        schedule_release_publication(project_release)
+        assert fake_apply_async.call_count == 1
+
+        # rescheduled beyond the horizon, for the sweep to pick up later
+        project_release.scheduled_publication_date = eta + timedelta(days=1)
+        schedule_release_publication(project_release)
+        assert fake_apply_async.call_count == 1
+        fake_revoke.assert_called_once_with("task-1")
+
+    project_release.refresh_from_db()
+    assert project_release.publication_task_id is None
+    assert project_release.publication_task_eta is None
+
+
+@pytest.mark.django_db
+def test_publish_due_releases(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    now = timezone.now()
+    soon = project_release_factory(
+        is_visible=False, scheduled_publication_date=now + timedelta(minutes=5)
+    )
+    lost = project_release_factory(
+        is_visible=False,
+        scheduled_publication_date=now - timedelta(hours=1),
+        publication_task_id="task-1",
+        publication_task_eta=now - timedelta(hours=1),
+    )
+    project_release_factory(
+        is_visible=False, scheduled_publication_date=now + timedelta(days=1)
+    )
+    project_release_factory(
+        is_visible=True, scheduled_publication_date=now - timedelta(hours=1)
+    )
+
+    with patch.object(
+        publish_release, "apply_async", return_value=Mock(id="task-2")
+    ) as fake_apply_async, patch(
+        "oc_website.tasks.releases.app.control.revoke"
+    ) as fake_revoke:
+        publish_due_releases.s().apply()
+
+    assert [call.args[0] for call in fake_apply_async.call_args_list] == [
+        (lost.pk,),
+        (soon.pk,),
+    ]
+    fake_revoke.assert_called_once_with("task-1")
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db
+def test_publish_release_rescheduled(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    eta = timezone.now() + timedelta(minutes=5)
+    project_release = project_release_factory(
+        is_visible=False, scheduled_publication_date=eta
+    )
+
+    publish_release.s(
+        project_release.pk,
+        dry_run=False,
+        scheduled_for=(eta - timedelta(minutes=1)).isoformat(),
+    ).apply()
+
+    project_release.refresh_from_db()
+    assert project_release.scheduled_publication_date == eta
+    assert project_release.is_visible is False
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@pytest.mark.django_db
+def test_publish_release_made_visible(
+    project_release_factory: ProjectReleaseFactory,
+) -> None:
+    eta = timezone.now() + timedelta(minutes=5)
+    project_release = project_release_factory(
+        is_visible=False,
+        scheduled_publication_date=eta,
+        publication_task_id="task-1",
+        publication_task_eta=eta,
+    )
+    queryset = ProjectRelease.objects.filter(pk=project_release.pk)
+
+    with patch("oc_website.tasks.releases.app.control.revoke") as fake_revoke:
+        make_visible(None, None, queryset)
+    fake_revoke.assert_called_once_with("task-1")
+
+    # revoking is best effort, and the task might run anyway
+    publish_release.s(
+        project_release.pk, dry_run=False, scheduled_for=eta.isoformat()
+    ).apply()
+
+    project_release.refresh_from_db()
+    assert project_release.scheduled_publication_date == eta
+    assert project_release.publication_task_id is None
+    assert not project_release.links.exists()
+
+
+def test_is_site_failure() -> None:
+    response = requests.Response()
+    response.status_code = 503
+    assert is_site_failure(requests.HTTPError(response=response))
+    assert is_site_failure(requests.Timeout())
+    response.status_code = 400
+    assert not is_site_failure(requests.HTTPError(response=response))
+    assert not is_site_failure(ValueError("torrent already exists"))
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import zlib
+from pathlib import Path
+
+import pytest
+import torf
+from django.test import override_settings
+
+from oc_website.checksums import new_md4
+from oc_website.tasks.releases import build_torrent_file, chdir
+from oc_website.torrents import PieceCache, PieceHasher
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_piece_hasher(tmp_path: Path, workers: int) -> None:
+    # pieces span file boundaries and the last piece is short
+    contents = [bytes(range(256)) * 40, b"", b"x" * 3000, b"y" * 7]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f"{i}.bin")
+        paths[-1].write_bytes(content)
+    data = b"".join(contents)
+    piece_size = 1024
+    progress: list[tuple[int, int]] = []
+
+    hasher = PieceHasher(
+        piece_size,
+        workers=workers,
+        read_size=3 * piece_size,
+        progress=lambda done, total: progress.append((done, total)),
+    )
+
+    assert hasher.hash_files(paths) == b"".join(
+        hashlib.sha1(data[offset : offset + piece_size]).digest()
+        for offset in range(0, len(data), piece_size)
+    )
+    assert progress[-1] == (len(data), len(data))
+
+
+def hash_pieces(data: bytes, piece_size: int) -> bytes:
+    return b"".join(
+        hashlib.sha1(data[offset : offset + piece_size]).digest()
+        for offset in range(0, len(data), piece_size)
+    )
+
+
+def test_piece_hasher_cache(tmp_path: Path) -> None:
+    contents = [b"a" * 5000, b"b" * 3000, b"c" * 2500]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f"{i}.bin")
+        paths[-1].write_bytes(content)
+    cache = PieceCache(tmp_path / "pieces.sqlite3")
+
+    def hash_files(paths: list[Path]) -> tuple[bytes, int]:
+        hasher = PieceHasher(1024, workers=2, read_size=2048, cache=cache)
+        return hasher.hash_files(paths), hasher.read_size
+
+    assert hash_files(paths) == (
+        hash_pieces(b"".join(contents), 1024),
+        len(b"".join(contents)),
+    )
+    # only the pieces shared between files are read again
+    pieces, read_size = hash_files(paths)
+    assert pieces == hash_pieces(b"".join(contents), 1024)
+    assert read_size == 904 + 120 + 832 + 192 + 260
+
+    # at another offset, the pieces of a file are different
+    pieces, read_size = hash_files(paths[1:])
+    assert pieces == hash_pieces(b"".join(contents[1:]), 1024)
+    assert read_size == 3000 + 2500
+
+    contents[0] = b"d" * 5000
+    paths[0].write_bytes(contents[0])
+    os.utime(paths[0], ns=(0, 0))
+    pieces, read_size = hash_files(paths)
+    assert pieces == hash_pieces(b"".join(contents), 1024)
+    assert read_size == 5000 + 120 + 832 + 192 + 260
+
+
+def test_piece_hasher_pad_files(tmp_path: Path) -> None:
+    contents = [b"a" * 1500, b"b" * 2048, b"c" * 100]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f"{i}.bin")
+        paths[-1].write_bytes(content)
+
+    hasher = PieceHasher(1024, workers=2)
+
+    assert hasher.hash_files(paths, pad_files=True) == hash_pieces(
+        contents[0] + bytes(548) + contents[1] + contents[2], 1024
+    )
+    assert [(span.path, span.size) for span in hasher.spans] == [
+        (paths[0], 1500),
+        (None, 548),
+        (paths[1], 2048),
+        (paths[2], 100),
+    ]
+
+
+def test_build_torrent_file_with_pad_files(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    (data_dir / "batch").mkdir(parents=True)
+    contents = {"01.mkv": b"a" * 40000, "02.mkv": b"b" * 30000}
+    for name, content in contents.items():
+        (data_dir / "batch" / name).write_bytes(content)
+
+    with override_settings(
+        DATA_DIR=data_dir,
+        TORRENT_PIECE_CACHE_PATH=tmp_path / "pieces.sqlite3",
+    ), chdir(data_dir):
+        torrent = build_torrent_file(
+            data_dir / "batch", tmp_path / "batch.torrent", pad_files=True
+        )
+
+    piece_size = torrent.piece_size
+    padding = -40000 % piece_size
+    assert torrent.metainfo["info"]["files"] == [
+        {"length": 40000, "path": ["01.mkv"]},
+        {"attr": "p", "length": padding, "path": [".pad", str(padding)]},
+        {"length": 30000, "path": ["02.mkv"]},
+    ]
+    assert torrent.metainfo["info"]["pieces"] == hash_pieces(
+        contents["01.mkv"] + bytes(padding) + contents["02.mkv"], piece_size
+    )
+    assert torf.Torrent.read(tmp_path / "batch.torrent").infohash == (
+        torrent.infohash
+    )
+
+
+def test_build_torrent_file_hybrid_file_order(tmp_path: Path) -> None:
+    data_dir = tmp_path / "data"
+    (data_dir / "batch").mkdir(parents=True)
+    # sorted by bytes in the v2 file tree, but case-insensitively by torf
+    contents = {"b.mkv": b"b" * 40000, "C.mkv": b"c" * 30000}
+    for name, content in contents.items():
+        (data_dir / "batch" / name).write_bytes(content)
+
+    with override_settings(
+        DATA_DIR=data_dir,
+        TORRENT_PIECE_CACHE_PATH=tmp_path / "pieces.sqlite3",
+    ), chdir(data_dir):
+        torrent = build_torrent_file(
+            data_dir / "batch", tmp_path / "batch.torrent", hybrid=True
+        )
+
+    piece_size = torrent.piece_size
+    padding = -30000 % piece_size
+    assert [file["path"] for file in torrent.metainfo["info"]["files"]] == [
+        ["C.mkv"],
+        [".pad", str(padding)],
+        ["b.mkv"],
+    ]
+    assert torrent.metainfo["info"]["pieces"] == hash_pieces(
+        contents["C.mkv"] + bytes(padding) + contents["b.mkv"], piece_size
+    )
+
+
+def get_merkle_root(data: bytes, leaf_count: int) -> bytes:
+    layer = [
+        hashlib.sha256(data[offset : offset + 16384]).digest()
+        for offset in range(0, len(data), 16384)
+    ]
+    layer += [bytes(32)] * (leaf_count - len(layer))
+    while len(layer) > 1:
+        layer = [
+            hashlib.sha256(layer[i] + layer[i + 1]).digest()
+            for i in range(0, len(layer), 2)
+        ]
+    return layer[0]
+
+
+def test_piece_hasher_v2(tmp_path: Path) -> None:
+    piece_size = 4 * 16384
+    contents = [os.urandom(200000), os.urandom(5000), os.urandom(70000)]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f"{i}.bin")
+        paths[-1].write_bytes(content)
+    cache = PieceCache(tmp_path / "pieces.sqlite3")
+
+    for _ in range(2):
+        hasher = PieceHasher(
+            piece_size, workers=2, read_size=piece_size, cache=cache, v2=True
+        )
+        padding = [
+            bytes(piece_size - len(content) % piece_size)
+            for content in contents
+        ]
+        assert hasher.hash_files(paths) == hash_pieces(
+            contents[0] + padding[0] + contents[1] + padding[1] + contents[2],
+            piece_size,
+        )
+        assert hasher.pieces_roots == {
+            paths[0]: get_merkle_root(contents[0], 16),
+            paths[1]: get_merkle_root(contents[1], 1),
+            paths[2]: get_merkle_root(contents[2], 8),
+        }
+        assert hasher.piece_layers == {
+            hasher.pieces_roots[paths[0]]: b"".join(
+                get_merkle_root(contents[0][offset : offset + piece_size], 4)
+                for offset in range(0, 200000, piece_size)
+            ),
+            hasher.pieces_roots[paths[2]]: b"".join(
+                get_merkle_root(contents[2][offset : offset + piece_size], 4)
+                for offset in range(0, 70000, piece_size)
+            ),
+        }
+    # the whole pieces of the first and last file came from the cache
+    assert (
+        hasher.read_size == 200000 - 3 * piece_size + 5000 + 70000 - piece_size
+    )
+
+
+def test_piece_hasher_checksums(tmp_path: Path) -> None:
+    contents = [os.urandom(5000), os.urandom(3000)]
+    paths = []
+    for i, content in enumerate(contents):
+        paths.append(tmp_path / f"{i}.bin")
+        paths[-1].write_bytes(content)
+    cache = PieceCache(tmp_path / "pieces.sqlite3")
+    PieceHasher(1024, workers=2, cache=cache).hash_files(paths)
+
+    hasher = PieceHasher(
+        1024, workers=2, read_size=2048, cache=cache, checksums=True
+    )
+
+    assert hasher.hash_files(paths) == hash_pieces(b"".join(contents), 1024)
+    assert hasher.read_size == 8000
+    for path, content in zip(paths, contents):
+        assert hasher.checksums[path].size == len(content)
+        assert hasher.checksums[path].crc32 == f"{zlib.crc32(content):08x}"
+        md4 = new_md4()
+        md4.update(content)
+        assert hasher.checksums[path].ed2k == md4.hexdigest()
@@ -0,0 +1,293 @@
+from collections.abc import Callable
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from oc_website.models import AniDBTitle, AnimeRequest
+from oc_website.taxonomies import AniDBTitleType, ProjectStatus
+from oc_website.tests.factories import (
+    AnimeRequestFactory,
+    CommentFactory,
+    LanguageFactory,
+    ProjectFactory,
+    ProjectReleaseFactory,
+    ProjectReleaseFileFactory,
+    ProjectReleaseLinkFactory,
+)
+
+
+@pytest.mark.parametrize("release_count", [1, 10])
+@pytest.mark.django_db
+def test_view_project_query_count(  # pylint: disable=too-many-arguments
+    client: Client,
+    django_assert_num_queries: Callable,
+    project_factory: ProjectFactory,
+    project_release_factory: ProjectReleaseFactory,
+    project_release_file_factory: ProjectReleaseFileFactory,
+    project_release_link_factory: ProjectReleaseLinkFactory,
+    language_factory: LanguageFactory,
+    release_count: int,
+) -> None:
+    project = project_factory()
+    english = language_factory(name="en")
+    polish = language_factory(name="pl")
+    for _ in range(release_count):
+        release = project_release_factory(project=project)
+        project_release_file_factory(release=release).languages.set(
+            [english, polish]
+        )
+        project_release_file_factory(release=release).languages.set([english])
+        project_release_link_factory(
+            release=release, url=f"magnet:?xt=urn:btih:{release.pk:040x}"
+        )
+        project_release_link_factory(
+            release=release, url=f"https://nyaa.si/view/{release.pk}"
+        )
+    project_release_factory(project=project, is_visible=False)
+
+    # content versions, project, project links, releases, release links,
+    # release files, release file languages, image derivatives
+    with django_assert_num_queries(8):
+        response = client.get(f"/project/{project.slug}/")
+
+    assert response.status_code == 200
+    releases = response.context["project"].visible_releases
+    assert len(releases) == release_count
+    assert releases[0].languages == ["en", "pl"]
+    assert releases[0].btih == f"{releases[0].pk:040x}"
+    assert [provider for provider, _link in releases[0].provider_links] == [
+        "magnet",
+        "nyaa.si",
+    ]
+
+
+@pytest.mark.parametrize("project_count", [1, 10])
+@pytest.mark.django_db
+def test_view_projects_query_count(  # pylint: disable=too-many-arguments
+    client: Client,
+    django_assert_num_queries: Callable,
+    project_factory: ProjectFactory,
+    project_release_file_factory: ProjectReleaseFileFactory,
+    language_factory: LanguageFactory,
+    project_count: int,
+) -> None:
+    english = language_factory(name="en")
+    polish = language_factory(name="pl")
+    for i in range(project_count):
+        status = (
+            ProjectStatus.ACTIVE.value
+            if i % 2
+            else ProjectStatus.FINISHED.value
+        )
+        project = project_factory(status=status)
+        project_release_file_factory(release__project=project).languages.set(
+            [polish, english]
+        )
+        project_release_file_factory(release__project=project).languages.set(
+            [english]
+        )
+    project_factory(is_visible=False)
+
+    # content versions, projects, languages, image derivatives
+    with django_assert_num_queries(4):
+        response = client.get("/projects/")
+
+    assert response.status_code == 200
+    projects = (
+        response.context["ongoing_projects"]
+        + response.context["finished_projects"]
+    )
+    assert len(projects) == project_count
+    assert all(project.languages == ["en", "pl"] for project in projects)
+
+
+@pytest.mark.parametrize("depth", [1, 5])
+@pytest.mark.django_db
+def test_view_guest_book_query_count(
+    client: Client,
+    django_assert_num_queries: Callable,
+    comment_factory: CommentFactory,
+    depth: int,
+) -> None:
+    roots = [comment_factory(), comment_factory()]
+    for root in roots:
+        parent = root
+        for _ in range(depth):
+            comment_factory(parent_comment=parent)
+            parent = comment_factory(parent_comment=parent)
+
+    with django_assert_num_queries(4):
+        response = client.get("/guest_book/")
+
+    assert response.status_code == 200
+    page_roots = response.context["page"].object_list
+    assert [comment.pk for comment in page_roots] == [
+        root.pk for root in reversed(roots)
+    ]
+    replies = page_roots[0].replies
+    assert len(replies) == 2
+    assert replies[0].comment_date > replies[1].comment_date
+
+
+@pytest.mark.django_db
+def test_view_anime_requests_pagination(
+    client: Client,
+    anime_request_factory: AnimeRequestFactory,
+) -> None:
+    anime_requests = [
+        anime_request_factory(anidb_entry__title=f"Title {i:02d}")
+        for i in range(15)
+    ]
+
+    response = client.get("/anime_requests/", {"sort": "-title"})
+    assert response.status_code == 200
+    page = response.context["page"]
+    assert page.object_list == anime_requests[:4:-1]
+    assert page.has_next
+
+    response = client.get(
+        "/anime_requests/", {"sort": "-title", "after": page.next_cursor}
+    )
+    assert response.status_code == 200
+    assert response.context["page"].object_list == anime_requests[4::-1]
+    assert not response.context["page"].has_next
+    assert b"15 entries" in response.content
+
+    # the count is served from the cache
+    with CaptureQueriesContext(connection) as queries:
+        client.get("/anime_requests/", {"sort": "-title"})
+    assert not any("COUNT" in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_public_page_cache(
+    client: Client,
+    django_assert_num_queries: Callable,
+    project_factory: ProjectFactory,
+    project_release_file_factory: ProjectReleaseFileFactory,
+) -> None:
+    project = project_factory()
+
+    response = client.get("/projects/")
+    assert response["X-Cache"] == "MISS"
+
+    with django_assert_num_queries(1):
+        response = client.get("/projects/")
+    assert response["X-Cache"] == "HIT"
+    assert project.title.encode() in response.content
+
+    project.title = "Renamed project"
+    project.save()
+    response = client.get("/projects/")
+    assert response["X-Cache"] == "MISS"
+    assert b"Renamed project" in response.content
+
+    project_release_file_factory(release__project=project)
+    assert client.get("/projects/")["X-Cache"] == "MISS"
+    assert client.get("/projects/")["X-Cache"] == "HIT"
+
+
+@pytest.mark.django_db
+def test_public_page_conditional_get(
+    client: Client,
+    django_assert_num_queries: Callable,
+    project_factory: ProjectFactory,
+    project_release_link_factory: ProjectReleaseLinkFactory,
+) -> None:
+    project = project_factory()
+    response = client.get(f"/project/{project.slug}/")
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+
+    with django_assert_num_queries(1):
+        response = client.get(
+            f"/project/{project.slug}/", HTTP_IF_NONE_MATCH=etag
+        )
+    assert response.status_code == 304
+    response = client.get(
+        f"/project/{project.slug}/", HTTP_IF_MODIFIED_SINCE=last_modified
+    )
+    assert response.status_code == 304
+
+    # deploying new templates or static files changes the page as well
+    with patch(
+        "oc_website.page_cache.get_code_version",
+        return_value=("new", timezone.now() + timedelta(seconds=1)),
+    ):
+        response = client.get(
+            f"/project/{project.slug}/", HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+    assert response.status_code == 200
+
+    project_release_link_factory(release__project=project)
+    response = client.get(f"/project/{project.slug}/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_view_anime_titles(client: Client) -> None:
+    AniDBTitle.objects.bulk_create(
+        [
+            AniDBTitle(
+                anidb_id=1,
+                title="Seikai no Monshou",
+                normalized_title="seikai no monshou",
+                type=AniDBTitleType.MAIN.value,
+            ),
+            AniDBTitle(
+                anidb_id=1,
+                title="Crest of the Stars",
+                normalized_title="crest of the stars",
+                type=AniDBTitleType.OFFICIAL.value,
+            ),
+        ]
+    )
+
+    response = client.get("/anime_request/titles/", {"q": "Crest "})
+
+    assert response.json() == [
+        dict(
+            anidb_id=1,
+            title="Seikai no Monshou",
+            match="Crest of the Stars",
+            url="https://anidb.net/anime/1",
+        )
+    ]
+    assert client.get("/anime_request/titles/", {"q": "c"}).json() == []
+
+
+@pytest.mark.django_db
+@override_settings(REQUESTS_ENABLED=True)
+def test_view_anime_request_add(client: Client) -> None:
+    AniDBTitle.objects.create(
+        anidb_id=1,
+        title="Seikai no Monshou",
+        normalized_title="seikai no monshou",
+        type=AniDBTitleType.MAIN.value,
+    )
+
+    with patch("oc_website.views.fill_missing_anidb_info") as task:
+        response = client.post(
+            "/anime_request/add/",
+            {"anidb_url": "https://anidb.net/anime/2", "submit": "submit"},
+        )
+        assert (
+            "There is no anime with this AniDB ID."
+            in response.content.decode()
+        )
+
+        response = client.post(
+            "/anime_request/add/",
+            {"anidb_url": "https://anidb.net/anime/1", "submit": "submit"},
+        )
+        assert response.status_code == 302
+
+    anime_request = AnimeRequest.objects.get()
+    assert anime_request.anidb_entry.title == "Seikai no Monshou"
+    task.delay.assert_called_once_with(1)
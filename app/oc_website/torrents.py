@@ -0,0 +1,644 @@
+import contextlib
+import hashlib
+import io
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+
+import torf
+from django.conf import settings
+
+from oc_website.checksums import FileChecksums
+
+ProgressCallback = Callable[[int, int], None]
+# what identifies the content of a file without reading it: path, size,
+# modification time and inode
+FileKey = tuple[str, int, int, int]
+
+HASH_SIZE = 20
+# BitTorrent v2 hashes files in blocks of 16 KiB with SHA-256 (BEP 52)
+BLOCK_SIZE = 16 * 1024
+V1 = 1
+V2 = 2
+
+
+def advise(handle: BinaryIO, advice_name: str) -> None:
+    """Tell the kernel how a file is going to be read, where supported."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(handle.fileno(), 0, 0, getattr(os, advice_name))
+
+
+def bencode(value: Any) -> bytes:
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    if isinstance(value, dict):
+        items = sorted(
+            (key.encode() if isinstance(key, str) else key, item)
+            for key, item in value.items()
+        )
+        return (
+            b"d"
+            + b"".join(bencode(key) + bencode(item) for key, item in items)
+            + b"e"
+        )
+    raise TypeError(f"cannot bencode {value!r}")
+
+
+def get_width(count: int) -> int:
+    """The number of leaves of a merkle tree over count hashes."""
+    return 1 << max(0, count - 1).bit_length()
+
+
+def merkle_root(
+    hashes: list[bytes], width: int, padding: bytes = bytes(32)
+) -> bytes:
+    """Root of a SHA-256 merkle tree over the hashes, padded to width
+    leaves."""
+    layer = hashes + [padding] * (width - len(hashes))
+    while len(layer) > 1:
+        layer = [
+            hashlib.sha256(layer[i] + layer[i + 1]).digest()
+            for i in range(0, len(layer), 2)
+        ]
+    return layer[0]
+
+
+def get_magnet(torrent: torf.Torrent) -> str:
+    """The magnet link of a torrent, with the v2 info hash for hybrid
+    torrents."""
+    magnet = str(torrent.magnet())
+    if torrent.metainfo["info"].get("meta version") == 2:
+        btih = f"xt=urn:btih:{torrent.infohash}"
+        infohash_v2 = hashlib.sha256(
+            bencode(torrent.convert()[b"info"])
+        ).hexdigest()
+        magnet = magnet.replace(btih, f"{btih}&xt=urn:btmh:1220{infohash_v2}")
+    return magnet
+
+
+def get_pieces_roots(torrent: torf.Torrent) -> dict[str, bytes]:
+    """Merkle roots of the files of a v2 torrent, by their path starting
+    with the torrent name."""
+    info = torrent.metainfo["info"]
+
+    def walk(tree: dict[str, Any], path: str) -> Iterator[tuple[str, bytes]]:
+        for name, node in tree.items():
+            if name == "":
+                if "pieces root" in node:
+                    yield path, node["pieces root"]
+            else:
+                yield from walk(node, f"{path}/{name}" if path else name)
+
+    tree = info.get("file tree", {})
+    if torrent.mode == "multifile":
+        return dict(walk(tree, info["name"]))
+    return dict(walk(tree, ""))
+
+
+def get_piece_size(size: int) -> int:
+    """The piece size of a torrent of the given size."""
+    return min(
+        torf.Torrent.calculate_piece_size(size),
+        settings.TORRENT_MAX_PIECE_SIZE,
+    )
+
+
+def get_file_key(path: Path) -> FileKey:
+    stat = path.stat()
+    return (str(path.resolve()), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+@dataclass
+class FileSpan:
+    """A file, or padding if path is None, at its offset in the torrent."""
+
+    path: Optional[Path]
+    offset: int
+    size: int
+    key: Optional[FileKey] = None
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+
+@dataclass
+class Read:
+    path: Optional[Path]
+    start: int
+    length: int
+    offset: int
+
+
+class PieceCache:
+    """Hashes of the pieces lying entirely within a file, kept in a single
+    SQLite file so that rebuilding a torrent only reads the files that
+    changed. The hashes depend on where the file starts relative to the
+    piece boundaries, so they are stored per piece size and phase (the
+    file's offset in the torrent modulo the piece size).
+
+    v1 piece hashes and v2 piece layers are kept in separate tables.
+    """
+
+    TABLES = {V1: "pieces", V2: "piece_layers"}
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for table in self.TABLES.values():
+                connection.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        path TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime INTEGER NOT NULL,
+                        inode INTEGER NOT NULL,
+                        piece_size INTEGER NOT NULL,
+                        phase INTEGER NOT NULL,
+                        hashes BLOB NOT NULL,
+                        PRIMARY KEY (
+                            path, size, mtime, inode, piece_size, phase
+                        )
+                    ) WITHOUT ROWID
+                    """
+                )
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(
+        self, key: FileKey, piece_size: int, phase: int, version: int = V1
+    ) -> Optional[bytes]:
+        with self.connect() as connection:
+            row = connection.execute(
+                f"""
+                SELECT hashes FROM {self.TABLES[version]}
+                WHERE path = ? AND size = ? AND mtime = ? AND inode = ?
+                AND piece_size = ? AND phase = ?
+                """,
+                (*key, piece_size, phase),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(  # pylint: disable=too-many-arguments
+        self,
+        key: FileKey,
+        piece_size: int,
+        phase: int,
+        hashes: bytes,
+        version: int = V1,
+    ) -> None:
+        table = self.TABLES[version]
+        with self.connect() as connection:
+            # whatever was stored for an older version of the file is of no
+            # use anymore
+            connection.execute(
+                f"""
+                DELETE FROM {table}
+                WHERE path = ? AND (size, mtime, inode) != (?, ?, ?)
+                """,
+                key,
+            )
+            connection.execute(
+                f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, piece_size, phase, hashes),
+            )
+
+
+def get_piece_cache() -> PieceCache:
+    return PieceCache(settings.TORRENT_PIECE_CACHE_PATH)
+
+
+# the reader and the hashing threads share the layout and results of a run
+class PieceHasher:  # pylint: disable=too-many-instance-attributes
+    """Computes BitTorrent v1 piece hashes, and optionally the v2 merkle
+    trees of the files in the same pass.
+
+    One thread reads the files sequentially in large blocks, each holding a
+    whole number of pieces, while a pool of threads hashes the blocks; SHA-1
+    releases the GIL, so the hashing runs on all cores. Blocks come from a
+    fixed pool of buffers, which bounds both the memory use and how far the
+    reader gets ahead of the hashers.
+
+    With a cache, only the pieces a file shares with its neighbours are read
+    again for files that were hashed before.
+
+    v2 hashes every file on its own, so it needs every file to start on a
+    piece boundary and implies pad files.
+
+    With checksums, the CRC32 and ED2K hashes of every file are computed
+    from the same reads by another thread, and nothing is taken from the
+    cache, as every byte is needed.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        piece_size: int,
+        workers: Optional[int] = None,
+        read_size: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None,
+        cache: Optional[PieceCache] = None,
+        v2: bool = False,  # pylint: disable=invalid-name
+        checksums: bool = False,
+    ) -> None:
+        if v2 and (piece_size < BLOCK_SIZE or piece_size & (piece_size - 1)):
+            raise ValueError(f"invalid piece size for v2: {piece_size}")
+        self.piece_size = piece_size
+        self.workers = workers or settings.TORRENT_HASH_WORKERS or 1
+        self.block_size = piece_size * max(
+            1, (read_size or settings.TORRENT_READ_SIZE) // piece_size
+        )
+        self.progress = progress
+        self.cache = cache
+        self.v2 = v2  # pylint: disable=invalid-name
+        self.compute_checksums = checksums
+        self.checksums: dict[Path, FileChecksums] = {}
+        self.buffer_users: dict[int, int] = {}
+        self.spans: list[FileSpan] = []
+        self.file_spans: list[FileSpan] = []
+        self.file_offsets: list[int] = []
+        self.pieces: list[bytes] = []
+        # v2 hashes of every piece, which for files smaller than a piece are
+        # their roots
+        self.layer: list[bytes] = []
+        self.pieces_roots: dict[Path, bytes] = {}
+        self.piece_layers: dict[bytes, bytes] = {}
+        self.hashed_size = 0
+        self.total_size = 0
+        self.read_size = 0
+        self.lock = threading.Lock()
+
+    def get_spans(self, paths: list[Path], pad_files: bool) -> list[FileSpan]:
+        """Lay out the files in the torrent, optionally padding every file
+        but the last to the next piece boundary (BEP 47)."""
+        spans = []
+        offset = 0
+        for i, path in enumerate(paths):
+            key = get_file_key(path)
+            spans.append(
+                FileSpan(path=path, offset=offset, size=key[1], key=key)
+            )
+            offset += key[1]
+            if pad_files and i < len(paths) - 1 and offset % self.piece_size:
+                padding = self.piece_size - offset % self.piece_size
+                spans.append(FileSpan(path=None, offset=offset, size=padding))
+                offset += padding
+        return spans
+
+    def get_whole_pieces(self, span: FileSpan) -> range:
+        """Indexes of the pieces that lie entirely within a file."""
+        first = math.ceil(span.offset / self.piece_size)
+        return range(first, max(first, span.end // self.piece_size))
+
+    def hash_files(self, paths: list[Path], pad_files: bool = False) -> bytes:
+        """Hash the concatenated content of the files; returns the
+        concatenated piece hashes. The layout of the files, including any
+        padding, is left in spans, and for v2 the merkle roots of the files
+        in pieces_roots and their piece layers in piece_layers."""
+        self.spans = self.get_spans(paths, pad_files or self.v2)
+        self.file_spans = [span for span in self.spans if span.path]
+        self.file_offsets = [span.offset for span in self.file_spans]
+        self.hashed_size = 0
+        self.total_size = self.spans[-1].end if self.spans else 0
+        piece_count = math.ceil(self.total_size / self.piece_size)
+        self.pieces = [b""] * piece_count
+        self.layer = [b""] * piece_count if self.v2 else []
+        if self.compute_checksums:
+            self.checksums = {
+                span.path: FileChecksums()
+                for span in self.file_spans
+                if span.path
+            }
+
+        reads: list[Read] = []
+        uncached: list[tuple[FileSpan, range]] = []
+        for span in self.spans:
+            whole_pieces = self.get_whole_pieces(span)
+            if not (span.key and whole_pieces):
+                reads.append(Read(span.path, 0, span.size, span.offset))
+                continue
+            if not self.load_cached(span, whole_pieces):
+                reads.append(Read(span.path, 0, span.size, span.offset))
+                uncached.append((span, whole_pieces))
+                continue
+            # the parts of the first and last piece that are in the file
+            head = whole_pieces.start * self.piece_size - span.offset
+            tail = whole_pieces.stop * self.piece_size - span.offset
+            reads.append(Read(span.path, 0, head, span.offset))
+            reads.append(
+                Read(span.path, tail, span.size - tail, span.offset + tail)
+            )
+            self.hashed_size += tail - head
+
+        start = time.monotonic()
+        self.read_pieces(reads)
+        elapsed = time.monotonic() - start
+
+        for span, whole_pieces in uncached:
+            self.store_cached(span, whole_pieces)
+        if self.v2:
+            self.get_pieces_roots()
+
+        logging.info(
+            "torrents: hashed %d files (%.1f MB, %.1f MB read) in %.1fs, "
+            "%.1f MB/s",
+            len(paths),
+            self.total_size / 1e6,
+            self.read_size / 1e6,
+            elapsed,
+            self.read_size / 1e6 / max(elapsed, 1e-6),
+        )
+        return b"".join(self.pieces)
+
+    def load_cached(self, span: FileSpan, whole_pieces: range) -> bool:
+        if not self.cache or self.compute_checksums:
+            return False
+        assert span.key
+        cached = []
+        for version, hash_size in self.get_hash_sizes():
+            hashes = self.cache.get(
+                span.key,
+                self.piece_size,
+                span.offset % self.piece_size,
+                version=version,
+            )
+            if hashes is None or len(hashes) != hash_size * len(whole_pieces):
+                return False
+            cached.append((version, hash_size, hashes))
+        for version, hash_size, hashes in cached:
+            target = self.pieces if version == V1 else self.layer
+            for i, piece in enumerate(whole_pieces):
+                target[piece] = hashes[i * hash_size : (i + 1) * hash_size]
+        return True
+
+    def store_cached(self, span: FileSpan, whole_pieces: range) -> None:
+        if not self.cache:
+            return
+        assert span.key
+        for version, _hash_size in self.get_hash_sizes():
+            source = self.pieces if version == V1 else self.layer
+            self.cache.put(
+                span.key,
+                self.piece_size,
+                span.offset % self.piece_size,
+                b"".join(source[whole_pieces.start : whole_pieces.stop]),
+                version=version,
+            )
+
+    def get_hash_sizes(self) -> list[tuple[int, int]]:
+        if self.v2:
+            return [(V1, HASH_SIZE), (V2, 32)]
+        return [(V1, HASH_SIZE)]
+
+    def get_pieces_roots(self) -> None:
+        blocks_per_piece = self.piece_size // BLOCK_SIZE
+        # what the leaves past the end of a file add up to at the piece layer
+        padding = merkle_root([], blocks_per_piece)
+        self.pieces_roots = {}
+        self.piece_layers = {}
+        for span in self.spans:
+            if not span.path or not span.size:
+                continue
+            first = span.offset // self.piece_size
+            layer = self.layer[
+                first : first + math.ceil(span.size / self.piece_size)
+            ]
+            if span.size <= self.piece_size:
+                self.pieces_roots[span.path] = layer[0]
+                continue
+            root = merkle_root(layer, get_width(len(layer)), padding)
+            self.pieces_roots[span.path] = root
+            self.piece_layers[root] = b"".join(layer)
+
+    def read_pieces(  # pylint: disable=too-many-locals
+        self, reads: list[Read]
+    ) -> None:
+        self.read_size = 0
+        free_buffers: queue.Queue[bytearray] = queue.Queue()
+        for _ in range(self.workers + 2):
+            free_buffers.put(bytearray(self.block_size))
+
+        futures: list[Future] = []
+        # checksums need the blocks in order, so they get a thread of their
+        # own
+        with ThreadPoolExecutor(
+            max_workers=self.workers
+        ) as executor, ThreadPoolExecutor(max_workers=1) as checksum_executor:
+
+            def submit(buffer: bytearray, length: int, offset: int) -> None:
+                with self.lock:
+                    self.buffer_users[id(buffer)] = (
+                        2 if self.compute_checksums else 1
+                    )
+                if self.compute_checksums:
+                    futures.append(
+                        checksum_executor.submit(
+                            self.update_checksums,
+                            buffer,
+                            length,
+                            offset,
+                            free_buffers,
+                        )
+                    )
+                futures.append(
+                    executor.submit(
+                        self.hash_block,
+                        buffer,
+                        length,
+                        offset // self.piece_size,
+                        free_buffers,
+                    )
+                )
+                self.report_progress()
+
+            buffer = free_buffers.get()
+            filled = 0
+            # offset of the start of the buffer in the torrent
+            position = 0
+            for read in reads:
+                if not read.length:
+                    continue
+                if read.offset != position + filled:
+                    # cached pieces were skipped, which starts a new piece
+                    if filled:
+                        submit(buffer, filled, position)
+                        buffer = free_buffers.get()
+                        filled = 0
+                    position = read.offset
+
+                with contextlib.ExitStack() as stack:
+                    handle = (
+                        stack.enter_context(read.path.open("rb", buffering=0))
+                        if read.path
+                        else None
+                    )
+                    if handle:
+                        advise(handle, "POSIX_FADV_SEQUENTIAL")
+                        handle.seek(read.start)
+                    remaining = read.length
+                    while remaining:
+                        length = self.read_into(
+                            handle,
+                            read,
+                            memoryview(buffer)[
+                                filled : filled
+                                + min(remaining, self.block_size - filled)
+                            ],
+                        )
+                        filled += length
+                        remaining -= length
+                        if filled == self.block_size:
+                            submit(buffer, filled, position)
+                            position += self.block_size
+                            buffer = free_buffers.get()
+                            filled = 0
+                    if handle:
+                        # the data is not going to be read again soon, so do
+                        # not let it push everything else out of the page
+                        # cache
+                        advise(handle, "POSIX_FADV_DONTNEED")
+            if filled:
+                submit(buffer, filled, position)
+
+            for future in futures:
+                future.result()
+        self.report_progress()
+
+    def read_into(
+        self, handle: Optional[io.FileIO], read: Read, view: memoryview
+    ) -> int:
+        """Fill the start of view from the file, or with zeros for padding,
+        and return how many bytes were filled."""
+        if handle is None:
+            view[:] = bytes(len(view))
+            return len(view)
+        if not (length := handle.readinto(view)):
+            raise OSError(f"{read.path} was truncated")
+        self.read_size += length
+        return length
+
+    def hash_block(
+        self,
+        buffer: bytearray,
+        length: int,
+        first_piece: int,
+        free_buffers: queue.Queue[bytearray],
+    ) -> None:
+        try:
+            view = memoryview(buffer)
+            for piece, offset in enumerate(
+                range(0, length, self.piece_size), start=first_piece
+            ):
+                data = view[offset : min(offset + self.piece_size, length)]
+                self.pieces[piece] = hashlib.sha1(data).digest()
+                if self.v2:
+                    self.layer[piece] = self.hash_piece_v2(piece, data)
+            with self.lock:
+                self.hashed_size += length
+        finally:
+            self.release_buffer(buffer, free_buffers)
+
+    def update_checksums(
+        self,
+        buffer: bytearray,
+        length: int,
+        offset: int,
+        free_buffers: queue.Queue[bytearray],
+    ) -> None:
+        try:
+            view = memoryview(buffer)
+            index = max(0, bisect_right(self.file_offsets, offset) - 1)
+            for span in self.file_spans[index:]:
+                if span.offset >= offset + length:
+                    break
+                start = max(span.offset, offset)
+                end = min(span.end, offset + length)
+                if start < end:
+                    assert span.path
+                    self.checksums[span.path].update(
+                        view[start - offset : end - offset]
+                    )
+        finally:
+            self.release_buffer(buffer, free_buffers)
+
+    def release_buffer(
+        self, buffer: bytearray, free_buffers: queue.Queue[bytearray]
+    ) -> None:
+        with self.lock:
+            self.buffer_users[id(buffer)] -= 1
+            if self.buffer_users[id(buffer)]:
+                return
+        free_buffers.put(buffer)
+
+    def hash_piece_v2(self, piece: int, data: memoryview) -> bytes:
+        """The v2 hash of a piece, leaving out any padding after the file;
+        for files smaller than a piece, this is the root of the file."""
+        offset = piece * self.piece_size
+        span = self.file_spans[bisect_right(self.file_offsets, offset) - 1]
+        data = data[: span.end - offset]
+        leaves = [
+            hashlib.sha256(data[start : start + BLOCK_SIZE]).digest()
+            for start in range(0, len(data), BLOCK_SIZE)
+        ]
+        if span.size < self.piece_size:
+            return merkle_root(leaves, get_width(len(leaves)))
+        return merkle_root(leaves, self.piece_size // BLOCK_SIZE)
+
+    def report_progress(self) -> None:
+        if self.progress is not None:
+            self.progress(self.hashed_size, self.total_size)
+
+
+def get_padded_files(
+    files: list[dict[str, Any]], spans: list[FileSpan]
+) -> list[dict[str, Any]]:
+    """The v1 file list of a torrent with the pad files of the spans."""
+    files_iter = iter(files)
+    return [
+        next(files_iter)
+        if span.path
+        else {
+            "attr": "p",
+            "length": span.size,
+            "path": [".pad", str(span.size)],
+        }
+        for span in spans
+    ]
+
+
+def get_file_tree(
+    files: list[dict[str, Any]], roots: list[Optional[bytes]]
+) -> dict[str, Any]:
+    """The v2 file tree of the files of a v1 file list, given their merkle
+    roots, which empty files lack."""
+    tree: dict[str, Any] = {}
+    for file, root in zip(files, roots):
+        node = tree
+        for part in file["path"]:
+            node = node.setdefault(part, {})
+        node[""] = {"length": file["length"]}
+        if root:
+            node[""]["pieces root"] = root
+    return tree
@@ -2,7 +2,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from django.urls import path, reverse
+from django.urls import path, re_path, reverse
 
 from oc_website import views
 
@@ -74,6 +74,11 @@ urlpatterns += [
         views.view_anime_request_add,
         name="anime_request_add",
     ),
+    path(
+        "anime_request/titles/",
+        views.view_anime_titles,
+        name="anime_request_titles",
+    ),
 ]
 
 # guest book
@@ -103,6 +108,15 @@ urlpatterns += [
     ),
 ]
 
+# comment avatars
+urlpatterns += [
+    re_path(
+        r"^avatar/(?P<avatar_hash>[0-9a-f]{32})\.svg$",
+        views.view_avatar,
+        name="avatar",
+    ),
+]
+
 # featured images
 urlpatterns += [
     path(
@@ -1,35 +1,57 @@
+import hashlib
 import re
+from datetime import datetime
 from typing import Optional
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import Http404, HttpRequest, HttpResponse
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 
-from oc_website.anidb import get_anidb_link_id, is_valid_anidb_link
+from oc_website.anidb import (
+    get_anidb_link_id,
+    is_valid_anidb_link,
+    normalize_title,
+)
+from oc_website.avatars import generate_avatar, get_stored_avatar, store_avatar
+from oc_website.images import prefetch_image_derivatives
 from oc_website.models import (
+    GUEST_BOOK_COMMENT_COUNTER,
     AniDBEntry,
+    AniDBTitle,
     AnimeRequest,
     Comment,
+    Counter,
     FeaturedImage,
+    ImageDerivative,
+    Language,
     News,
     Project,
+    ProjectExternalLink,
+    ProjectRelease,
+    ProjectReleaseFile,
+    ProjectReleaseLink,
+    prefetch_project_languages,
 )
+from oc_website.page_cache import cache_public_page, get_last_published
+from oc_website.pagination import KeysetPage, KeysetPaginator
+from oc_website.search import search_anime_requests
 from oc_website.tasks import fill_missing_anidb_info
 from oc_website.taxonomies import ProjectStatus
 
 MAX_GUESTBOOK_COMMENTS_PER_PAGE = 10
 MAX_ANIME_REQUESTS_PER_PAGE = 10
+MAX_ANIME_TITLE_SUGGESTIONS = 10
+MIN_ANIME_TITLE_QUERY_LENGTH = 2
 
 
-def get_page_number(request: HttpRequest) -> int:
-    try:
-        return int(request.GET.get("page", 1))
-    except ValueError:
-        return 1
+def get_page(request: HttpRequest, paginator: KeysetPaginator) -> KeysetPage:
+    return paginator.page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
 
 
 def get_client_ip(request: HttpRequest) -> Optional[str]:
@@ -38,6 +60,19 @@ def get_client_ip(request: HttpRequest) -> Optional[str]:
     return request.META.get("REMOTE_ADDR")
 
 
+def get_featured_image_published() -> Optional[datetime]:
+    return get_last_published(FeaturedImage.objects.all(), "feature_date")
+
+
+def get_news_published() -> Optional[datetime]:
+    return get_last_published(News.objects.all(), "publication_date")
+
+
+@cache_public_page(
+    FeaturedImage,
+    ImageDerivative,
+    get_published=get_featured_image_published,
+)
 def view_home(request: HttpRequest) -> HttpResponse:
     featured_image = FeaturedImage.objects.filter(
         feature_date__lte=timezone.now()
@@ -51,42 +86,59 @@ def view_home(request: HttpRequest) -> HttpResponse:
     )
 
 
+@cache_public_page(
+    Project, ProjectRelease, ProjectReleaseFile, Language, ImageDerivative
+)
 def view_projects(request: HttpRequest) -> HttpResponse:
-    projects = Project.objects.filter(is_visible=True).order_by("title")
+    projects = list(Project.objects.filter(is_visible=True).order_by("title"))
+    prefetch_project_languages(projects)
+    prefetch_image_derivatives(projects, "small_image")
     return render(
         request,
         "projects.html",
         context=dict(
-            ongoing_projects=projects.filter(
-                status=ProjectStatus.ACTIVE.value
-            ),
-            finished_projects=projects.filter(
-                status=ProjectStatus.FINISHED.value
-            ),
+            ongoing_projects=[
+                project
+                for project in projects
+                if project.status == ProjectStatus.ACTIVE.value
+            ],
+            finished_projects=[
+                project
+                for project in projects
+                if project.status == ProjectStatus.FINISHED.value
+            ],
         ),
     )
 
 
+@cache_public_page(
+    Project,
+    ProjectExternalLink,
+    ProjectRelease,
+    ProjectReleaseFile,
+    ProjectReleaseLink,
+    Language,
+    ImageDerivative,
+)
 def view_project(request: HttpRequest, slug: str) -> HttpResponse:
     try:
-        project = Project.objects.get(slug=slug)
+        project = Project.objects.with_release_tree().get(slug=slug)
     except Project.DoesNotExist as exc:
         raise Http404("Project does not exist") from exc
 
     return render(
         request,
         "project.html",
-        context=dict(
-            project=project,
-            known_providers=["magnet", "nyaa.si", "nyaa.net", "anidex.info"],
-        ),
+        context=dict(project=project),
     )
 
 
+@cache_public_page()
 def view_about(request: HttpRequest) -> HttpResponse:
     return render(request, "about.html")
 
 
+@cache_public_page(News, get_published=get_news_published)
 def view_news(
     request: HttpRequest, news_id: Optional[int] = None
 ) -> HttpResponse:
@@ -103,33 +155,31 @@ def view_news(
     )
 
 
+@cache_public_page(
+    FeaturedImage,
+    ImageDerivative,
+    get_published=get_featured_image_published,
+)
 def view_featured_images(request: HttpRequest) -> HttpResponse:
+    featured_images = list(
+        FeaturedImage.objects.filter(feature_date__lte=timezone.now())
+    )
+    prefetch_image_derivatives(featured_images, "image")
     return render(
         request,
         "featured.html",
-        context=dict(
-            featured_images=FeaturedImage.objects.filter(
-                feature_date__lte=timezone.now()
-            )
-        ),
+        context=dict(featured_images=featured_images),
     )
 
 
 def view_anime_requests(request: HttpRequest) -> HttpResponse:
-    anime_requests = AnimeRequest.objects.with_counts().filter(
+    anime_requests = AnimeRequest.objects.filter(
         Q(request_date__lte=timezone.now()) | Q(request_date__isnull=True),
     )
+    ordering = "-request_date"
     if search_text := request.GET.get("search_text"):
-        filter_arg = (
-            Q(anidb_entry__title__icontains=search_text)
-            | Q(anidb_entry__type__icontains=search_text)
-            | Q(anidb_entry__synopsis__icontains=search_text)
-        )
-        try:
-            filter_arg |= Q(anidb_id=int(search_text))
-        except ValueError:
-            pass
-        anime_requests = anime_requests.filter(filter_arg)
+        anime_requests = search_anime_requests(anime_requests, search_text)
+        ordering = "search_rank"
     if sort_style := request.GET.get("sort"):
         order_mapping = {
             "title": "anidb_entry__title",
@@ -142,24 +192,36 @@ def view_anime_requests(request: HttpRequest) -> HttpResponse:
         order_mapping.update(
             {f"-{key}": f"-{value}" for key, value in order_mapping.items()}
         )
-        anime_requests = anime_requests.order_by(
-            order_mapping.get(sort_style, "-request_date")
-        )
-    paginator = Paginator(anime_requests, MAX_ANIME_REQUESTS_PER_PAGE)
+        ordering = order_mapping.get(sort_style, ordering)
+    paginator = KeysetPaginator(
+        anime_requests.select_related("anidb_entry"),
+        MAX_ANIME_REQUESTS_PER_PAGE,
+        ordering=ordering,
+        # the SQL has the current time in it
+        count_key="anime_requests:"
+        + hashlib.md5((search_text or "").encode()).hexdigest(),
+    )
+    page = get_page(request, paginator)
+    prefetch_image_derivatives(
+        [anime_request.anidb_entry for anime_request in page.object_list],
+        "image",
+    )
     return render(
         request,
         "requests.html",
         context=dict(
             search_text=search_text,
             sort_style=sort_style,
-            page=paginator.page(get_page_number(request)),
+            page=page,
         ),
     )
 
 
 def view_anime_request(request: HttpRequest, request_id: int) -> HttpResponse:
     try:
-        anime_request = AnimeRequest.objects.with_counts().get(pk=request_id)
+        anime_request = AnimeRequest.objects.select_related("anidb_entry").get(
+            pk=request_id
+        )
     except AnimeRequest.DoesNotExist as exc:
         raise Http404("Anime request does not exist") from exc
     return render(
@@ -167,11 +229,8 @@ def view_anime_request(request: HttpRequest, request_id: int) -> HttpResponse:
         "request.html",
         context=dict(
             anime_request=anime_request,
-            comments=Comment.objects.filter(
-                parent_comment_id=None,
-                content_type=ContentType.objects.get(
-                    model=anime_request._meta.model_name  # pylint: disable=protected-access
-                ),
+            comments=Comment.objects.get_thread(
+                content_type=ContentType.objects.get_for_model(AnimeRequest),
                 object_id=anime_request.id,
             ),
         ),
@@ -184,14 +243,20 @@ def view_anime_request_add(request: HttpRequest) -> HttpResponse:
     anidb_id = get_anidb_link_id(anidb_url)
 
     errors: list[str] = []
+    title: Optional[str] = None
 
     if request.method == "POST":
         if request.POST.get("phone") or request.POST.get("message"):
             errors.append("Human verification failed.")
         if not anidb_url:
             errors.append("AniDB link cannot be empty.")
-        elif not is_valid_anidb_link(anidb_url):
+        elif not is_valid_anidb_link(anidb_url) or anidb_id is None:
             errors.append("The provided AniDB link appears to be invalid.")
+        # the title dump lists every anime; until it is imported, any ID goes
+        elif (
+            title := AniDBTitle.objects.get_main_title(anidb_id)
+        ) is None and AniDBTitle.objects.exists():
+            errors.append("There is no anime with this AniDB ID.")
         if not settings.REQUESTS_ENABLED and not is_preview:
             errors.append("Get a life…")
 
@@ -203,13 +268,14 @@ def view_anime_request_add(request: HttpRequest) -> HttpResponse:
         if not errors:
             anidb_entry = AniDBEntry.objects.create(
                 anidb_id=anidb_id,
+                title=title,
             )
-            anime_request = AnimeRequest.objects.create(
+            AnimeRequest.objects.create(
                 request_date=timezone.now(),
                 anidb_entry=anidb_entry,
                 remote_addr=get_client_ip(request),
             )
-            fill_missing_anidb_info.delay(anime_request.pk)
+            fill_missing_anidb_info.delay(anidb_id)
             return redirect("anime_requests")
 
     return render(
@@ -222,17 +288,50 @@ def view_anime_request_add(request: HttpRequest) -> HttpResponse:
     )
 
 
+def view_anime_titles(request: HttpRequest) -> HttpResponse:
+    prefix = normalize_title(request.GET.get("q", ""))
+    results = (
+        AniDBTitle.objects.search(prefix, MAX_ANIME_TITLE_SUGGESTIONS)
+        if len(prefix) >= MIN_ANIME_TITLE_QUERY_LENGTH
+        else []
+    )
+    for result in results:
+        result["url"] = f"https://anidb.net/anime/{result['anidb_id']}"
+    response = JsonResponse(results, safe=False)
+    # the titles change once a day at most
+    patch_cache_control(response, public=True, max_age=60 * 60)
+    return response
+
+
+def view_avatar(_request: HttpRequest, avatar_hash: str) -> HttpResponse:
+    content = get_stored_avatar(avatar_hash)
+    if content is None:
+        content = generate_avatar(avatar_hash).encode()
+        # anyone can make up hashes, so only those of commenters are stored
+        if Comment.objects.filter(avatar_hash=avatar_hash).exists():
+            store_avatar(avatar_hash, content)
+    response = HttpResponse(content, content_type="image/svg+xml")
+    # avatars are derived from their URL alone and never change
+    patch_cache_control(
+        response, public=True, max_age=365 * 24 * 60 * 60, immutable=True
+    )
+    return response
+
+
 def view_guest_book(request: HttpRequest) -> HttpResponse:
-    all_comment_count = Comment.objects.filter(content_type=None).count()
-    paginator = Paginator(
+    all_comment_count = Counter.objects.get_value(GUEST_BOOK_COMMENT_COUNTER)
+    paginator = KeysetPaginator(
         Comment.objects.filter(content_type=None, parent_comment_id=None),
         MAX_GUESTBOOK_COMMENTS_PER_PAGE,
+        ordering="-comment_date",
     )
+    page = get_page(request, paginator)
+    page.object_list = Comment.objects.load_replies(page.object_list)
     return render(
         request,
         "guest_book.html",
         context=dict(
-            page=paginator.page(get_page_number(request)),
+            page=page,
             all_comment_count=all_comment_count,
         ),
     )